@@ -6,16 +6,20 @@
 # Web: https://github.com/gboeing/osmnx
 ################################################################################
 
+from .cache import *
 from .core import *
 from .downloader import *
 from .elevation import *
 from .footprints import *
 from .geo_utils import *
+from .mapped_graph import *
+from .osm_arrays import *
 from .plot import *
 from .pois import *
 from .projection import *
 from .save_load import *
 from .simplify import *
+from .spatial_index import *
 from .stats import *
 from .utils import *
 
@@ -0,0 +1,565 @@
+################################################################################
+# Module: cache.py
+# Description: Pluggable storage backends for the HTTP response cache
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+import io
+import json
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from itertools import islice
+
+from . import settings
+from .utils import log
+
+
+# prefixes identifying how a cached payload was encoded
+COLUMNAR_MAGIC = b'OSMNX-COLUMNAR-1\n'
+JSON_MAGIC = b'OSMNX-JSON-1\n'
+
+# the keys an overpass node or way element may have to be stored column-wise
+COLUMNAR_NODE_KEYS = {'type', 'id', 'lat', 'lon', 'tags'}
+COLUMNAR_WAY_KEYS = {'type', 'id', 'nodes', 'tags'}
+
+
+def get_element_kind(element):
+    """
+    Determine whether an overpass element can be stored column-wise as a node
+    or a way, or must be stored as json.
+
+    Parameters
+    ----------
+    element : dict
+        an element of an overpass response
+
+    Returns
+    -------
+    string
+        'node', 'way' or 'other'
+    """
+    if type(element) is not dict:
+        return 'other'
+
+    # tags must be a dict of strings, if present at all
+    tags = element.get('tags')
+    if tags is not None and not (type(tags) is dict and
+                                 all(type(k) is str and type(v) is str for k, v in tags.items())):
+        return 'other'
+
+    element_type = element.get('type')
+    if (element_type == 'node' and element.keys() <= COLUMNAR_NODE_KEYS and type(element.get('id')) is int
+            and type(element.get('lat')) is float and type(element.get('lon')) is float):
+        return 'node'
+    elif (element_type == 'way' and element.keys() <= COLUMNAR_WAY_KEYS and type(element.get('id')) is int
+            and type(element.get('nodes')) is list and all(type(n) is int for n in element['nodes'])):
+        return 'way'
+    else:
+        return 'other'
+
+
+def encode_response(response_json):
+    """
+    Encode a response json object as compressed bytes to save in the cache.
+
+    Overpass responses are stored column-wise: node ids and coordinates, way
+    ids and node lists as numpy arrays, and all tag keys and values in a
+    single deduplicated string table. Any element that doesn't fit this
+    layout, and any other kind of response, is stored as compressed json.
+
+    Parameters
+    ----------
+    response_json : dict or list
+        the json response
+
+    Returns
+    -------
+    bytes
+    """
+    if not (isinstance(response_json, dict) and isinstance(response_json.get('elements'), list)):
+        return JSON_MAGIC + zlib.compress(json.dumps(response_json).encode('utf-8'))
+
+    # split the elements by kind, recording runs of the same kind so we can
+    # restore their original order when decoding
+    groups = {'node': [], 'way': [], 'other': []}
+    runs = []
+    for element in response_json['elements']:
+        kind = get_element_kind(element)
+        groups[kind].append(element)
+        if runs and runs[-1][0] == kind:
+            runs[-1][1] += 1
+        else:
+            runs.append([kind, 1])
+
+    strings = {}
+    arrays = {}
+
+    nodes = groups['node']
+    arrays['node_ids'] = np.array([e['id'] for e in nodes], dtype=np.int64)
+    arrays['node_lat'] = np.array([e['lat'] for e in nodes], dtype=np.float64)
+    arrays['node_lon'] = np.array([e['lon'] for e in nodes], dtype=np.float64)
+
+    ways = groups['way']
+    arrays['way_ids'] = np.array([e['id'] for e in ways], dtype=np.int64)
+    arrays['way_offsets'] = np.cumsum([0] + [len(e['nodes']) for e in ways], dtype=np.int64)
+    arrays['way_nodes'] = np.array([n for e in ways for n in e['nodes']], dtype=np.int64)
+
+    # store the tags of the elements that have them as alternating key, value
+    # indices into the string table
+    for kind, elements in [('node', nodes), ('way', ways)]:
+        tagged = [i for i, e in enumerate(elements) if 'tags' in e]
+        tag_offsets = [0]
+        tag_items = []
+        for i in tagged:
+            for key, value in elements[i]['tags'].items():
+                tag_items.append(strings.setdefault(key, len(strings)))
+                tag_items.append(strings.setdefault(value, len(strings)))
+            tag_offsets.append(len(tag_items))
+        arrays['{}_tagged'.format(kind)] = np.array(tagged, dtype=np.int64)
+        arrays['{}_tag_offsets'.format(kind)] = np.array(tag_offsets, dtype=np.int64)
+        arrays['{}_tag_items'.format(kind)] = np.array(tag_items, dtype=np.int64)
+
+    encoded_strings = [string.encode('utf-8') for string in strings]
+    arrays['strings'] = np.frombuffer(b''.join(encoded_strings), dtype=np.uint8)
+    arrays['string_offsets'] = np.cumsum([0] + [len(b) for b in encoded_strings], dtype=np.int64)
+
+    # everything else (response metadata, element order, other elements) is
+    # small enough to just be json
+    meta = {key: value for key, value in response_json.items() if key != 'elements'}
+    rest = json.dumps({'meta': meta, 'runs': runs, 'others': groups['other']})
+    arrays['rest'] = np.frombuffer(rest.encode('utf-8'), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return COLUMNAR_MAGIC + buffer.getvalue()
+
+
+def iter_columnar_elements(arrays, strings, kind):
+    """
+    Yield the node or way elements stored column-wise in a decoded payload,
+    building each element's dict only when it is requested.
+
+    Parameters
+    ----------
+    arrays : numpy NpzFile
+        the arrays of a payload written by encode_response
+    strings : list
+        the payload's string table
+    kind : string
+        {'node', 'way'} which elements to yield
+
+    Returns
+    -------
+    generator
+    """
+    if kind == 'node':
+        elements = ({'type':'node', 'id':i, 'lat':lat, 'lon':lon}
+                    for i, lat, lon in zip(arrays['node_ids'].tolist(),
+                                           arrays['node_lat'].tolist(),
+                                           arrays['node_lon'].tolist()))
+    else:
+        way_nodes = arrays['way_nodes'].tolist()
+        way_offsets = arrays['way_offsets'].tolist()
+        elements = ({'type':'way', 'id':i, 'nodes':way_nodes[start:end]}
+                    for i, start, end in zip(arrays['way_ids'].tolist(), way_offsets[:-1], way_offsets[1:]))
+
+    # attach the tags to the elements that have them as we go
+    tagged = arrays['{}_tagged'.format(kind)].tolist()
+    tag_offsets = arrays['{}_tag_offsets'.format(kind)].tolist()
+    tag_items = arrays['{}_tag_items'.format(kind)].tolist()
+    t = 0
+    next_tagged = tagged[0] if tagged else -1
+    for i, element in enumerate(elements):
+        if i == next_tagged:
+            items = [strings[item] for item in tag_items[tag_offsets[t]:tag_offsets[t+1]]]
+            element['tags'] = dict(zip(items[::2], items[1::2]))
+            t += 1
+            next_tagged = tagged[t] if t < len(tagged) else -1
+        yield element
+
+
+def decode_response(payload, stream=False):
+    """
+    Decode bytes saved in the cache back into a response json object.
+
+    Handles payloads written by encode_response as well as legacy payloads of
+    zlib-compressed json.
+
+    Parameters
+    ----------
+    payload : bytes
+        the cached bytes
+    stream : bool
+        if True and the payload is a columnar overpass response, the returned
+        response's elements are a generator that builds each element as it is
+        consumed, instead of a list
+
+    Returns
+    -------
+    response_json : dict or list
+    """
+    if payload.startswith(JSON_MAGIC):
+        return json.loads(zlib.decompress(payload[len(JSON_MAGIC):]).decode('utf-8'))
+    elif not payload.startswith(COLUMNAR_MAGIC):
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+    arrays = np.load(io.BytesIO(payload[len(COLUMNAR_MAGIC):]), allow_pickle=False)
+    buffer = arrays['strings'].tobytes()
+    string_offsets = arrays['string_offsets'].tolist()
+    strings = [buffer[i:j].decode('utf-8') for i, j in zip(string_offsets[:-1], string_offsets[1:])]
+    rest = json.loads(arrays['rest'].tobytes().decode('utf-8'))
+
+    if stream:
+        groups = {'node': iter_columnar_elements(arrays, strings, 'node'),
+                  'way': iter_columnar_elements(arrays, strings, 'way'),
+                  'other': iter(rest['others'])}
+    else:
+        # building the whole lists at once is much faster than consuming the
+        # generators, so do that if the caller wants them all anyway
+        nodes = [{'type':'node', 'id':i, 'lat':lat, 'lon':lon} for i, lat, lon in zip(arrays['node_ids'].tolist(),
+                                                                                      arrays['node_lat'].tolist(),
+                                                                                      arrays['node_lon'].tolist())]
+        way_nodes = arrays['way_nodes'].tolist()
+        way_offsets = arrays['way_offsets'].tolist()
+        ways = [{'type':'way', 'id':i, 'nodes':way_nodes[start:end]} for i, start, end in zip(arrays['way_ids'].tolist(),
+                                                                                              way_offsets[:-1],
+                                                                                              way_offsets[1:])]
+
+        for kind, elements in [('node', nodes), ('way', ways)]:
+            tag_items = [strings[i] for i in arrays['{}_tag_items'.format(kind)].tolist()]
+            tag_offsets = arrays['{}_tag_offsets'.format(kind)].tolist()
+            for i, start, end in zip(arrays['{}_tagged'.format(kind)].tolist(), tag_offsets[:-1], tag_offsets[1:]):
+                elements[i]['tags'] = dict(zip(tag_items[start:end:2], tag_items[start+1:end:2]))
+
+        groups = {'node': iter(nodes), 'way': iter(ways), 'other': iter(rest['others'])}
+
+    # interleave the elements of each kind back into their original order
+    if stream:
+        elements = (element for kind, count in rest['runs'] for element in islice(groups[kind], count))
+    else:
+        elements = []
+        for kind, count in rest['runs']:
+            elements.extend(islice(groups[kind], count))
+
+    response_json = rest['meta']
+    response_json['elements'] = elements
+    return response_json
+
+
+class CacheBackend(object):
+    """
+    Base class for HTTP response cache backends.
+
+    A backend maps keys (hashed request URLs) to response json objects. It
+    evicts the least recently used responses once the cache exceeds max_bytes
+    and treats responses older than ttl seconds as misses. It counts hits,
+    misses and evictions since it was created.
+
+    Subclasses implement _get, _set and _evict.
+    """
+
+    def __init__(self, folder, max_bytes=None, ttl=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, stream=False):
+        """
+        Retrieve a response json object from the cache.
+
+        Parameters
+        ----------
+        key : string
+            the cache key of the response
+        stream : bool
+            if True, an overpass response's elements may be a generator that
+            builds each element as it is consumed, instead of a list
+
+        Returns
+        -------
+        response_json : dict or list, or None if not in the cache
+        """
+        with self._lock:
+            response_json = self._get(key, stream)
+            if response_json is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response_json
+
+    def set(self, key, response_json):
+        """
+        Save a response json object to the cache, then evict the least
+        recently used responses if the cache exceeds max_bytes.
+
+        Parameters
+        ----------
+        key : string
+            the cache key of the response
+        response_json : dict or list
+            the json response
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._set(key, response_json)
+            if self.max_bytes is not None:
+                self.evictions += self._evict(self.max_bytes)
+
+    def stats(self):
+        """
+        Return the hit, miss and eviction counts of this cache.
+
+        Returns
+        -------
+        dict
+        """
+        return {'backend': self.__class__.__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def close(self):
+        """
+        Release any open resources of this cache, such as database
+        connections. The cache must not be used after closing it.
+
+        Returns
+        -------
+        None
+        """
+        pass
+
+    def is_expired(self, created):
+        """
+        Return True if a response saved at time created is older than the ttl.
+
+        Parameters
+        ----------
+        created : float
+            when the response was saved, in seconds since the epoch
+
+        Returns
+        -------
+        bool
+        """
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _get(self, key, stream):
+        raise NotImplementedError
+
+    def _set(self, key, response_json):
+        raise NotImplementedError
+
+    def _evict(self, max_bytes):
+        raise NotImplementedError
+
+
+class FileCache(CacheBackend):
+    """
+    Cache backend that saves each response as its own file in the cache
+    folder, named by its key and encoded by encode_response. Legacy
+    uncompressed json files in the folder are still read.
+
+    The file's modification time records when the response was saved, for
+    the ttl, and its access time records when it was last used, for
+    eviction. Eviction has to scan the whole folder: for large caches, prefer
+    SQLiteCache.
+    """
+
+    extensions = ('bin', 'json')
+
+    def get_filepath(self, key, extension='bin'):
+        return os.path.join(self.folder, os.extsep.join([key, extension]))
+
+    def _get(self, key, stream):
+        for extension in self.extensions:
+            cache_path_filename = self.get_filepath(key, extension)
+            try:
+                created = os.path.getmtime(cache_path_filename)
+                break
+            except OSError:
+                continue
+        else:
+            return None
+
+        if self.is_expired(created):
+            os.remove(cache_path_filename)
+            self.evictions += 1
+            return None
+
+        if extension == 'json':
+            with io.open(cache_path_filename, encoding='utf-8') as cache_file:
+                response_json = json.load(cache_file)
+        else:
+            with io.open(cache_path_filename, 'rb') as cache_file:
+                response_json = decode_response(cache_file.read(), stream=stream)
+
+        # touch the file's access time so eviction sees it as recently used,
+        # keeping its modification time as when it was saved
+        if self.max_bytes is not None:
+            os.utime(cache_path_filename, (time.time(), created))
+        log('Retrieved response from cache file "{}"'.format(cache_path_filename))
+        return response_json
+
+    def _set(self, key, response_json):
+        # create the folder on the disk if it doesn't already exist
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # encode the response and save it to file, replacing any legacy json
+        # file for the same key
+        cache_path_filename = self.get_filepath(key)
+        with io.open(cache_path_filename, 'wb') as cache_file:
+            cache_file.write(encode_response(response_json))
+        legacy_path_filename = self.get_filepath(key, 'json')
+        if os.path.exists(legacy_path_filename):
+            os.remove(legacy_path_filename)
+        log('Saved response to cache file "{}"'.format(cache_path_filename))
+
+    def _evict(self, max_bytes):
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.rsplit(os.extsep, 1)[-1] in self.extensions:
+                stat = entry.stat()
+                files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+
+        # remove the least recently used files until we are within budget
+        total_bytes = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in sorted(files):
+            if total_bytes <= max_bytes:
+                break
+            os.remove(path)
+            total_bytes -= size
+            evicted += 1
+
+        if evicted > 0:
+            log('Evicted {:,} responses from cache folder "{}"'.format(evicted, self.folder))
+        return evicted
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache backend that saves all responses, encoded by encode_response, in a
+    single SQLite database file in the cache folder, indexed by key and by
+    when each response was last used.
+    """
+
+    filename = 'cache.sqlite'
+
+    def __init__(self, folder, max_bytes=None, ttl=None):
+        super(SQLiteCache, self).__init__(folder, max_bytes=max_bytes, ttl=ttl)
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self.filepath = os.path.join(self.folder, self.filename)
+
+        # the lock serializes access, so threads can share the connection
+        self._connection = sqlite3.connect(self.filepath, timeout=60, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                 'key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                                 'created REAL, accessed REAL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _get(self, key, stream):
+        row = self._connection.execute('SELECT value, created FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, created = row
+        if self.is_expired(created):
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._connection.commit()
+            self.evictions += 1
+            return None
+
+        self._connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        self._connection.commit()
+        response_json = decode_response(bytes(value), stream=stream)
+        log('Retrieved response "{}" from cache database "{}"'.format(key, self.filepath))
+        return response_json
+
+    def _set(self, key, response_json):
+        value = encode_response(response_json)
+        now = time.time()
+        self._connection.execute('INSERT OR REPLACE INTO responses (key, value, size, created, accessed) '
+                                 'VALUES (?, ?, ?, ?, ?)', (key, sqlite3.Binary(value), len(value), now, now))
+        self._connection.commit()
+        log('Saved response "{}" to cache database "{}"'.format(key, self.filepath))
+
+    def _evict(self, max_bytes):
+        total_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_bytes <= max_bytes:
+            return 0
+
+        # remove the least recently used responses until we are within budget
+        keys = []
+        for key, size in self._connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if total_bytes <= max_bytes:
+                break
+            keys.append((key,))
+            total_bytes -= size
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+        self._connection.commit()
+
+        log('Evicted {:,} responses from cache database "{}"'.format(len(keys), self.filepath))
+        return len(keys)
+
+
+cache_backends = {'file': FileCache, 'sqlite': SQLiteCache}
+
+_cache = None
+_cache_config = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the cache backend configured in settings, creating it if it does
+    not exist yet or if the cache settings have changed since it was created.
+
+    Returns
+    -------
+    CacheBackend
+    """
+    global _cache, _cache_config
+
+    config = (settings.cache_backend, settings.cache_folder, settings.cache_max_bytes, settings.cache_ttl)
+    with _cache_lock:
+        if _cache is None or _cache_config != config:
+            if settings.cache_backend not in cache_backends:
+                raise ValueError('unknown cache_backend "{}", must be one of {}'.format(settings.cache_backend,
+                                                                                     sorted(cache_backends)))
+            backend = cache_backends[settings.cache_backend]
+            if _cache is not None:
+                _cache.close()
+            _cache = backend(settings.cache_folder, max_bytes=settings.cache_max_bytes, ttl=settings.cache_ttl)
+            _cache_config = config
+        return _cache
+
+
+def cache_stats():
+    """
+    Return the hit, miss and eviction counts of the current cache backend.
+
+    Returns
+    -------
+    dict
+    """
+    return get_cache().stats()
@@ -6,6 +6,7 @@
 # Web: https://github.com/gboeing/osmnx
 ################################################################################
 
+from collections.abc import Iterable
 import geopandas as gpd
 import logging as lg
 import math
@@ -13,7 +14,7 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 import time
-
+from concurrent.futures import ProcessPoolExecutor
 from itertools import groupby
 from shapely.geometry import LineString
 from shapely.geometry import MultiPolygon
@@ -27,6 +28,8 @@ from .projection import project_gdf
 from .simplify import simplify_graph
 from .utils import make_str, log
 from .geo_utils import get_largest_component
+from .geo_utils import induce_subgraph
+from .geo_utils import points_in_polygon
 from .utils import great_circle_vec
 from .geo_utils import get_nearest_node
 from .geo_utils import geocode
@@ -34,8 +37,10 @@ from .geo_utils import count_streets_per_node
 from .geo_utils import overpass_json_from_file
 from .downloader import osm_polygon_download
 from .downloader import get_osm_filter
-from .downloader import overpass_request
+from .downloader import overpass_requests
 from .errors import *
+from .osm_arrays import OSMArrays
+from .osm_arrays import osm_arrays_from_file
 
 def gdf_from_place(query, gdf_name=None, which_result=1, buffer_dist=None):
     """
@@ -155,7 +160,7 @@ def gdf_from_places(queries, gdf_name='unnamed', buffer_dist=None, which_results
 def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
                      network_type='all_private', timeout=180, memory=None,
                      max_query_area_size=50*1000*50*1000, infrastructure='way["highway"]',
-                     custom_filter=None):
+                     custom_filter=None, stream=False):
     """
     Download OSM ways and nodes within some bounding box from the Overpass API.
 
@@ -190,10 +195,16 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         grids, ie, 'way["power"~"line"]'
     custom_filter : string
         a custom network filter to be used instead of the network_type presets
+    stream : bool
+        if True, return a generator that requests each response only as it is
+        consumed, and whose responses' elements are parsed as they are
+        consumed (unless settings.overpass_max_workers is more than 1), so
+        create_graph can build a graph without all the downloaded data in
+        memory at once
 
     Returns
     -------
-    response_jsons : list
+    response_jsons : list, or generator if stream is True
     """
 
     # check if we're querying by polygon or by bounding box based on which
@@ -210,7 +221,6 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         osm_filter = custom_filter
     else:
         osm_filter = get_osm_filter(network_type)
-    response_jsons = []
 
     # pass server memory allocation in bytes for the query to the API
     # if None, pass nothing so the server will use its default allocation size
@@ -237,8 +247,9 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         log('Requesting network data within bounding box from API in {:,} request(s)'.format(len(geometry)))
         start_time = time.time()
 
-        # loop through each polygon rectangle in the geometry (there will only
-        # be one if original bbox didn't exceed max area size)
+        # build a query for each polygon rectangle in the geometry (there will
+        # only be one if original bbox didn't exceed max area size)
+        datas = []
         for poly in geometry:
             # represent bbox as south,west,north,east and round lat-longs to 6
             # decimal places (ie, ~100 mm) so URL strings aren't different
@@ -250,9 +261,14 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
                                               infrastructure=infrastructure,
                                               filters=osm_filter,
                                               timeout=timeout, maxsize=maxsize)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
-        log('Got all network data within bounding box from API in {:,} request(s) and {:,.2f} seconds'.format(len(geometry), time.time()-start_time))
+            datas.append({'data':query_str})
+
+        # send the queries to the API, concurrently if configured to. if
+        # streaming, the responses are only requested as they are consumed
+        response_jsons = overpass_requests(datas, timeout=timeout, stream=stream)
+        if not stream:
+            response_jsons = list(response_jsons)
+            log('Got all network data within bounding box from API in {:,} request(s) and {:,.2f} seconds'.format(len(geometry), time.time()-start_time))
 
     elif by_poly:
         # project to utm, divide polygon up into sub-polygons if area exceeds a
@@ -265,14 +281,17 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         log('Requesting network data within polygon from API in {:,} request(s)'.format(len(polygon_coord_strs)))
         start_time = time.time()
 
-        # pass each polygon exterior coordinates in the list to the API, one at
-        # a time
+        # build a query for each polygon exterior coordinates in the list, then
+        # pass them to the API, concurrently if configured to
+        datas = []
         for polygon_coord_str in polygon_coord_strs:
             query_template = '[out:json][timeout:{timeout}]{maxsize};({infrastructure}{filters}(poly:"{polygon}");>;);out;'
             query_str = query_template.format(polygon=polygon_coord_str, infrastructure=infrastructure, filters=osm_filter, timeout=timeout, maxsize=maxsize)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
-        log('Got all network data within polygon from API in {:,} request(s) and {:,.2f} seconds'.format(len(polygon_coord_strs), time.time()-start_time))
+            datas.append({'data':query_str})
+        response_jsons = overpass_requests(datas, timeout=timeout, stream=stream)
+        if not stream:
+            response_jsons = list(response_jsons)
+            log('Got all network data within polygon from API in {:,} request(s) and {:,.2f} seconds'.format(len(polygon_coord_strs), time.time()-start_time))
 
     return response_jsons
 
@@ -461,17 +480,23 @@ def remove_isolated_nodes(G):
     return G
 
 
-def truncate_graph_dist(G, source_node, max_distance=1000, weight='length', retain_all=False):
+def truncate_graph_dist(G, source_node, max_distance=1000, weight='length', retain_all=False, inplace=False):
     """
     Remove everything further than some network distance from a specified node
-    in graph.
+    (or from the nearest of several nodes) in graph.
+
+    The search is a Dijkstra search bounded by max_distance, so it stops
+    expanding once every node within max_distance has been reached rather than
+    measuring the distance to every reachable node in the graph.
 
     Parameters
     ----------
     G : networkx multidigraph
-    source_node : int
+    source_node : int or list
         the node in the graph from which to measure network distances to other
-        nodes
+        nodes, or a list of such nodes to truncate to everything within
+        max_distance of any of them. raises networkx.NodeNotFound if any of
+        them is not in the graph
     max_distance : int
         remove every node in the graph greater than this distance from the
         source_node
@@ -481,30 +506,75 @@ def truncate_graph_dist(G, source_node, max_distance=1000, weight='length', reta
     retain_all : bool
         if True, return the entire graph even if it is not connected
 
+    inplace : bool
+        if True, remove the nodes outside the distance from G itself and return
+        it, instead of building a new graph, so only one graph is ever held in
+        memory
+
     Returns
     -------
     networkx multidigraph
     """
 
-    # get the shortest distance between the node and every other node, then
-    # remove every node further than max_distance away
+    # find every node within max_distance of the nearest source node, then
+    # induce the subgraph of those nodes
     start_time = time.time()
-    G = G.copy()
-    distances = nx.shortest_path_length(G, source=source_node, weight=weight)
-    distant_nodes = {key:value for key, value in dict(distances).items() if value > max_distance}
-    G.remove_nodes_from(distant_nodes.keys())
-    log('Truncated graph by weighted network distance in {:,.2f} seconds'.format(time.time()-start_time))
+    try:
+        is_node = source_node in G
+    except TypeError:
+        # unhashable, so it must be a list of source nodes
+        is_node = False
+    if is_node:
+        sources = [source_node]
+    elif isinstance(source_node, Iterable) and not isinstance(source_node, str):
+        sources = list(source_node)
+    else:
+        raise nx.NodeNotFound('source_node {} not found in graph'.format(source_node))
+    for node in sources:
+        if node not in G:
+            raise nx.NodeNotFound('source_node {} not found in graph'.format(node))
+    distances = nx.multi_source_dijkstra_path_length(G, sources, cutoff=max_distance, weight=weight)
+    G = induce_subgraph(G, distances.keys(), inplace=inplace)
+    log('Truncated graph by weighted network distance from {:,} source nodes in {:,.2f} seconds'.format(len(sources), time.time()-start_time))
 
     # remove any isolated nodes and retain only the largest component (if
     # retain_all is True)
     if not retain_all:
         G = remove_isolated_nodes(G)
-        G = get_largest_component(G)
+        G = get_largest_component(G, inplace=True)
 
     return G
 
 
-def truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=False, retain_all=False):
+def any_neighbors_inside(G, nodes, inside):
+    """
+    Determine which nodes have any neighbor (successor or predecessor) inside
+    some area, in one vectorized pass over arrays of the edges' endpoints.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    nodes : list
+        the graph's nodes, in the order of inside
+    inside : numpy array
+        boolean mask of the nodes inside the area
+
+    Returns
+    -------
+    numpy array
+        boolean mask of the nodes with any neighbor inside the area
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in G.edges()], dtype=np.int64).reshape(-1, 2)
+    u = edges[:, 0]
+    v = edges[:, 1]
+    neighbors_inside = np.zeros(len(nodes), dtype=bool)
+    neighbors_inside[u[inside[v]]] = True
+    neighbors_inside[v[inside[u]]] = True
+    return neighbors_inside
+
+
+def truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=False, retain_all=False, inplace=False):
     """
     Remove every node in graph that falls outside a bounding box.
 
@@ -529,47 +599,39 @@ def truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=False, ret
     retain_all : bool
         if True, return the entire graph even if it is not connected
 
+    inplace : bool
+        if True, remove the nodes outside the bbox from G itself and return
+        it, instead of building a new graph, so only one graph is ever held in
+        memory
+
     Returns
     -------
     networkx multidigraph
     """
 
     start_time = time.time()
-    G = G.copy()
-    nodes_outside_bbox = []
-
-    for node, data in G.nodes(data=True):
-        if data['y'] > north or data['y'] < south or data['x'] > east or data['x'] < west:
-            # this node is outside the bounding box
-            if not truncate_by_edge:
-                # if we're not truncating by edge, add node to list of nodes
-                # outside the bounding box
-                nodes_outside_bbox.append(node)
-            else:
-                # if we're truncating by edge, see if any of node's neighbors
-                # are within bounding box
-                any_neighbors_in_bbox = False
-                neighbors = list(G.successors(node)) + list(G.predecessors(node))
-                for neighbor in neighbors:
-                    x = G.nodes[neighbor]['x']
-                    y = G.nodes[neighbor]['y']
-                    if y < north and y > south and x < east and x > west:
-                        any_neighbors_in_bbox = True
-                        break
-
-                # if none of its neighbors are within the bounding box, add node
-                # to list of nodes outside the bounding box
-                if not any_neighbors_in_bbox:
-                    nodes_outside_bbox.append(node)
-
-    G.remove_nodes_from(nodes_outside_bbox)
+    nodes = list(G.nodes())
+    y = np.array([data['y'] for _, data in G.nodes(data=True)], dtype=float)
+    x = np.array([data['x'] for _, data in G.nodes(data=True)], dtype=float)
+
+    # keep every node not outside the bounding box
+    inside_bbox = ~((y > north) | (y < south) | (x > east) | (x < west))
+
+    if truncate_by_edge:
+        # if we're truncating by edge, also keep the nodes outside the
+        # bounding box with any neighbor (successor or predecessor) strictly
+        # within it
+        neighbor_in_bbox = (y < north) & (y > south) & (x < east) & (x > west)
+        inside_bbox |= any_neighbors_inside(G, nodes, neighbor_in_bbox)
+
+    G = induce_subgraph(G, [node for node, inside in zip(nodes, inside_bbox.tolist()) if inside], inplace=inplace)
     log('Truncated graph by bounding box in {:,.2f} seconds'.format(time.time()-start_time))
 
     # remove any isolated nodes and retain only the largest component (if
     # retain_all is True)
     if not retain_all:
         G = remove_isolated_nodes(G)
-        G = get_largest_component(G)
+        G = get_largest_component(G, inplace=True)
 
     return G
 
@@ -688,7 +750,8 @@ def intersect_index_quadrats(gdf, geometry, quadrat_width=0.05, min_num=3, buffe
     return points_within_geometry
 
 
-def truncate_graph_polygon(G, polygon, retain_all=False, truncate_by_edge=False, quadrat_width=0.05, min_num=3, buffer_amount=1e-9):
+def truncate_graph_polygon(G, polygon, retain_all=False, truncate_by_edge=False, quadrat_width=0.05, min_num=3,
+                           buffer_amount=1e-9, chunk_size=None, max_workers=None, inplace=False):
     """
     Remove every node in graph that falls outside some shapely Polygon or
     MultiPolygon.
@@ -702,18 +765,25 @@ def truncate_graph_polygon(G, polygon, retain_all=False, truncate_by_edge=False,
         if True, return the entire graph even if it is not connected
     truncate_by_edge : bool
         if True retain node if it's outside polygon but at least one of node's
-        neighbors are within polygon (NOT CURRENTLY IMPLEMENTED)
+        neighbors are within polygon
     quadrat_width : numeric
-        passed on to intersect_index_quadrats: the linear length (in degrees) of
-        the quadrats with which to cut up the geometry (default = 0.05, approx
-        4km at NYC's latitude)
+        no longer used: the polygon is tested whole as a prepared geometry
+        instead of being cut into quadrats for intersect_index_quadrats
     min_num : int
-        passed on to intersect_index_quadrats: the minimum number of linear
-        quadrat lines (e.g., min_num=3 would produce a quadrat grid of 4
-        squares)
+        no longer used, see quadrat_width
     buffer_amount : numeric
-        passed on to intersect_index_quadrats: buffer the quadrat grid lines by
-        quadrat_width times buffer_amount
+        no longer used, see quadrat_width
+    chunk_size : int
+        if not None, test the nodes against the polygon in chunks of this
+        many in parallel, see points_in_polygon
+    max_workers : int
+        max number of worker processes when chunk_size is given, if None use
+        the number of processors
+
+    inplace : bool
+        if True, remove the nodes outside the polygon from G itself and return
+        it, instead of building a new graph, so only one graph is ever held in
+        memory
 
     Returns
     -------
@@ -721,28 +791,35 @@ def truncate_graph_polygon(G, polygon, retain_all=False, truncate_by_edge=False,
     """
 
     start_time = time.time()
-    G = G.copy()
     log('Identifying all nodes that lie outside the polygon...')
 
-    # get a GeoDataFrame of all the nodes, for spatial analysis
-    node_geom = [Point(data['x'], data['y']) for _, data in G.nodes(data=True)]
-    gdf_nodes = gpd.GeoDataFrame({'node':pd.Series(G.nodes()), 'geometry':node_geom})
-    gdf_nodes.crs = G.graph['crs']
+    # test all the nodes' coordinates against the polygon at once
+    nodes = list(G.nodes())
+    x = np.array([data['x'] for _, data in G.nodes(data=True)], dtype=float)
+    y = np.array([data['y'] for _, data in G.nodes(data=True)], dtype=float)
+    inside_polygon = points_in_polygon(x, y, polygon, chunk_size=chunk_size, max_workers=max_workers)
+
+    if not inside_polygon.any():
+        # after simplifying the graph, and given the requested network type,
+        # there are no nodes inside the polygon - can't create graph from that
+        # so throw error
+        raise Exception('There are no nodes within the requested geometry')
+    log('Identified {:,} nodes inside polygon in {:,.2f} seconds'.format(inside_polygon.sum(), time.time()-start_time))
 
-    # find all the nodes in the graph that lie outside the polygon
-    points_within_geometry = intersect_index_quadrats(gdf_nodes, polygon, quadrat_width=quadrat_width, min_num=min_num, buffer_amount=buffer_amount)
-    nodes_outside_polygon = gdf_nodes[~gdf_nodes.index.isin(points_within_geometry.index)]
+    if truncate_by_edge:
+        # if we're truncating by edge, also keep the nodes outside the polygon
+        # with any neighbor inside it
+        inside_polygon = inside_polygon | any_neighbors_inside(G, nodes, inside_polygon)
 
-    # now remove from the graph all those nodes that lie outside the place
-    # polygon
+    # keep only the nodes inside the polygon
     start_time = time.time()
-    G.remove_nodes_from(nodes_outside_polygon['node'])
-    log('Removed {:,} nodes outside polygon in {:,.2f} seconds'.format(len(nodes_outside_polygon), time.time()-start_time))
+    G = induce_subgraph(G, [node for node, inside in zip(nodes, inside_polygon.tolist()) if inside], inplace=inplace)
+    log('Removed {:,} nodes outside polygon in {:,.2f} seconds'.format(len(nodes) - len(G), time.time()-start_time))
 
     # remove any isolated nodes and retain only the largest component (if retain_all is False)
     if not retain_all:
         G = remove_isolated_nodes(G)
-        G = get_largest_component(G)
+        G = get_largest_component(G, inplace=True)
 
     return G
 
@@ -763,22 +840,20 @@ def add_edge_lengths(G):
 
     start_time = time.time()
 
-    # first load all the edges' origin and destination coordinates as a
-    # dataframe indexed by u, v, key
-    coords = np.array([[u, v, k, G.nodes[u]['y'], G.nodes[u]['x'], G.nodes[v]['y'], G.nodes[v]['x']] for u, v, k in G.edges(keys=True)])
-    df_coords = pd.DataFrame(coords, columns=['u', 'v', 'k', 'u_y', 'u_x', 'v_y', 'v_x'])
-    df_coords[['u', 'v', 'k']] = df_coords[['u', 'v', 'k']].astype(np.int64)
-    df_coords = df_coords.set_index(['u', 'v', 'k'])
+    # first load all the edges' origin and destination coordinates as arrays
+    coords = np.array([(G.nodes[u]['y'], G.nodes[u]['x'], G.nodes[v]['y'], G.nodes[v]['x']) for u, v in G.edges()])
+    coords = coords.reshape(-1, 4)
 
     # then calculate the great circle distance with the vectorized function
-    gc_distances = great_circle_vec(lat1=df_coords['u_y'],
-                                    lng1=df_coords['u_x'],
-                                    lat2=df_coords['v_y'],
-                                    lng2=df_coords['v_x'])
+    gc_distances = great_circle_vec(lat1=coords[:, 0],
+                                    lng1=coords[:, 1],
+                                    lat2=coords[:, 2],
+                                    lng2=coords[:, 3])
 
     # fill nulls with zeros and round to the millimeter
-    gc_distances = gc_distances.fillna(value=0).round(3)
-    nx.set_edge_attributes(G, name='length', values=gc_distances.to_dict())
+    gc_distances = np.round(np.nan_to_num(gc_distances, nan=0), 3)
+    for (u, v, data), length in zip(G.edges(data=True), gc_distances.tolist()):
+        data['length'] = length
 
     log('Added edge lengths to graph in {:,.2f} seconds'.format(time.time()-start_time))
     return G
@@ -883,8 +958,10 @@ def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional
 
     Parameters
     ----------
-    response_jsons : list
-        list of dicts of JSON responses from from the Overpass API
+    response_jsons : iterable
+        list (or other iterable, like the generator returned by
+        overpass_requests) of dicts of JSON responses from from the Overpass
+        API, whose elements may also be any iterable
     name : string
         the name of the graph
     retain_all : bool
@@ -900,44 +977,54 @@ def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional
     log('Creating networkx graph from downloaded OSM data...')
     start_time = time.time()
 
-    # make sure we got data back from the server requests
-    elements = []
-    for response_json in response_jsons:
-        elements.extend(response_json['elements'])
-    if len(elements) < 1:
-        raise EmptyOverpassResponse('There are no data elements in the response JSON objects')
+    # collect the nodes and ways into flat arrays one element at a time, so
+    # the responses and their elements can be consumed from generators as
+    # they arrive from the server, without ever holding all the downloaded
+    # data in memory at once
+    osm_arrays = OSMArrays()
+    for osm_data in response_jsons:
+        for element in osm_data['elements']:
+            osm_arrays.add_element(element)
 
-    # create the graph as a MultiDiGraph and set the original CRS to default_crs
-    G = nx.MultiDiGraph(name=name, crs=settings.default_crs)
+    G = create_graph_from_arrays(osm_arrays, name=name, retain_all=retain_all, bidirectional=bidirectional)
 
-    # extract nodes and paths from the downloaded osm data
-    nodes = {}
-    paths = {}
-    for osm_data in response_jsons:
-        nodes_temp, paths_temp = parse_osm_nodes_paths(osm_data)
-        for key, value in nodes_temp.items():
-            nodes[key] = value
-        for key, value in paths_temp.items():
-            paths[key] = value
+    log('Created graph with {:,} nodes and {:,} edges in {:,.2f} seconds'.format(len(G), G.number_of_edges(), time.time()-start_time))
+    return G
 
-    # add each osm node to the graph
-    for node, data in nodes.items():
-        G.add_node(node, **data)
 
-    # add each osm way (aka, path) to the graph
-    G = add_paths(G, paths, bidirectional=bidirectional)
+def create_graph_from_arrays(osm_arrays, name='unnamed', retain_all=False, bidirectional=False):
+    """
+    Create a networkx graph from OSM nodes and ways collected in flat arrays.
+
+    Parameters
+    ----------
+    osm_arrays : OSMArrays
+        the nodes and ways
+    name : string
+        the name of the graph
+    retain_all : bool
+        if True, return the entire graph even if it is not connected
+    bidirectional : bool
+        if True, create bidirectional edges for one-way streets
+
+    Returns
+    -------
+    networkx multidigraph
+    """
+
+    # make sure we got data back from the server requests
+    if len(osm_arrays) < 1:
+        raise EmptyOverpassResponse('There are no data elements in the response JSON objects')
+
+    # create the graph as a MultiDiGraph and set the original CRS to
+    # default_crs, with all the nodes and edges (including their lengths)
+    # added in bulk
+    G = osm_arrays.build_graph(name=name, bidirectional=bidirectional)
 
     # retain only the largest connected component, if caller did not
     # set retain_all=True
     if not retain_all:
-        G = get_largest_component(G)
-
-    log('Created graph with {:,} nodes and {:,} edges in {:,.2f} seconds'.format(len(list(G.nodes())), len(list(G.edges())), time.time()-start_time))
-
-    # add length (great circle distance between nodes) attribute to each edge to
-    # use as weight
-    if len(G.edges) > 0:
-        G = add_edge_lengths(G)
+        G = get_largest_component(G, inplace=True)
 
     return G
 
@@ -1052,13 +1139,13 @@ def graph_from_bbox(north, south, east, west, network_type='all_private',
                                           east=east_buffered, west=west_buffered,
                                           network_type=network_type, timeout=timeout,
                                           memory=memory, max_query_area_size=max_query_area_size,
-                                          infrastructure=infrastructure, custom_filter=custom_filter)
+                                          infrastructure=infrastructure, custom_filter=custom_filter,
+                                          stream=True)
         G_buffered = create_graph(response_jsons, name=name, retain_all=retain_all,
                                   bidirectional=network_type in settings.bidirectional_network_types)
-        G = truncate_graph_bbox(G_buffered, north, south, east, west, retain_all=True, truncate_by_edge=truncate_by_edge)
 
         # simplify the graph topology
-        G_buffered = simplify_graph(G_buffered)
+        G_buffered = simplify_graph(G_buffered, inplace=True)
 
         # truncate graph by desired bbox to return the graph within the bbox
         # caller wants
@@ -1075,19 +1162,21 @@ def graph_from_bbox(north, south, east, west, network_type='all_private',
                                           west=west, network_type=network_type,
                                           timeout=timeout, memory=memory,
                                           max_query_area_size=max_query_area_size,
-                                          infrastructure=infrastructure, custom_filter=custom_filter)
+                                          infrastructure=infrastructure, custom_filter=custom_filter,
+                                          stream=True)
 
         # create the graph, then truncate to the bounding box
         G = create_graph(response_jsons, name=name, retain_all=retain_all,
                          bidirectional=network_type in settings.bidirectional_network_types)
-        G = truncate_graph_bbox(G, north, south, east, west, retain_all=retain_all, truncate_by_edge=truncate_by_edge)
+        G = truncate_graph_bbox(G, north, south, east, west, retain_all=retain_all,
+                                truncate_by_edge=truncate_by_edge, inplace=True)
 
         # simplify the graph topology as the last step. don't truncate after
         # simplifying or you may have simplified out to an endpoint
         # beyond the truncation distance, in which case you will then strip out
         # your entire edge
         if simplify:
-            G = simplify_graph(G)
+            G = simplify_graph(G, inplace=True)
 
     log('graph_from_bbox() returning graph with {:,} nodes and {:,} edges'.format(len(list(G.nodes())), len(list(G.edges()))))
     return  G
@@ -1166,7 +1255,7 @@ def graph_from_point(center_point, distance=1000, distance_type='bbox',
     # from this node
     if distance_type == 'network':
         centermost_node = get_nearest_node(G, center_point)
-        G = truncate_graph_dist(G, centermost_node, max_distance=distance)
+        G = truncate_graph_dist(G, centermost_node, max_distance=distance, inplace=True)
 
     log('graph_from_point() returning graph with {:,} nodes and {:,} edges'.format(len(list(G.nodes())), len(list(G.edges()))))
     return G
@@ -1320,13 +1409,15 @@ def graph_from_polygon(polygon, network_type='all_private', simplify=True,
         response_jsons = osm_net_download(polygon=polygon_buffered, network_type=network_type,
                                           timeout=timeout, memory=memory,
                                           max_query_area_size=max_query_area_size,
-                                          infrastructure=infrastructure, custom_filter=custom_filter)
+                                          infrastructure=infrastructure, custom_filter=custom_filter,
+                                          stream=True)
         G_buffered = create_graph(response_jsons, name=name, retain_all=True,
                                   bidirectional=network_type in settings.bidirectional_network_types)
-        G_buffered = truncate_graph_polygon(G_buffered, polygon_buffered, retain_all=True, truncate_by_edge=truncate_by_edge)
+        G_buffered = truncate_graph_polygon(G_buffered, polygon_buffered, retain_all=True,
+                                            truncate_by_edge=truncate_by_edge, inplace=True)
 
         # simplify the graph topology
-        G_buffered = simplify_graph(G_buffered)
+        G_buffered = simplify_graph(G_buffered, inplace=True)
 
         # truncate graph by polygon to return the graph within the polygon that
         # caller wants. don't simplify again - this allows us to retain
@@ -1341,25 +1432,27 @@ def graph_from_polygon(polygon, network_type='all_private', simplify=True,
         G.graph['streets_per_node'] = count_streets_per_node(G_buffered, nodes=G.nodes())
 
     else:
-        # download a list of API responses for the polygon/multipolygon
+        # download the API responses for the polygon/multipolygon
         response_jsons = osm_net_download(polygon=polygon, network_type=network_type,
                                           timeout=timeout, memory=memory,
                                           max_query_area_size=max_query_area_size,
-                                          infrastructure=infrastructure, custom_filter=custom_filter)
+                                          infrastructure=infrastructure, custom_filter=custom_filter,
+                                          stream=True)
 
         # create the graph from the downloaded data
         G = create_graph(response_jsons, name=name, retain_all=True,
                          bidirectional=network_type in settings.bidirectional_network_types)
 
         # truncate the graph to the extent of the polygon
-        G = truncate_graph_polygon(G, polygon, retain_all=retain_all, truncate_by_edge=truncate_by_edge)
+        G = truncate_graph_polygon(G, polygon, retain_all=retain_all, truncate_by_edge=truncate_by_edge,
+                                   inplace=True)
 
         # simplify the graph topology as the last step. don't truncate after
         # simplifying or you may have simplified out to an endpoint beyond the
         # truncation distance, in which case you will then strip out your entire
         # edge
         if simplify:
-            G = simplify_graph(G)
+            G = simplify_graph(G, inplace=True)
 
     log('graph_from_polygon() returning graph with {:,} nodes and {:,} edges'.format(len(list(G.nodes())), len(list(G.edges()))))
     return G
@@ -1454,14 +1547,17 @@ def graph_from_place(query, network_type='all_private', simplify=True,
 
 
 def graph_from_file(filename, bidirectional=False, simplify=True,
-                    retain_all=False, name='unnamed'):
+                    retain_all=False, name='unnamed', parser='iterparse',
+                    network_type=None, infrastructure='way["highway"]',
+                    custom_filter=None):
     """
     Create a networkx graph from OSM data in an XML file.
 
     Parameters
     ----------
     filename : string
-        the name of a file containing OSM XML data
+        the name of a file containing OSM XML data, optionally compressed as
+        .bz2 or .gz
     bidirectional : bool
         if True, create bidirectional edges for one-way streets
     simplify : bool
@@ -1470,21 +1566,130 @@ def graph_from_file(filename, bidirectional=False, simplify=True,
         if True, return the entire graph even if it is not connected
     name : string
         the name of the graph
+    parser : string
+        {'iterparse', 'sax'} read the file incrementally straight into flat
+        node and way arrays with osm_arrays_from_file, or into Overpass-like
+        JSON with overpass_json_from_file. both give the same graph
+    network_type : string
+        if not None, keep only the ways of this type of street network, as
+        the Overpass API would: {'walk', 'bike', 'drive', 'drive_service',
+        'all', 'all_private', 'none'}
+    infrastructure : string
+        the type of infrastructure to keep when filtering by network_type or
+        custom_filter. default is streets, ie, 'way["highway"]'
+    custom_filter : string
+        a custom network filter to keep only the ways that pass it, used
+        instead of the network_type filter
 
     Returns
     -------
     networkx multidigraph
     """
-    # transmogrify file of OSM XML data into JSON
-    response_jsons = [overpass_json_from_file(filename)]
+    # filter the ways while reading the file, like osm_net_download has the
+    # Overpass API do
+    osm_filter = None
+    if custom_filter:
+        osm_filter = infrastructure + custom_filter
+    elif network_type is not None:
+        osm_filter = infrastructure + get_osm_filter(network_type)
 
-    # create graph using this response JSON
-    G = create_graph(response_jsons, bidirectional=bidirectional,
-                     retain_all=retain_all, name=name)
+    if parser == 'iterparse':
+        start_time = time.time()
+        osm_arrays = osm_arrays_from_file(filename, osm_filter=osm_filter)
+        log('Read {:,} OSM elements from "{}" in {:,.2f} seconds'.format(len(osm_arrays), filename, time.time()-start_time))
+        G = create_graph_from_arrays(osm_arrays, bidirectional=bidirectional,
+                                     retain_all=retain_all, name=name)
+    elif parser == 'sax':
+        # transmogrify file of OSM XML data into JSON
+        response_jsons = [overpass_json_from_file(filename, useful_tags_node=settings.useful_tags_node,
+                                                  useful_tags_path=settings.useful_tags_path,
+                                                  osm_filter=osm_filter)]
+
+        # create graph using this response JSON
+        G = create_graph(response_jsons, bidirectional=bidirectional,
+                         retain_all=retain_all, name=name)
+    else:
+        raise ValueError('parser must be "iterparse" or "sax"')
 
     # simplify the graph topology as the last step.
     if simplify:
-        G = simplify_graph(G)
+        G = simplify_graph(G, inplace=True)
 
     log('graph_from_file() returning graph with {:,} nodes and {:,} edges'.format(len(list(G.nodes())), len(list(G.edges()))))
     return G
+
+
+def graph_from_files(filenames, bidirectional=False, simplify=True,
+                     retain_all=False, name='unnamed', network_type=None,
+                     infrastructure='way["highway"]', custom_filter=None,
+                     max_workers=None):
+    """
+    Create a networkx graph from OSM data split across several XML files,
+    such as the tiles of a regional extract.
+
+    The files are parsed in parallel in a pool of worker processes, then
+    their nodes and ways are merged in the order of filenames. Nodes and ways
+    repeated across files, like those on shared tile boundaries, are
+    deduplicated by OSM id with the same semantics as create_graph given one
+    response per file.
+
+    Parameters
+    ----------
+    filenames : list
+        the names of files containing OSM XML data, optionally compressed as
+        .bz2 or .gz
+    bidirectional : bool
+        if True, create bidirectional edges for one-way streets
+    simplify : bool
+        if True, simplify the graph topology
+    retain_all : bool
+        if True, return the entire graph even if it is not connected
+    name : string
+        the name of the graph
+    network_type : string
+        if not None, keep only the ways of this type of street network, as
+        the Overpass API would: {'walk', 'bike', 'drive', 'drive_service',
+        'all', 'all_private', 'none'}
+    infrastructure : string
+        the type of infrastructure to keep when filtering by network_type or
+        custom_filter. default is streets, ie, 'way["highway"]'
+    custom_filter : string
+        a custom network filter to keep only the ways that pass it, used
+        instead of the network_type filter
+    max_workers : int
+        max number of worker processes, if None use the number of processors
+
+    Returns
+    -------
+    networkx multidigraph
+    """
+    osm_filter = None
+    if custom_filter:
+        osm_filter = infrastructure + custom_filter
+    elif network_type is not None:
+        osm_filter = infrastructure + get_osm_filter(network_type)
+
+    # parse the files in parallel, keeping every node until all the files'
+    # ways are known. pass the useful tags to the workers explicitly, as
+    # workers started by spawn do not see settings changed by config
+    start_time = time.time()
+    osm_arrays = OSMArrays()
+    count = len(filenames)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for file_arrays in executor.map(osm_arrays_from_file, filenames, [osm_filter] * count, [False] * count,
+                                        [osm_arrays.useful_tags_node] * count,
+                                        [osm_arrays.useful_tags_path] * count):
+            osm_arrays.extend(file_arrays)
+    if osm_filter is not None:
+        osm_arrays.remove_unused_nodes()
+    log('Read {:,} OSM elements from {:,} files in {:,.2f} seconds'.format(len(osm_arrays), count, time.time()-start_time))
+
+    G = create_graph_from_arrays(osm_arrays, bidirectional=bidirectional,
+                                 retain_all=retain_all, name=name)
+
+    # simplify the graph topology as the last step.
+    if simplify:
+        G = simplify_graph(G, inplace=True)
+
+    log('graph_from_files() returning graph with {:,} nodes and {:,} edges'.format(len(G), G.number_of_edges()))
+    return G
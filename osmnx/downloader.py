@@ -1,17 +1,20 @@
 from collections import OrderedDict
-import io
-import json
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import math
 import requests
+import threading
 import time
 import re
 import datetime as dt
-import os
 import logging as lg
 from dateutil import parser as date_parser
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .cache import get_cache
 from .errors import *
-from .utils import make_str, log
+from .utils import iter_json_elements
+from .utils import log
 
 from . import settings
 
@@ -84,9 +87,68 @@ def get_osm_filter(network_type):
     return osm_filter
 
 
+def parse_osm_filter(osm_filter):
+    """
+    Parse an Overpass QL tag filter, like the ones get_osm_filter returns,
+    into a function that tests whether an element's tags pass it, for
+    filtering OSM data read from a file the way the Overpass API would.
+
+    The filter is a sequence of clauses like ["key"], [!"key"],
+    ["key"="value"], ["key"!="value"], ["key"~"regex"] or ["key"!~"regex"],
+    with an optional ,i after a regex to match it case-insensitively. It may
+    start with an element type, as in the infrastructure argument of
+    osm_net_download, for example 'way["highway"]'.
+
+    Parameters
+    ----------
+    osm_filter : string
+        the Overpass QL filter
+
+    Returns
+    -------
+    function
+        takes a dict of tags, returns True if they pass every clause
+    """
+    clause_pattern = re.compile(r'\[\s*(!?)\s*"?([^"\]!=~]+?)"?\s*'
+                                r'(?:(!?[=~])\s*"([^"]*)"\s*(,\s*i)?\s*)?\]')
+    remainder = re.sub(r'^\s*(node|way|relation|nwr)?', '', osm_filter)
+
+    clauses = []
+    position = 0
+    while position < len(remainder):
+        match = clause_pattern.match(remainder, position)
+        if match is None:
+            raise ValueError('cannot parse OSM filter "{}" at "{}"'.format(osm_filter, remainder[position:]))
+        absent, key, operator, value, ignore_case = match.groups()
+        if operator and '~' in operator:
+            value = re.compile(value, re.IGNORECASE if ignore_case else 0)
+        clauses.append((absent == '!', key, operator, value))
+        position = match.end()
+
+    def osm_filter_function(tags):
+        for absent, key, operator, value in clauses:
+            tag_value = tags.get(key)
+            if operator is None:
+                passes = (tag_value is None) if absent else (tag_value is not None)
+            elif operator == '=':
+                passes = tag_value == value
+            elif operator == '!=':
+                passes = tag_value != value
+            elif operator == '~':
+                passes = tag_value is not None and value.search(tag_value) is not None
+            else:
+                passes = tag_value is None or value.search(tag_value) is None
+            if not passes:
+                return False
+        return True
+
+    return osm_filter_function
+
+
 def save_to_cache(url, response_json):
     """
-    Save an HTTP response json object to the cache.
+    Save an HTTP response json object to the cache backend configured in
+    settings.cache_backend.
 
     If the request was sent to server via POST instead of GET, then URL should
     be a GET-style representation of request. Users should always pass
@@ -111,31 +173,24 @@ def save_to_cache(url, response_json):
         if response_json is None:
             log('Saved nothing to cache because response_json is None')
         else:
-            # create the folder on the disk if it doesn't already exist
-            if not os.path.exists(settings.cache_folder):
-                os.makedirs(settings.cache_folder)
-
-            # hash the url (to make filename shorter than the often extremely
-            # long url)
-            filename = hashlib.md5(url.encode('utf-8')).hexdigest()
-            cache_path_filename = os.path.join(settings.cache_folder, os.extsep.join([filename, 'json']))
-
-            # dump to json, and save to file
-            json_str = make_str(json.dumps(response_json))
-            with io.open(cache_path_filename, 'w', encoding='utf-8') as cache_file:
-                cache_file.write(json_str)
-
-            log('Saved response to cache file "{}"'.format(cache_path_filename))
+            # hash the url (to make the key shorter than the often extremely
+            # long url) then hand the response to the configured backend
+            key = hashlib.md5(url.encode('utf-8')).hexdigest()
+            get_cache().set(key, response_json)
 
 
-def get_from_cache(url):
+def get_from_cache(url, stream=False):
     """
-    Retrieve a HTTP response json object from the cache.
+    Retrieve a HTTP response json object from the cache backend configured in
+    settings.cache_backend.
 
     Parameters
     ----------
     url : string
         the url of the request
+    stream : bool
+        if True, an overpass response's elements may be a generator that
+        builds each element as it is consumed, instead of a list
 
     Returns
     -------
@@ -143,17 +198,13 @@ def get_from_cache(url):
     """
     # if the tool is configured to use the cache
     if settings.use_cache:
-        # determine the filename by hashing the url
-        filename = hashlib.md5(url.encode('utf-8')).hexdigest()
-
-        cache_path_filename = os.path.join(settings.cache_folder, os.extsep.join([filename, 'json']))
-        # open the cache file for this url hash if it already exists, otherwise
-        # return None
-        if os.path.isfile(cache_path_filename):
-            with io.open(cache_path_filename, encoding='utf-8') as cache_file:
-                response_json = json.load(cache_file)
-            log('Retrieved response from cache file "{}" for URL "{}"'.format(cache_path_filename, url))
-            return response_json
+        # determine the key by hashing the url, then look it up in the
+        # configured backend, which returns None if it is not there
+        key = hashlib.md5(url.encode('utf-8')).hexdigest()
+        response_json = get_cache().get(key, stream=stream)
+        if response_json is not None:
+            log('Retrieved response from cache for URL "{}"'.format(url))
+        return response_json
 
 
 def get_http_headers(user_agent=None, referer=None, accept_language=None):
@@ -186,6 +237,54 @@ def get_http_headers(user_agent=None, referer=None, accept_language=None):
     return headers
 
 
+_session = None
+_session_config = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the requests session shared by every call to the Overpass,
+    Nominatim and elevation APIs, creating it if it does not exist yet or if
+    the http settings have changed since it was created.
+
+    The session keeps connections alive in a pool of http_pool_size per host,
+    retries failed connections and 502/503 responses http_max_retries times
+    with exponential backoff, and asks for gzip-compressed responses. Read
+    errors and timeouts are not retried, so a slow query is not sent to the
+    server again, and neither are 429 and 504 responses: the callers wait
+    for the server to free up a slot before retrying those.
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _session, _session_config
+
+    config = (settings.http_pool_size, settings.http_max_retries, settings.http_backoff_factor)
+    with _session_lock:
+        if _session is None or _session_config != config:
+            retry = Retry(total=settings.http_max_retries,
+                          read=False,
+                          backoff_factor=settings.http_backoff_factor,
+                          status_forcelist=[502, 503],
+                          allowed_methods=None,
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=settings.http_pool_size,
+                                  pool_maxsize=settings.http_pool_size,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+            if _session is not None:
+                _session.close()
+            _session = session
+            _session_config = config
+        return _session
+
+
 def get_pause_duration(recursive_delay=5, default_duration=10):
     """
     Check the Overpass API status endpoint to determine how long to wait until
@@ -205,7 +304,7 @@ def get_pause_duration(recursive_delay=5, default_duration=10):
     """
 
     try:
-        response = requests.get(settings.overpass_endpoint.rstrip('/') + '/status', headers=get_http_headers())
+        response = get_session().get(settings.overpass_endpoint.rstrip('/') + '/status', headers=get_http_headers())
         status = response.text.split('\n')[3]
         status_first_token = status.split(' ')[0]
     except Exception:
@@ -242,6 +341,41 @@ def get_pause_duration(recursive_delay=5, default_duration=10):
     return pause_duration
 
 
+def get_available_slots(default_slots=1):
+    """
+    Check the Overpass API status endpoint to determine how many query slots
+    are available right now.
+
+    Parameters
+    ----------
+    default_slots : int
+        if the status endpoint cannot be reached or parsed, function falls
+        back on returning this value
+
+    Returns
+    -------
+    int
+    """
+
+    try:
+        response = get_session().get(settings.overpass_endpoint.rstrip('/') + '/status', headers=get_http_headers())
+        status = response.text.split('\n')[3]
+        status_first_token = status.split(' ')[0]
+    except Exception:
+        log('Unable to query {}/status'.format(settings.overpass_endpoint.rstrip('/')), level=lg.ERROR)
+        return default_slots
+
+    try:
+        # if first token is numeric, it's how many slots you have available
+        available_slots = int(status_first_token)
+    except ValueError:
+        # otherwise the status tells you when your next slot will be free or
+        # that it is currently running one of your queries
+        available_slots = 0
+
+    return available_slots
+
+
 def osm_polygon_download(query, limit=1, polygon_geojson=1):
     """
     Geocode a place and download its boundary geometry from OSM's Nominatim API.
@@ -332,7 +466,7 @@ def nominatim_request(params, type="search", pause_duration=1, timeout=30, error
         time.sleep(pause_duration)
         start_time = time.time()
         log('Requesting {} with timeout={}'.format(prepared_url, timeout))
-        response = requests.get(url, params=params, timeout=timeout, headers=get_http_headers())
+        response = get_session().get(url, params=params, timeout=timeout, headers=get_http_headers())
 
         # get the response size and the domain, log result
         size_kb = len(response.content) / 1000.
@@ -367,7 +501,54 @@ def nominatim_request(params, type="search", pause_duration=1, timeout=30, error
         return response_json
 
 
-def overpass_request(data, pause_duration=None, timeout=180, error_pause_duration=None):
+def stream_overpass_elements(response, prepared_url, start_time):
+    """
+    Incrementally parse the elements out of a streamed Overpass API HTTP
+    response, yielding each one as soon as it has arrived, then save the
+    whole response to the cache if it is enabled.
+
+    Parameters
+    ----------
+    response : requests.Response
+        a response to a request made with stream=True
+    prepared_url : string
+        the GET-style url of the request, to use as its cache key
+    start_time : float
+        when the request was sent
+
+    Returns
+    -------
+    generator
+        yields each element of the response
+    """
+    meta = {}
+    elements = [] if settings.use_cache else None
+    size = [0]
+
+    def chunks():
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size[0] += len(chunk)
+            yield chunk
+
+    try:
+        for element in iter_json_elements(chunks(), meta=meta):
+            # only hold onto the elements if we need them for the cache
+            if elements is not None:
+                elements.append(element)
+            yield element
+    finally:
+        response.close()
+
+    domain = re.findall(r'(?s)//(.*?)/', response.url)[0]
+    log('Downloaded {:,.1f}KB from {} in {:,.2f} seconds'.format(size[0] / 1000., domain, time.time() - start_time))
+    if 'remark' in meta:
+        log('Server remark: "{}"'.format(meta['remark']), level=lg.WARNING)
+    if elements is not None:
+        meta['elements'] = elements
+        save_to_cache(prepared_url, meta)
+
+
+def overpass_request(data, pause_duration=None, timeout=180, error_pause_duration=None, stream=False):
     """
     Send a request to the Overpass API via HTTP POST and return the JSON
     response.
@@ -383,6 +564,11 @@ def overpass_request(data, pause_duration=None, timeout=180, error_pause_duratio
         the timeout interval for the requests library
     error_pause_duration : int
         how long to pause in seconds before re-trying requests if error
+    stream : bool
+        if True, the response's elements are a generator that parses each one
+        from the HTTP body (or the cache) as it is consumed, so the whole
+        response never has to be in memory at once. the response's other keys
+        may then be missing
 
     Returns
     -------
@@ -393,7 +579,7 @@ def overpass_request(data, pause_duration=None, timeout=180, error_pause_duratio
     # hash to look up/save to cache
     url = settings.overpass_endpoint.rstrip('/') + '/interpreter'
     prepared_url = requests.Request('GET', url, params=data).prepare().url
-    cached_response_json = get_from_cache(prepared_url)
+    cached_response_json = get_from_cache(prepared_url, stream=stream)
 
     if cached_response_json is not None:
         # found this request in the cache, just return it instead of making a
@@ -404,11 +590,17 @@ def overpass_request(data, pause_duration=None, timeout=180, error_pause_duratio
         # if this URL is not already in the cache, pause, then request it
         if pause_duration is None:
             this_pause_duration = get_pause_duration()
+        else:
+            this_pause_duration = pause_duration
         log('Pausing {:,.2f} seconds before making API POST request'.format(this_pause_duration))
         time.sleep(this_pause_duration)
         start_time = time.time()
         log('Posting to {} with timeout={}, "{}"'.format(url, timeout, data))
-        response = requests.post(url, data=data, timeout=timeout, headers=get_http_headers())
+        response = get_session().post(url, data=data, timeout=timeout, headers=get_http_headers(), stream=stream)
+
+        # if streaming a successful response, parse it as it arrives
+        if stream and response.status_code == 200:
+            return {'elements': stream_overpass_elements(response, prepared_url, start_time)}
 
         # get the response size and the domain, log result
         size_kb = len(response.content) / 1000.
@@ -435,7 +627,7 @@ def overpass_request(data, pause_duration=None, timeout=180, error_pause_duratio
                         error_pause_duration),
                     level=lg.WARNING)
                 time.sleep(error_pause_duration)
-                response_json = overpass_request(data=data, pause_duration=pause_duration, timeout=timeout)
+                response_json = overpass_request(data=data, pause_duration=pause_duration, timeout=timeout, stream=stream)
 
             # else, this was an unhandled status_code, throw an exception
             else:
@@ -447,4 +639,86 @@ def overpass_request(data, pause_duration=None, timeout=180, error_pause_duratio
         return response_json
 
 
+def overpass_requests(datas, timeout=180, max_workers=None, stream=False):
+    """
+    Send several requests to the Overpass API, running up to max_workers of
+    them at once, and yield their JSON responses in the same order as datas.
+
+    Requests already in the cache are answered from it first. The remaining
+    ones are run concurrently, but never on more threads than the number of
+    slots the API's status endpoint reports as available, so concurrent
+    requests don't just queue up on the server side.
+
+    Parameters
+    ----------
+    datas : list
+        list of dicts or OrderedDicts of key-value parameters to post to the
+        API, one per request
+    timeout : int
+        the timeout interval for the requests library
+    max_workers : int
+        max number of requests to run concurrently, if None, use
+        settings.overpass_max_workers
+    stream : bool
+        if True and max_workers is 1, send each request only once the previous
+        response has been consumed, and parse each response's elements as
+        they are consumed (see overpass_request). concurrent requests are
+        never streamed
+
+    Returns
+    -------
+    generator
+        yields one response dict per item in datas, in order
+    """
+
+    if max_workers is None:
+        max_workers = settings.overpass_max_workers
+
+    # when streaming, only one response is read at a time, so look each one up
+    # in the cache just before requesting it, to not hold them all in memory
+    if stream and max_workers <= 1:
+        for data in datas:
+            yield overpass_request(data=data, timeout=timeout, stream=True)
+        return
 
+    # answer as many requests as possible from the cache and collect the rest
+    url = settings.overpass_endpoint.rstrip('/') + '/interpreter'
+    responses = {}
+    pending = []
+    for i, data in enumerate(datas):
+        prepared_url = requests.Request('GET', url, params=data).prepare().url
+        cached_response_json = get_from_cache(prepared_url)
+        if cached_response_json is not None:
+            responses[i] = cached_response_json
+        else:
+            pending.append(i)
+
+    # only as many workers as there are free slots on the server, otherwise
+    # the extra ones would just get rate limited
+    num_workers = min(max_workers, len(pending))
+    if num_workers > 1:
+        num_workers = min(num_workers, max(get_available_slots(), 1))
+
+    if num_workers <= 1:
+        # run the requests one at a time, pausing as the server status requires
+        for i in range(len(datas)):
+            if i in responses:
+                yield responses.pop(i)
+            else:
+                yield overpass_request(data=datas[i], timeout=timeout)
+
+    else:
+        log('Sending {:,} requests to the API with {:,} concurrent workers'.format(len(pending), num_workers))
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # we already waited for the slots, so don't pause again before
+            # each request. retries after errors still pause as usual
+            futures = {i:executor.submit(overpass_request, data=datas[i], pause_duration=0, timeout=timeout)
+                       for i in pending}
+
+            # yield each response as soon as it and all its predecessors have
+            # arrived, to keep the result order deterministic
+            for i in range(len(datas)):
+                if i in responses:
+                    yield responses.pop(i)
+                else:
+                    yield futures.pop(i).result()
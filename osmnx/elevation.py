@@ -9,10 +9,10 @@
 import math
 import networkx as nx
 import pandas as pd
-import requests
 import time
 
 from .downloader import get_from_cache
+from .downloader import get_session
 from .downloader import save_to_cache
 from .utils import log
 
@@ -66,7 +66,7 @@ def add_node_elevations(G, api_key, max_locations_per_batch=350,
                 # request the elevations from the API
                 log('Requesting node elevations: {}'.format(url))
                 time.sleep(pause_duration)
-                response = requests.get(url)
+                response = get_session().get(url)
                 response_json = response.json()
                 save_to_cache(url, response_json)
             except Exception as e:
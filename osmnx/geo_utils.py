@@ -6,7 +6,6 @@
 # Web: https://github.com/gboeing/osmnx
 ################################################################################
 
-import bz2
 import datetime as dt
 import io
 import logging as lg
@@ -14,10 +13,9 @@ import math
 import os
 import networkx as nx
 import numpy as np
-import pandas as pd
-import requests
 import time
 import xml.sax
+from concurrent.futures import ProcessPoolExecutor
 from collections import Counter
 from itertools import chain
 from shapely.geometry import Point
@@ -26,24 +24,20 @@ from shapely.geometry import LineString
 from shapely.geometry import MultiLineString
 from shapely.geometry import MultiPolygon
 from shapely.geometry import Polygon
+from shapely import vectorized
+from shapely.prepared import prep
 
+from .downloader import get_http_headers
+from .downloader import get_session
+from .downloader import parse_osm_filter
 from .osm_content_handler import OSMContentHandler
-from .save_load import graph_to_gdfs
+from .spatial_index import get_spatial_index
 from .utils import log, great_circle_vec, euclidean_dist_vec
+from .utils import open_osm_file
 from . import settings
 
-# scipy and sklearn are optional dependencies for faster nearest node search
-try:
-    from scipy.spatial import cKDTree
-except ImportError as e:
-    cKDTree = None
-try:
-    from sklearn.neighbors import BallTree
-except ImportError as e:
-    BallTree = None
 
-
-def induce_subgraph(G, node_subset):
+def induce_subgraph(G, node_subset, inplace=False):
     """
     Induce a subgraph of G.
 
@@ -52,6 +46,9 @@ def induce_subgraph(G, node_subset):
     G : networkx multidigraph
     node_subset : list-like
         the subset of nodes to induce a subgraph of G
+    inplace : bool
+        if True, remove every node not in node_subset from G itself and return
+        it, instead of copying node_subset into a new graph
 
     Returns
     -------
@@ -60,10 +57,13 @@ def induce_subgraph(G, node_subset):
     """
 
     node_subset = set(node_subset)
+    if inplace:
+        G.remove_nodes_from([n for n in G.nodes() if n not in node_subset])
+        return G
 
-    # copy nodes into new graph
+    # copy nodes into new graph, in their order in G
     G2 = G.__class__()
-    G2.add_nodes_from((n, G.nodes[n]) for n in node_subset)
+    G2.add_nodes_from((n, d) for n, d in G.nodes(data=True) if n in node_subset)
 
     # copy edges to new graph, including parallel edges
     if G2.is_multigraph:
@@ -81,7 +81,7 @@ def induce_subgraph(G, node_subset):
     return G2
 
 
-def get_largest_component(G, strongly=False):
+def get_largest_component(G, strongly=False, inplace=False):
     """
     Return a subgraph of the largest weakly or strongly connected component
     from a directed graph.
@@ -92,6 +92,9 @@ def get_largest_component(G, strongly=False):
     strongly : bool
         if True, return the largest strongly instead of weakly connected
         component
+    inplace : bool
+        if True, remove the other components from G itself instead of
+        returning a new graph
 
     Returns
     -------
@@ -109,7 +112,7 @@ def get_largest_component(G, strongly=False):
             # get all the strongly connected components in graph then identify the largest
             sccs = nx.strongly_connected_components(G)
             largest_scc = max(sccs, key=len)
-            G = induce_subgraph(G, largest_scc)
+            G = induce_subgraph(G, largest_scc, inplace=inplace)
 
             msg = ('Graph was not connected, retained only the largest strongly '
                    'connected component ({:,} of {:,} total nodes) in {:.2f} seconds')
@@ -121,7 +124,7 @@ def get_largest_component(G, strongly=False):
             # get all the weakly connected components in graph then identify the largest
             wccs = nx.weakly_connected_components(G)
             largest_wcc = max(wccs, key=len)
-            G = induce_subgraph(G, largest_wcc)
+            G = induce_subgraph(G, largest_wcc, inplace=inplace)
 
             msg = ('Graph was not connected, retained only the largest weakly '
                    'connected component ({:,} of {:,} total nodes) in {:.2f} seconds')
@@ -163,44 +166,38 @@ def get_nearest_node(G, point, method='haversine', return_dist=False):
     if not G or (G.number_of_nodes() == 0):
         raise ValueError('G argument must be not be empty or should contain at least one node')
 
-    # dump graph node coordinates into a pandas dataframe indexed by node id
-    # with x and y columns
-    coords = [[node, data['x'], data['y']] for node, data in G.nodes(data=True)]
-    df = pd.DataFrame(coords, columns=['node', 'x', 'y']).set_index('node')
-
-    # add columns to the dataframe representing the (constant) coordinates of
-    # the reference point
-    df['reference_y'] = point[0]
-    df['reference_x'] = point[1]
+    # the graph's spatial index holds its node ids and coordinates in arrays
+    index = get_spatial_index(G)
 
     # calculate the distance between each node and the reference point
     if method == 'haversine':
         # calculate distance vector using haversine (ie, for
         # spherical lat-long geometries)
-        distances = great_circle_vec(lat1=df['reference_y'],
-                                     lng1=df['reference_x'],
-                                     lat2=df['y'],
-                                     lng2=df['x'])
+        distances = great_circle_vec(lat1=point[0],
+                                     lng1=point[1],
+                                     lat2=index.y,
+                                     lng2=index.x)
 
     elif method == 'euclidean':
         # calculate distance vector using euclidean distances (ie, for projected
         # planar geometries)
-        distances = euclidean_dist_vec(y1=df['reference_y'],
-                                       x1=df['reference_x'],
-                                       y2=df['y'],
-                                       x2=df['x'])
+        distances = euclidean_dist_vec(y1=point[0],
+                                       x1=point[1],
+                                       y2=index.y,
+                                       x2=index.x)
 
     else:
         raise ValueError('method argument must be either "haversine" or "euclidean"')
 
-    # nearest node's ID is the index label of the minimum distance
-    nearest_node = distances.idxmin()
+    # nearest node's ID is the one at the position of the minimum distance
+    position = np.nanargmin(distances)
+    nearest_node = index.node_ids[position:position+1].tolist()[0]
     log('Found nearest node ({}) to point {} in {:,.2f} seconds'.format(nearest_node, point, time.time()-start_time))
 
     # if caller requested return_dist, return distance between the point and the
     # nearest node as well
     if return_dist:
-        return nearest_node, distances.loc[nearest_node]
+        return nearest_node, distances[position]
     else:
         return nearest_node
 
@@ -208,11 +205,10 @@ def get_nearest_node(G, point, method='haversine', return_dist=False):
 def get_nearest_edge(G, point):
     """
     Return the nearest edge to a pair of coordinates. Pass in a graph and a tuple
-    with the coordinates. We first get all the edges in the graph. Secondly we compute
-    the euclidean distance from the coordinates to the segments determined by each edge.
-    The last step is to sort the edge segments in ascending order based on the distance
-    from the coordinates to the edge. In the end, the first element in the list of edges
-    will be the closest edge that we will return as a tuple containing the shapely
+    with the coordinates. We search the R-tree of the straight segments of the
+    graph's edges for the segments near the coordinates, then compute the
+    euclidean distance from the coordinates to each of them. The first edge in the
+    graph with the closest segment is returned as a tuple containing the shapely
     geometry and the u, v nodes.
 
     Parameters
@@ -230,28 +226,19 @@ def get_nearest_edge(G, point):
     """
     start_time = time.time()
 
-    gdf = graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-    graph_edges = gdf[["geometry", "u", "v"]].values.tolist()
-
-    edges_with_distances = [
-        (
-            graph_edge,
-            Point(tuple(reversed(point))).distance(graph_edge[0])
-        )
-        for graph_edge in graph_edges
-    ]
-
-    edges_with_distances = sorted(edges_with_distances, key=lambda x: x[1])
-    closest_edge_to_point = edges_with_distances[0][0]
-
-    geometry, u, v = closest_edge_to_point
+    # search the graph's spatial index of edge segments
+    index = get_spatial_index(G, edges=True)
+    positions, _, _, _ = index.nearest_edges([point[1]], [point[0]])
+    edge_uv, _, edge_geometries = index.get_edges()
+    geometry = edge_geometries[positions[0]]
+    u, v = edge_uv[positions[0]].tolist()
 
     log('Found nearest edge ({}) to point {} in {:,.2f} seconds'.format((u, v), point, time.time() - start_time))
 
     return geometry, u, v
 
 
-def get_nearest_nodes(G, X, Y, method=None):
+def get_nearest_nodes(G, X, Y, method=None, chunk_size=None):
     """
     Return the graph nodes nearest to a list of points. Pass in points
     as separate vectors of X and Y coordinates. The 'kdtree' method
@@ -259,7 +246,10 @@ def get_nearest_nodes(G, X, Y, method=None):
     nearest nodes if working in unprojected coordinates like lat-lng (it
     precisely finds the nearest node if working in projected coordinates).
     The 'balltree' method is second fastest with large data sets, but it
-    is precise if working in unprojected coordinates like lat-lng.
+    is precise if working in unprojected coordinates like lat-lng. The
+    default method=None is also precise in lat-lng, needs neither scipy nor
+    scikit-learn, and is fast for many points on graphs of up to hundreds of
+    thousands of nodes.
 
     Parameters
     ----------
@@ -272,11 +262,14 @@ def get_nearest_nodes(G, X, Y, method=None):
         node in the graph
     method : str {None, 'kdtree', 'balltree'}
         Which method to use for finding nearest node to each point.
-        If None, we manually find each node one at a time using
-        osmnx.utils.get_nearest_node and haversine. If 'kdtree' we use
+        If None, we compare chunks of points to every node at once with
+        vectorized haversine. If 'kdtree' we use
         scipy.spatial.cKDTree for very fast euclidean search. If
         'balltree', we use sklearn.neighbors.BallTree for fast
         haversine search.
+    chunk_size : int
+        if method is None, the number of points to compare to every node at
+        once, if None use as many as make about a million distances per chunk
 
     Returns
     -------
@@ -288,44 +281,31 @@ def get_nearest_nodes(G, X, Y, method=None):
 
     if method is None:
 
-        # calculate nearest node one at a time for each point
-        nn = [get_nearest_node(G, (y, x), method='haversine') for x, y in zip(X, Y)]
+        # calculate haversine distances from chunks of points to every node
+        index = get_spatial_index(G)
+        positions, _ = index.nearest_nodes_haversine(X, Y, chunk_size=chunk_size)
+        nn = index.node_ids[positions]
 
     elif method == 'kdtree':
 
-        # check if we were able to import scipy.spatial.cKDTree successfully
-        if not cKDTree:
-            raise ImportError('The scipy package must be installed to use this optional feature.')
-
-        # build a k-d tree for euclidean nearest node search
-        nodes = pd.DataFrame({'x':nx.get_node_attributes(G, 'x'),
-                              'y':nx.get_node_attributes(G, 'y')})
-        tree = cKDTree(data=nodes[['x', 'y']], compact_nodes=True, balanced_tree=True)
-
-        # query the tree for nearest node to each point
-        points = np.array([X, Y]).T
+        # query the graph's k-d tree for euclidean nearest node to each point
+        index = get_spatial_index(G)
+        tree = index.get_node_tree('kdtree')
+        points = np.array([X, Y], dtype=float).T
         dist, idx = tree.query(points, k=1)
-        nn = nodes.iloc[idx].index
+        nn = index.node_ids[idx]
 
     elif method == 'balltree':
 
-        # check if we were able to import sklearn.neighbors.BallTree successfully
-        if not BallTree:
-            raise ImportError('The scikit-learn package must be installed to use this optional feature.')
-
         # haversine requires data in form of [lat, lng] and inputs/outputs in units of radians
-        nodes = pd.DataFrame({'x':nx.get_node_attributes(G, 'x'),
-                              'y':nx.get_node_attributes(G, 'y')})
-        nodes_rad = np.deg2rad(nodes[['y', 'x']].astype(np.float))
-        points = np.array([Y.astype(np.float), X.astype(np.float)]).T
+        index = get_spatial_index(G)
+        tree = index.get_node_tree('balltree')
+        points = np.array([Y, X], dtype=float).T
         points_rad = np.deg2rad(points)
 
-        # build a ball tree for haversine nearest node search
-        tree = BallTree(nodes_rad, metric='haversine')
-
-        # query the tree for nearest node to each point
+        # query the graph's ball tree for haversine nearest node to each point
         idx = tree.query(points_rad, k=1, return_distance=False)
-        nn = nodes.iloc[idx[:,0]].index
+        nn = index.node_ids[idx[:, 0]]
 
     else:
         raise ValueError('You must pass a valid method name, or None.')
@@ -343,13 +323,13 @@ def get_nearest_edges(G, X, Y, method=None, dist=0.0001):
     nearest edges if working in unprojected coordinates like lat-lng (it
     precisely finds the nearest edge if working in projected coordinates).
     The 'balltree' method is second fastest with large data sets, but it
-    is precise if working in unprojected coordinates like lat-lng. As a
-    rule of thumb, if you have a small graph just use method=None. If you 
-    have a large graph with lat-lng coordinates, use method='balltree'.
-    If you have a large graph with projected coordinates, use 
-    method='kdtree'. Note that if you are working in units of lat-lng,
-    the X vector corresponds to longitude and the Y vector corresponds
-    to latitude.
+    is precise if working in unprojected coordinates like lat-lng. The
+    default method=None finds the exact nearest edges in the graph's
+    coordinate units, with no dist spacing to tune, and is fast and memory
+    efficient for any size of graph: use it unless you need haversine
+    distances on a graph with lat-lng coordinates, then use method='balltree'.
+    Note that if you are working in units of lat-lng, the X vector corresponds
+    to longitude and the Y vector corresponds to latitude.
 
     Parameters
     ----------
@@ -364,8 +344,9 @@ def get_nearest_edges(G, X, Y, method=None, dist=0.0001):
         usually in meters.
     method : str {None, 'kdtree', 'balltree'}
         Which method to use for finding nearest edge to each point.
-        If None, we manually find each edge one at a time using
-        osmnx.utils.get_nearest_edge. If 'kdtree' we use
+        If None, we search an R-tree of the edges' straight segments and
+        compute exact euclidean distances to the candidate segments, see
+        get_nearest_edge_points. If 'kdtree' we use
         scipy.spatial.cKDTree for very fast euclidean search. Recommended for
         projected graphs. If 'balltree', we use sklearn.neighbors.BallTree for
         fast haversine search. Recommended for unprojected graphs.
@@ -383,7 +364,8 @@ def get_nearest_edges(G, X, Y, method=None, dist=0.0001):
 
     Info
     ----
-    The method creates equally distanced points along the edges of the network.
+    The 'kdtree' and 'balltree' methods create equally distanced points along
+    the edges of the network.
     Then, these points are used in a kdTree or BallTree search to identify which
     is nearest.Note that this method will not give the exact perpendicular point
     along the edge, but the smaller the *dist* parameter, the closer the solution
@@ -396,74 +378,242 @@ def get_nearest_edges(G, X, Y, method=None, dist=0.0001):
     start_time = time.time()
 
     if method is None:
-        # calculate nearest edge one at a time for each (y, x) point
-        ne = [get_nearest_edge(G, (y, x)) for x, y in zip(X, Y)]
-        ne = [(u, v) for _, u, v in ne]
+        # search the graph's spatial index of edge segments for all the
+        # points at once
+        index = get_spatial_index(G, edges=True)
+        positions, _, _, _ = index.nearest_edges(X, Y)
+        ne = index.get_edges()[0][positions]
+
+    elif method in ('kdtree', 'balltree'):
+
+        # query the graph's tree of points spaced dist apart along its edges
+        # for the nearest point to each point, and take the edge it lies on
+        index = get_spatial_index(G, edges=True)
+        tree, positions = index.get_edge_point_tree(method, dist)
+        if method == 'kdtree':
+            points = np.array([X, Y], dtype=float).T
+            _, idx = tree.query(points, k=1)
+        else:
+            # haversine requires inputs in the form of [lat, lng] in units of radians
+            points_rad = np.deg2rad(np.array([Y, X], dtype=float).T)
+            idx = tree.query(points_rad, k=1, return_distance=False)[:, 0]
+        ne = index.get_edges()[0][positions[idx]]
 
-    elif method == 'kdtree':
+    else:
+        raise ValueError('You must pass a valid method name, or None.')
 
-        # check if we were able to import scipy.spatial.cKDTree successfully
-        if not cKDTree:
-            raise ImportError('The scipy package must be installed to use this optional feature.')
+    log('Found nearest edges to {:,} points in {:,.2f} seconds'.format(len(X), time.time() - start_time))
 
-        # transform graph into DataFrame
-        edges = graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    return np.array(ne)
 
-        # transform edges into evenly spaced points
-        edges['points'] = edges.apply(lambda x: redistribute_vertices(x.geometry, dist), axis=1)
 
-        # develop edges data for each created points
-        extended = edges['points'].apply([pd.Series]).stack().reset_index(level=1, drop=True).join(edges).reset_index()
+def get_nearest_edge_points(G, X, Y):
+    """
+    Return the exact nearest edge to each of a list of points, the distance to
+    it, and the nearest point on it, for snapping the points to the graph.
 
-        # Prepare btree arrays
-        nbdata = np.array(list(zip(extended['Series'].apply(lambda x: x.x),
-                                   extended['Series'].apply(lambda x: x.y))))
+    Pass in points as separate vectors of X and Y coordinates, in the graph's
+    coordinate units. Distances are euclidean in those units, so project the
+    graph first for distances in meters. The edges' straight segments are
+    indexed by bounding box in an R-tree, kept in the graph's spatial index,
+    so memory use does not depend on any spacing of points along the edges.
 
-        # build a k-d tree for euclidean nearest node search
-        btree = cKDTree(data=nbdata, compact_nodes=True, balanced_tree=True)
+    Parameters
+    ----------
+    G : networkx multidigraph
+    X : list-like
+        The vector of longitudes or x's for which we will find the nearest
+        edge in the graph
+    Y : list-like
+        The vector of latitudes or y's for which we will find the nearest
+        edge in the graph
 
-        # query the tree for nearest node to each point
-        points = np.array([X, Y]).T
-        dist, idx = btree.query(points, k=1)  # Returns ids of closest point
-        eidx = extended.loc[idx, 'index']
-        ne = edges.loc[eidx, ['u', 'v']]
+    Returns
+    -------
+    ne, dist, points : tuple of ndarray
+        array of nearest edges represented by their u, v and key, array of the
+        distances from the points to them, and array of the (x, y) nearest
+        points on them
+    """
+    start_time = time.time()
 
-    elif method == 'balltree':
+    index = get_spatial_index(G, edges=True)
+    positions, dist, nearest_x, nearest_y = index.nearest_edges(X, Y)
+    edge_uv, edge_keys, _ = index.get_edges()
+    ne = np.column_stack([edge_uv[positions], edge_keys[positions]])
 
-        # check if we were able to import sklearn.neighbors.BallTree successfully
-        if not BallTree:
-            raise ImportError('The scikit-learn package must be installed to use this optional feature.')
+    log('Found nearest edge points to {:,} points in {:,.2f} seconds'.format(len(positions), time.time() - start_time))
 
-        # transform graph into DataFrame
-        edges = graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    return ne, dist, np.column_stack([nearest_x, nearest_y])
 
-        # transform edges into evenly spaced points
-        edges['points'] = edges.apply(lambda x: redistribute_vertices(x.geometry, dist), axis=1)
 
-        # develop edges data for each created points
-        extended = edges['points'].apply([pd.Series]).stack().reset_index(level=1, drop=True).join(edges).reset_index()
+def get_k_nearest_nodes(G, X, Y, k=5, method='kdtree'):
+    """
+    Return the k graph nodes nearest to each of a list of points, and the
+    distances to them, for example to generate candidates for map matching.
+    Pass in points as separate vectors of X and Y coordinates.
 
-        # haversine requires data in form of [lat, lng] and inputs/outputs in units of radians
-        nodes = pd.DataFrame({'x': extended['Series'].apply(lambda x: x.x),
-                              'y': extended['Series'].apply(lambda x: x.y)})
-        nodes_rad = np.deg2rad(nodes[['y', 'x']].values.astype(np.float))
-        points = np.array([Y, X]).T
-        points_rad = np.deg2rad(points)
+    Parameters
+    ----------
+    G : networkx multidigraph
+    X : list-like
+        The vector of longitudes or x's for which we will find the nearest
+        nodes in the graph
+    Y : list-like
+        The vector of latitudes or y's for which we will find the nearest
+        nodes in the graph
+    k : int
+        how many nodes to find for each point, at most the number of nodes in
+        the graph
+    method : str {'kdtree', 'balltree'}
+        If 'kdtree' we use scipy.spatial.cKDTree for very fast euclidean
+        search, with distances in the graph's coordinate units. If 'balltree',
+        we use sklearn.neighbors.BallTree for fast haversine search, with
+        distances in meters.
+
+    Returns
+    -------
+    nn, dist : tuple of ndarray
+        arrays of each point's k nearest node IDs and of the distances to
+        them, with one row per point, nearest first
+    """
+    start_time = time.time()
 
-        # build a ball tree for haversine nearest node search
-        tree = BallTree(nodes_rad, metric='haversine')
+    index = get_spatial_index(G)
+    k = min(k, len(index.node_ids))
+    _, positions, dist = index.query_nodes(X, Y, method=method, k=k)
+    nn = index.node_ids[positions].reshape(-1, k)
 
-        # query the tree for nearest node to each point
-        idx = tree.query(points_rad, k=1, return_distance=False)
-        eidx = extended.loc[idx[:, 0], 'index']
-        ne = edges.loc[eidx, ['u', 'v']]
+    log('Found {:,} nearest nodes to {:,} points in {:,.2f} seconds'.format(k, len(nn), time.time()-start_time))
 
-    else:
-        raise ValueError('You must pass a valid method name, or None.')
+    return nn, dist.reshape(-1, k)
 
-    log('Found nearest edges to {:,} points in {:,.2f} seconds'.format(len(X), time.time() - start_time))
 
-    return np.array(ne)
+def get_nodes_in_radius(G, X, Y, radius, method='kdtree'):
+    """
+    Return all the graph nodes within some distance of each of a list of
+    points, and the distances to them. Pass in points as separate vectors of
+    X and Y coordinates.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    X : list-like
+        The vector of longitudes or x's for which we will find the nodes
+    Y : list-like
+        The vector of latitudes or y's for which we will find the nodes
+    radius : float
+        how far from each point to find nodes, in the graph's coordinate units
+        for 'kdtree' or in meters for 'balltree'
+    method : str {'kdtree', 'balltree'}
+        see get_k_nearest_nodes
+
+    Returns
+    -------
+    point, nn, dist : tuple of ndarray
+        flat arrays of the position in X and Y of the point each node was
+        found for, the node IDs and the distances to them, sorted by point and
+        then by distance
+    """
+    start_time = time.time()
+
+    index = get_spatial_index(G)
+    point, positions, dist = index.query_nodes(X, Y, method=method, radius=radius)
+    nn = index.node_ids[positions]
+
+    log('Found {:,} nodes within {} of {:,} points in {:,.2f} seconds'.format(len(nn), radius, len(X), time.time()-start_time))
+
+    return point, nn, dist
+
+
+def get_k_nearest_edges(G, X, Y, k=5, method=None, dist=0.0001):
+    """
+    Return the k graph edges nearest to each of a list of points, and the
+    distances to them, for example to generate candidates for map matching.
+    Pass in points as separate vectors of X and Y coordinates.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    X : list-like
+        The vector of longitudes or x's for which we will find the nearest
+        edges in the graph
+    Y : list-like
+        The vector of latitudes or y's for which we will find the nearest
+        edges in the graph
+    k : int
+        how many edges to find for each point, at most the number of edges in
+        the graph
+    method : str {None, 'kdtree', 'balltree'}
+        If None, we find the exact nearest edges from an R-tree of the edges'
+        straight segments, with euclidean distances in the graph's coordinate
+        units, see get_nearest_edge_points. If 'kdtree' or 'balltree', we
+        search a tree of points spaced along the edges as in
+        get_nearest_edges, with distances in the graph's coordinate units or
+        in meters respectively.
+    dist : float
+        spacing length along edges for 'kdtree' and 'balltree', see
+        get_nearest_edges
+
+    Returns
+    -------
+    ne, distances : tuple of ndarray
+        arrays of each point's k nearest edges, represented by their u, v and
+        key, and of the distances to them, with one row per point, nearest
+        first
+    """
+    start_time = time.time()
+
+    index = get_spatial_index(G, edges=True)
+    edge_uv, edge_keys, _ = index.get_edges()
+    k = min(k, len(edge_keys))
+    _, positions, distances = index.query_edges(X, Y, method=method, k=k, dist=dist)
+    ne = np.column_stack([edge_uv[positions], edge_keys[positions]]).reshape(-1, k, 3)
+
+    log('Found {:,} nearest edges to {:,} points in {:,.2f} seconds'.format(k, len(ne), time.time()-start_time))
+
+    return ne, distances.reshape(-1, k)
+
+
+def get_edges_in_radius(G, X, Y, radius, method=None, dist=0.0001):
+    """
+    Return all the graph edges within some distance of each of a list of
+    points, and the distances to them. Pass in points as separate vectors of
+    X and Y coordinates.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    X : list-like
+        The vector of longitudes or x's for which we will find the edges
+    Y : list-like
+        The vector of latitudes or y's for which we will find the edges
+    radius : float
+        how far from each point to find edges, in the graph's coordinate units,
+        or in meters for 'balltree'
+    method : str {None, 'kdtree', 'balltree'}
+        see get_k_nearest_edges
+    dist : float
+        spacing length along edges for 'kdtree' and 'balltree', see
+        get_nearest_edges
+
+    Returns
+    -------
+    point, ne, distances : tuple of ndarray
+        flat arrays of the position in X and Y of the point each edge was
+        found for, the edges represented by their u, v and key, and the
+        distances to them, sorted by point and then by distance
+    """
+    start_time = time.time()
+
+    index = get_spatial_index(G, edges=True)
+    edge_uv, edge_keys, _ = index.get_edges()
+    point, positions, distances = index.query_edges(X, Y, method=method, radius=radius, dist=dist)
+    ne = np.column_stack([edge_uv[positions], edge_keys[positions]])
+
+    log('Found {:,} edges within {} of {:,} points in {:,.2f} seconds'.format(len(ne), radius, len(X), time.time()-start_time))
+
+    return point, ne, distances
 
 
 def redistribute_vertices(geom, dist):
@@ -591,7 +741,7 @@ def geocode(query):
     # send the query to the nominatim geocoder and parse the json response
     url_template = 'https://nominatim.openstreetmap.org/search?format=json&limit=1&q={}'
     url = url_template.format(query)
-    response = requests.get(url, timeout=60)
+    response = get_session().get(url, timeout=60, headers=get_http_headers())
     results = response.json()
 
     # if results were returned, parse lat and long out of the result
@@ -885,31 +1035,33 @@ def round_shape_coords(shape, precision):
 
 
 
-def overpass_json_from_file(filename):
+def overpass_json_from_file(filename, useful_tags_node=None, useful_tags_path=None, osm_filter=None):
     """
     Read OSM XML from input filename and return Overpass-like JSON.
 
     Parameters
     ----------
     filename : string
-        name of file containing OSM XML data
+        name of file containing OSM XML data, optionally compressed as .bz2
+        or .gz
+    useful_tags_node : list
+        if not None, keep only these tags of each node
+    useful_tags_path : list
+        if not None, keep only these tags of each way
+    osm_filter : string
+        if not None, an Overpass QL filter like 'way["highway"]' plus the
+        filter get_osm_filter returns for a network type: keep only the ways
+        that pass it, and the nodes they reference
 
     Returns
     -------
     OSMContentHandler object
     """
 
-    _, ext = os.path.splitext(filename)
-
-    if ext == '.bz2':
-        # Use Python 2/3 compatible BZ2File()
-        opener = lambda fn: bz2.BZ2File(fn)
-    else:
-        # Assume an unrecognized file extension is just XML
-        opener = lambda fn: open(fn, mode='rb')
-
-    with opener(filename) as file:
-        handler = OSMContentHandler()
+    way_filter = parse_osm_filter(osm_filter) if osm_filter else None
+    with open_osm_file(filename) as file:
+        handler = OSMContentHandler(useful_tags_node=useful_tags_node, useful_tags_path=useful_tags_path,
+                                    way_filter=way_filter)
         xml.sax.parse(file, handler)
         return handler.object
 
@@ -920,3 +1072,83 @@ def bbox_to_poly(north, south, east, west):
     """
 
     return Polygon([(west, south), (east, south), (east, north), (west, north)])
+
+
+def points_in_polygon(x, y, polygon, chunk_size=None, max_workers=None):
+    """
+    Determine which points lie within a polygon or on its boundary, like
+    shapely's intersects, vectorized over arrays of their coordinates.
+
+    Points outside the polygon's bounding box are ruled out with array
+    comparisons. The rest are tested against the prepared polygon, in chunks
+    in a pool of worker processes if chunk_size is given.
+
+    Parameters
+    ----------
+    x : array-like
+        the points' x coordinates
+    y : array-like
+        the points' y coordinates
+    polygon : Polygon or MultiPolygon
+        the geometry to test the points against
+    chunk_size : int
+        if not None, test the points in chunks of this many in parallel
+    max_workers : int
+        max number of worker processes when chunk_size is given, if None use
+        the number of processors
+
+    Returns
+    -------
+    numpy array
+        boolean mask of the points that intersect the polygon
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    west, south, east, north = polygon.bounds
+    in_bounds = np.flatnonzero((x >= west) & (x <= east) & (y >= south) & (y <= north))
+
+    # points on the boundary intersect the polygon too, but testing touches
+    # is slow: only test the points within a hair's breadth of the polygon.
+    # buffering is slow too, so buffer once for all the chunks
+    hair = polygon.buffer(1e-9 * max(east - west, north - south))
+
+    inside = np.zeros(len(x), dtype=bool)
+    if chunk_size is None or len(in_bounds) <= chunk_size:
+        inside[in_bounds] = points_in_polygon_chunk(polygon, hair, x[in_bounds], y[in_bounds])
+    else:
+        chunks = [in_bounds[i:i + chunk_size] for i in range(0, len(in_bounds), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(points_in_polygon_chunk, [polygon] * len(chunks), [hair] * len(chunks),
+                                   [x[chunk] for chunk in chunks], [y[chunk] for chunk in chunks])
+            for chunk, result in zip(chunks, results):
+                inside[chunk] = result
+    return inside
+
+
+def points_in_polygon_chunk(polygon, hair, x, y):
+    """
+    Test a chunk of points against a polygon, see points_in_polygon.
+
+    Parameters
+    ----------
+    polygon : Polygon or MultiPolygon
+        the geometry to test the points against
+    hair : Polygon or MultiPolygon
+        the geometry buffered by a hair's breadth
+    x : numpy array
+        the points' x coordinates
+    y : numpy array
+        the points' y coordinates
+
+    Returns
+    -------
+    numpy array
+        boolean mask of the points that intersect the polygon
+    """
+    # geometries are prepared here, as prepared geometries cannot be pickled
+    # to send to worker processes
+    prepared_polygon = prep(polygon)
+    inside = vectorized.contains(prepared_polygon, x, y)
+    near = np.flatnonzero(~inside & vectorized.contains(prep(hair), x, y))
+    inside[near] = vectorized.touches(prepared_polygon, x[near], y[near])
+    return inside
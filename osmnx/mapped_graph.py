@@ -0,0 +1,451 @@
+################################################################################
+# Module: mapped_graph.py
+# Description: Read-only graph of memory-mapped arrays, written once and shared
+#              by every process that opens it
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+import json
+import os
+import time
+import numpy as np
+
+from . import settings
+from .save_load import column_value
+from .save_load import decode_column
+from .save_load import decode_columns
+from .save_load import decode_graph_attributes
+from .save_load import encode_column
+from .save_load import encode_columns
+from .save_load import encode_graph_attributes
+from .utils import log
+
+# identifies directories saved by save_graph_mapped, and their layout version
+MAPPED_GRAPH_FORMAT = 'osmnx-graph-mapped-1'
+
+
+class MappedGraph(object):
+    """
+    Read-only multidigraph whose nodes, edges and attributes live in
+    memory-mapped arrays saved by save_graph_mapped.
+
+    The arrays are opened with numpy's mmap_mode='r', so every process that
+    loads the same directory shares one copy of them in the operating
+    system's page cache, and only the pages that are read are loaded. The
+    edges are stored in compressed sparse row (CSR) form: each node's
+    out-edges are consecutive, from indptr[i] to indptr[i+1], with the
+    positions of their target nodes in edge_v. Attributes are stored in one
+    column per attribute, as in save_graph_binary, with offsets so that any
+    single value can be read on its own.
+
+    It implements the part of the networkx read API that get_route_edge_
+    attributes, plot_graph, graph_to_gdfs and the nearest node and edge
+    functions use: G.graph, G.nodes, G.edges, G[u], neighbors, successors,
+    get_edge_data and has_edge. Node and edge attribute dicts are built when
+    they are asked for, so changing them does not change the graph.
+    Predecessors are not stored. Node ids must be integers.
+
+    Pickling a MappedGraph, such as to send it to a worker process, pickles
+    only its path, and the worker maps the same files.
+    """
+
+    def __init__(self, path):
+        start_time = time.time()
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != MAPPED_GRAPH_FORMAT:
+            raise ValueError('"{}" is not a graph saved by save_graph_mapped'.format(path))
+
+        self.arrays = {}
+        for filename in os.listdir(path):
+            if filename.endswith('.npy'):
+                self.arrays[filename[:-4]] = load_array(os.path.join(path, filename))
+        self.graph = decode_graph_attributes(meta['graph'], self.arrays)
+        self.node_ids = self.arrays['node_ids']
+        self.sorted_node_ids = self.arrays['sorted_node_ids']
+        self.node_order = self.arrays['node_order']
+        self.indptr = self.arrays['indptr']
+        self.edge_v = self.arrays['edge_v']
+        self.edge_keys = meta['edge_keys']
+        self.node_columns = meta['nodes']
+        self.edge_columns = meta['edges']
+
+        # each column with its array name prefix and, if only some rows have
+        # values for it, the sorted positions of those rows
+        self.node_rows = [(column, 'node{}'.format(i), self.arrays.get('node{}_positions'.format(i)))
+                          for i, column in enumerate(self.node_columns)]
+        self.edge_rows = [(column, 'edge{}'.format(i), self.arrays.get('edge{}_positions'.format(i)))
+                          for i, column in enumerate(self.edge_columns)]
+        self.nodes = MappedNodeView(self)
+        self.edges = MappedEdgeView(self)
+        log('Mapped graph with {:,} nodes and {:,} edges in {:,.2f} seconds from "{}"'.format(len(self.node_ids),
+                                                                                          len(self.edge_v),
+                                                                                          time.time()-start_time,
+                                                                                          path))
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @property
+    def name(self):
+        return self.graph.get('name', '')
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __iter__(self):
+        return iter(self.node_ids.tolist())
+
+    def __contains__(self, node):
+        try:
+            self.node_position(node)
+            return True
+        except KeyError:
+            return False
+
+    def __getitem__(self, u):
+        adjacency = {}
+        for v, key, data in self.out_edges(u):
+            adjacency.setdefault(v, {})[key] = data
+        return adjacency
+
+    def is_directed(self):
+        return True
+
+    def is_multigraph(self):
+        return True
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.edge_v)
+
+    def node_position(self, node):
+        """
+        Return the position of a node in the node arrays.
+
+        Parameters
+        ----------
+        node : int
+            the node id
+
+        Returns
+        -------
+        int
+        """
+        try:
+            i = int(self.sorted_node_ids.searchsorted(node))
+        except TypeError:
+            raise KeyError(node)
+        if i < len(self.sorted_node_ids) and self.sorted_node_ids[i] == node:
+            return int(self.node_order[i])
+        raise KeyError(node)
+
+    def node_data(self, position):
+        """
+        Return the attribute dict of the node at a position.
+
+        Parameters
+        ----------
+        position : int
+            the position of the node in the node arrays
+
+        Returns
+        -------
+        dict
+        """
+        return self.row_data(self.node_rows, position)
+
+    def edge_key(self, position):
+        """
+        Return the key of the edge at a position.
+
+        Parameters
+        ----------
+        position : int
+            the position of the edge in the edge arrays
+
+        Returns
+        -------
+        the key
+        """
+        return column_value(self.edge_keys, self.arrays, 'edge_keys', position)
+
+    def edge_data(self, position):
+        """
+        Return the attribute dict of the edge at a position.
+
+        Parameters
+        ----------
+        position : int
+            the position of the edge in the edge arrays
+
+        Returns
+        -------
+        dict
+        """
+        return self.row_data(self.edge_rows, position)
+
+    def row_data(self, rows, position):
+        data = {}
+        for column, prefix, positions in rows:
+            row = position
+            if positions is not None:
+                row = int(positions.searchsorted(position))
+                if row == len(positions) or positions[row] != position:
+                    continue
+            data[column['name']] = column_value(column, self.arrays, prefix, row)
+        return data
+
+    def out_edges(self, u):
+        """
+        Iterate over a node's out-edges.
+
+        Parameters
+        ----------
+        u : int
+            the node id
+
+        Returns
+        -------
+        generator of (v, key, data) tuples
+        """
+        i = self.node_position(u)
+        start, end = self.indptr[i:i+2].tolist()
+        for position, v in zip(range(start, end), self.edge_v[start:end].tolist()):
+            yield self.node_ids[v].item(), self.edge_key(position), self.edge_data(position)
+
+    def successors(self, u):
+        i = self.node_position(u)
+        start, end = self.indptr[i:i+2].tolist()
+        # unique targets, in the order their first edges were added
+        targets = list(dict.fromkeys(self.edge_v[start:end].tolist()))
+        return iter(self.node_ids[targets].tolist())
+
+    neighbors = successors
+
+    def get_edge_data(self, u, v, key=None, default=None):
+        if u not in self or v not in self:
+            return default
+        edges = {edge_key: data for node, edge_key, data in self.out_edges(u) if node == v}
+        if key is None:
+            return edges or default
+        return edges.get(key, default)
+
+    def has_edge(self, u, v, key=None):
+        if key is None:
+            return self.get_edge_data(u, v) is not None
+        return self.get_edge_data(u, v, key=key) is not None
+
+    def attribute_values(self, columns, prefix, length, name, default=None):
+        """
+        Decode every node's or edge's value of one attribute at once.
+
+        Parameters
+        ----------
+        columns : list
+            the node or edge columns' metadata
+        prefix : string
+            'node' or 'edge'
+        length : int
+            the number of nodes or edges
+        name : string
+            the name of the attribute
+        default : any
+            the value for nodes or edges without the attribute
+
+        Returns
+        -------
+        list
+        """
+        for i, column in enumerate(columns):
+            if column['name'] == name:
+                column_prefix = '{}{}'.format(prefix, i)
+                values = decode_column(column, self.arrays, column_prefix)
+                positions = self.arrays.get(column_prefix + '_positions')
+                if positions is None:
+                    return values
+                filled = [default] * length
+                for position, value in zip(positions.tolist(), values):
+                    filled[position] = value
+                return filled
+        return [default] * length
+
+
+class MappedNodeView(object):
+    """
+    View of a MappedGraph's nodes, like G.nodes of a networkx graph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __call__(self, data=False, default=None):
+        if data is False:
+            return self
+        graph = self.graph
+        if data is True:
+            values = decode_columns(graph.node_columns, graph.arrays, 'node', len(graph))
+        else:
+            values = graph.attribute_values(graph.node_columns, 'node', len(graph), data, default)
+        return zip(graph.node_ids.tolist(), values)
+
+    def __getitem__(self, node):
+        return self.graph.node_data(self.graph.node_position(node))
+
+    def __iter__(self):
+        return iter(self.graph)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def __contains__(self, node):
+        return node in self.graph
+
+
+class MappedEdgeView(object):
+    """
+    View of a MappedGraph's edges, like G.edges of a networkx multidigraph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __call__(self, nbunch=None, data=False, keys=False, default=None):
+        graph = self.graph
+        length = graph.number_of_edges()
+        edge_u = np.repeat(graph.node_ids, np.diff(graph.indptr)).tolist()
+        edge_v = graph.node_ids[graph.edge_v].tolist()
+        edges = [edge_u, edge_v]
+        if keys:
+            edges.append(decode_column(graph.edge_keys, graph.arrays, 'edge_keys'))
+        if data is True:
+            edges.append(decode_columns(graph.edge_columns, graph.arrays, 'edge', length))
+        elif data is not False:
+            edges.append(graph.attribute_values(graph.edge_columns, 'edge', length, data, default))
+        edges = zip(*edges)
+        if nbunch is not None:
+            nbunch = set([nbunch] if nbunch in graph else nbunch)
+            edges = (edge for edge in edges if edge[0] in nbunch)
+        return edges
+
+    def __getitem__(self, edge):
+        u, v, key = edge
+        data = self.graph.get_edge_data(u, v, key=key)
+        if data is None:
+            raise KeyError(edge)
+        return data
+
+    def __iter__(self):
+        return iter(self())
+
+    def __len__(self):
+        return self.graph.number_of_edges()
+
+
+def load_array(path):
+    """
+    Memory-map a .npy file read-only, or load it if it is empty, as empty
+    files cannot be mapped.
+
+    Parameters
+    ----------
+    path : string
+        the path of the file
+
+    Returns
+    -------
+    numpy.ndarray
+        the mapped array, viewed as a plain ndarray over the same memory to
+        skip numpy.memmap's indexing overhead
+    """
+    try:
+        return np.load(path, mmap_mode='r', allow_pickle=False).view(np.ndarray)
+    except ValueError:
+        return np.load(path, allow_pickle=False)
+
+
+def save_graph_mapped(G, filename='graph_mapped', folder=None):
+    """
+    Save graph to disk as a directory of .npy arrays that load_graph_mapped
+    can memory-map, for many processes to share one read-only copy of it.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+        a graph with integer node ids
+    filename : string
+        the name of the directory to save the arrays in
+    folder : string
+        the folder to contain the directory, if None, use default data folder
+
+    Returns
+    -------
+    None
+    """
+    start_time = time.time()
+    if folder is None:
+        folder = settings.data_folder
+    path = os.path.join(folder, filename)
+
+    nodes = list(G.nodes())
+    node_ids = np.array(nodes)
+    if len(nodes) > 0 and node_ids.dtype.kind not in 'iu':
+        raise ValueError('save_graph_mapped needs integer node ids')
+    node_ids = node_ids.astype(np.int64)
+    node_positions = {node: i for i, node in enumerate(nodes)}
+    node_order = np.argsort(node_ids, kind='stable')
+    arrays = {'node_ids': node_ids,
+              'sorted_node_ids': node_ids[node_order],
+              'node_order': node_order.astype(np.int64)}
+
+    # G.edges lists each node's out-edges together, in node order, which is
+    # the CSR layout
+    edges = list(G.edges(keys=True, data=True))
+    out_degrees = [degree for _, degree in G.out_degree(nodes)]
+    arrays['indptr'] = np.concatenate([[0], np.cumsum(out_degrees)]).astype(np.int64)
+    arrays['edge_v'] = np.array([node_positions[v] for _, v, _, _ in edges], dtype=np.int64)
+
+    meta = {'format': MAPPED_GRAPH_FORMAT,
+            'graph': encode_graph_attributes(G.graph, arrays),
+            'nodes': encode_columns([data for _, data in G.nodes(data=True)], arrays, 'node', random_access=True),
+            'edge_keys': encode_column([key for _, _, key, _ in edges], arrays, 'edge_keys', random_access=True),
+            'edges': encode_columns([data for _, _, _, data in edges], arrays, 'edge', random_access=True)}
+
+    # remove the arrays of any graph saved here before
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for filename in os.listdir(path):
+        if filename.endswith('.npy'):
+            os.remove(os.path.join(path, filename))
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    log('Saved graph "{}" to disk as memory-mappable arrays at "{}" in {:,.2f} seconds'.format(G.name, path, time.time()-start_time))
+
+
+def load_graph_mapped(filename='graph_mapped', folder=None):
+    """
+    Memory-map a graph saved by save_graph_mapped, read-only.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the directory the arrays were saved in
+    folder : string
+        the folder containing the directory, if None, use default data folder
+
+    Returns
+    -------
+    MappedGraph
+    """
+    if folder is None:
+        folder = settings.data_folder
+    return MappedGraph(os.path.join(folder, filename))
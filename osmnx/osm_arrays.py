@@ -0,0 +1,496 @@
+################################################################################
+# Module: osm_arrays.py
+# Description: Collect OSM nodes and ways into flat arrays and build networkx
+#              graphs from them in bulk
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+from array import array
+from itertools import groupby
+from xml.etree.ElementTree import iterparse
+import networkx as nx
+import numpy as np
+
+from . import settings
+from .downloader import parse_osm_filter
+from .utils import great_circle_vec
+from .utils import open_osm_file
+
+
+class OSMArrays(object):
+    """
+    Flat, array-backed store of OSM nodes and ways, for building a graph in
+    bulk.
+
+    Node ids and coordinates, way ids and node lists are appended to compact
+    typed arrays as the elements are added. The values of the useful tags
+    (by default settings.useful_tags_node and settings.useful_tags_path) are
+    stored as integer codes into a shared table of values, -1 for untagged. Every edge's
+    endpoints and great circle length are then computed in one vectorized
+    pass, and the graph is created with bulk add_nodes_from and add_edges_from
+    calls.
+
+    Elements are deduplicated by id when building the graph: each node or way
+    keeps the position of its first appearance and the data of its last one.
+
+    Parameters
+    ----------
+    useful_tags_node : list
+        the node tags to keep, if None use settings.useful_tags_node
+    useful_tags_path : list
+        the way tags to keep, if None use settings.useful_tags_path
+    """
+
+    def __init__(self, useful_tags_node=None, useful_tags_path=None):
+        if useful_tags_node is None:
+            useful_tags_node = settings.useful_tags_node
+        if useful_tags_path is None:
+            useful_tags_path = settings.useful_tags_path
+        self.useful_tags_node = list(useful_tags_node)
+        self.useful_tags_path = list(useful_tags_path)
+
+        self.node_ids = array('q')
+        self.node_lat = array('d')
+        self.node_lon = array('d')
+        self.node_tags = {tag: array('q') for tag in self.useful_tags_node}
+
+        self.way_ids = array('q')
+        self.way_offsets = array('q', [0])
+        self.way_nodes = array('q')
+        self.way_tags = {tag: array('q') for tag in self.useful_tags_path}
+
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.node_ids) + len(self.way_ids)
+
+    def encode(self, value):
+        """
+        Return the code of a tag value in the table of values, adding it to
+        the table if it is not there yet.
+
+        Parameters
+        ----------
+        value : string
+            the tag value
+
+        Returns
+        -------
+        int
+        """
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def add_node(self, osmid, lat, lon, tags=None):
+        """
+        Add an OSM node.
+
+        Parameters
+        ----------
+        osmid : int
+            the node's OSM id
+        lat : float
+            the node's latitude
+        lon : float
+            the node's longitude
+        tags : dict
+            the node's tags
+
+        Returns
+        -------
+        None
+        """
+        self.node_ids.append(osmid)
+        self.node_lat.append(lat)
+        self.node_lon.append(lon)
+        for tag, codes in self.node_tags.items():
+            codes.append(self.encode(tags[tag]) if tags and tag in tags else -1)
+
+    def add_way(self, osmid, nodes, tags=None):
+        """
+        Add an OSM way.
+
+        Parameters
+        ----------
+        osmid : int
+            the way's OSM id
+        nodes : list
+            the OSM ids of the way's nodes, in order
+        tags : dict
+            the way's tags
+
+        Returns
+        -------
+        None
+        """
+        # remove any consecutive duplicate elements in the list of nodes
+        self.way_ids.append(osmid)
+        self.way_nodes.extend(node for node, _ in groupby(nodes))
+        self.way_offsets.append(len(self.way_nodes))
+        for tag, codes in self.way_tags.items():
+            codes.append(self.encode(tags[tag]) if tags and tag in tags else -1)
+
+    def add_element(self, element):
+        """
+        Add an element of an Overpass API JSON response, ignoring any that is
+        not a node or a way.
+
+        Parameters
+        ----------
+        element : dict
+            the element
+
+        Returns
+        -------
+        None
+        """
+        if element['type'] == 'node':
+            self.add_node(element['id'], element['lat'], element['lon'], element.get('tags'))
+        elif element['type'] == 'way': #osm calls network paths 'ways'
+            self.add_way(element['id'], element['nodes'], element.get('tags'))
+
+    def extend(self, other):
+        """
+        Append all the nodes and ways of another OSMArrays, translating its
+        tag value codes into this one's table of values.
+
+        Parameters
+        ----------
+        other : OSMArrays
+            the nodes and ways to append
+
+        Returns
+        -------
+        None
+        """
+        # map each of the other's codes to a code in this table, with -1
+        # (untagged) mapping to itself as the last entry
+        code_map = np.array([self.encode(value) for value in other.values] + [-1], dtype=np.int64)
+
+        def translate(codes, count):
+            if codes is None:
+                return array('q', [-1]) * count
+            return array('q', code_map[np.array(codes, dtype=np.int64)].tolist())
+
+        self.node_ids.extend(other.node_ids)
+        self.node_lat.extend(other.node_lat)
+        self.node_lon.extend(other.node_lon)
+        for tag, codes in self.node_tags.items():
+            codes.extend(translate(other.node_tags.get(tag), len(other.node_ids)))
+
+        offset = len(self.way_nodes)
+        self.way_ids.extend(other.way_ids)
+        self.way_nodes.extend(other.way_nodes)
+        self.way_offsets.extend(array('q', (np.array(other.way_offsets[1:], dtype=np.int64) + offset).tolist()))
+        for tag, codes in self.way_tags.items():
+            codes.extend(translate(other.way_tags.get(tag), len(other.way_ids)))
+
+    def remove_unused_nodes(self):
+        """
+        Remove the nodes that no way references.
+
+        Returns
+        -------
+        None
+        """
+        used = np.isin(np.array(self.node_ids, dtype=np.int64), np.array(self.way_nodes, dtype=np.int64))
+        self.node_ids = array('q', np.array(self.node_ids, dtype=np.int64)[used].tolist())
+        self.node_lat = array('d', np.array(self.node_lat)[used].tolist())
+        self.node_lon = array('d', np.array(self.node_lon)[used].tolist())
+        self.node_tags = {tag: array('q', np.array(codes, dtype=np.int64)[used].tolist())
+                          for tag, codes in self.node_tags.items()}
+
+    def get_tags(self, tags, codes, index):
+        """
+        Decode the tags of one node or way into a dict.
+
+        Parameters
+        ----------
+        tags : list
+            the names of the tags, in the order to add them to the dict
+        codes : dict
+            list of value codes for each tag name
+        index : int
+            the position of the node or way
+
+        Returns
+        -------
+        dict
+        """
+        data = {}
+        for tag in tags:
+            code = codes[tag][index]
+            if code >= 0:
+                data[tag] = self.values[code]
+        return data
+
+    def build_graph(self, name='unnamed', bidirectional=False):
+        """
+        Build a networkx graph of all the nodes and ways added so far, with
+        the length of each edge as the great circle distance between its
+        nodes.
+
+        Parameters
+        ----------
+        name : string
+            the name of the graph
+        bidirectional : bool
+            if True, create bidirectional edges for one-way streets
+
+        Returns
+        -------
+        networkx multidigraph
+        """
+        G = nx.MultiDiGraph(name=name, crs=settings.default_crs)
+
+        # deduplicate the nodes, then add them in the order they first appeared
+        node_ids, node_first, node_last = deduplicate(self.node_ids)
+        node_lat = np.array(self.node_lat)[node_last]
+        node_lon = np.array(self.node_lon)[node_last]
+        node_codes = {tag: np.array(codes, dtype=np.int64)[node_last] for tag, codes in self.node_tags.items()}
+        order = np.argsort(node_first, kind='stable')
+        nodes = [(osmid, {'y': lat, 'x': lon, 'osmid': osmid})
+                 for osmid, lat, lon in zip(node_ids[order].tolist(), node_lat[order].tolist(), node_lon[order].tolist())]
+
+        # most nodes have none of the useful tags, so only look up the tags of
+        # those that have any
+        if node_codes:
+            tagged = np.flatnonzero(np.any([codes[order] >= 0 for codes in node_codes.values()], axis=0))
+            node_codes = {tag: codes[order].tolist() for tag, codes in node_codes.items()}
+            for i in tagged.tolist():
+                nodes[i][1].update(self.get_tags(self.useful_tags_node, node_codes, i))
+        G.add_nodes_from(nodes)
+
+        # deduplicate the ways and put them in the order they first appeared
+        way_ids, way_first, way_last = deduplicate(self.way_ids)
+        order = np.argsort(way_first, kind='stable')
+        way_ids = way_ids[order]
+        ways = way_last[order]
+        way_codes = {tag: np.array(codes, dtype=np.int64)[ways] for tag, codes in self.way_tags.items()}
+
+        # determine which ways are one-way, and which of those run against the
+        # order of their nodes
+        one_way, reverse = self.get_one_way(way_codes, len(ways), bidirectional)
+
+        # gather all the ways' nodes, reversing the ways that run backwards
+        offsets = np.array(self.way_offsets, dtype=np.int64)
+        starts = offsets[ways]
+        lengths = offsets[ways + 1] - starts
+        ends = np.cumsum(lengths)
+        way_index = np.repeat(np.arange(len(ways)), lengths)
+        position = np.arange(len(way_index)) - np.repeat(ends - lengths, lengths)
+        position = np.where(reverse[way_index], lengths[way_index] - 1 - position, position)
+        path_nodes = np.array(self.way_nodes, dtype=np.int64)[starts[way_index] + position]
+
+        # every pair of consecutive nodes within a way is an edge. the edges of
+        # two-way ways are added again in the opposite direction, after all of
+        # the way's edges in its own direction
+        is_last = np.zeros(len(path_nodes), dtype=bool)
+        is_last[ends[lengths > 0] - 1] = True
+        is_edge = ~is_last[:-1]
+        forward_u = path_nodes[:-1][is_edge]
+        forward_v = path_nodes[1:][is_edge]
+        forward_way = way_index[:-1][is_edge]
+        two_way = ~one_way[forward_way]
+        u = np.concatenate([forward_u, forward_v[two_way]])
+        v = np.concatenate([forward_v, forward_u[two_way]])
+        edge_way = np.concatenate([forward_way, forward_way[two_way]])
+        backward = np.concatenate([np.zeros(len(forward_way), dtype=bool), np.ones(two_way.sum(), dtype=bool)])
+        order = np.lexsort((backward, edge_way))
+        u, v, edge_way = u[order], v[order], edge_way[order]
+
+        # calculate the great circle length of every edge at once, rounded to
+        # the millimeter, with zero for any edge whose nodes are missing
+        u_lat, u_lon = lookup_coords(node_ids, node_lat, node_lon, u)
+        v_lat, v_lon = lookup_coords(node_ids, node_lat, node_lon, v)
+        edge_lengths = great_circle_vec(lat1=u_lat, lng1=u_lon, lat2=v_lat, lng2=v_lon)
+        edge_lengths = np.round(np.nan_to_num(edge_lengths, nan=0), 3)
+
+        # add the edges with the attributes of their ways
+        way_codes = {tag: codes.tolist() for tag, codes in way_codes.items()}
+        way_data = [self.way_data(osmid, way_codes, i, one_way[i]) for i, osmid in enumerate(way_ids.tolist())]
+        G.add_edges_from((origin, destination, dict(way_data[way], length=length))
+                         for origin, destination, way, length in zip(u.tolist(), v.tolist(), edge_way.tolist(),
+                                                                     edge_lengths.tolist()))
+        return G
+
+    def way_data(self, osmid, codes, index, one_way):
+        """
+        Assemble the attributes shared by all the edges of a way.
+
+        Parameters
+        ----------
+        osmid : int
+            the way's OSM id
+        codes : dict
+            list of value codes for each useful path tag
+        index : int
+            the way's position in codes
+        one_way : bool
+            if the way is one-way
+
+        Returns
+        -------
+        dict
+        """
+        data = {'osmid': osmid}
+        data.update(self.get_tags(self.useful_tags_path, codes, index))
+
+        # set the oneway attribute to make it consistent True/False values, but
+        # only do this if you aren't forcing all edges to oneway with the
+        # all_oneway setting. With the all_oneway setting, you likely still
+        # want to preserve the original OSM oneway attribute.
+        if not settings.all_oneway:
+            data['oneway'] = bool(one_way)
+        return data
+
+    def get_one_way(self, codes, count, bidirectional):
+        """
+        Determine which ways are one-way, and which of those run in the
+        reverse direction of their nodes' order.
+
+        Parameters
+        ----------
+        codes : dict
+            numpy array of value codes for each useful path tag
+        count : int
+            the number of ways
+        bidirectional : bool
+            if True, create bidirectional edges for one-way streets
+
+        Returns
+        -------
+        one_way, reverse : tuple
+            boolean numpy arrays
+        """
+        no_ways = np.zeros(count, dtype=bool)
+
+        def has_value(tag, values):
+            if tag not in codes:
+                return no_ways
+            value_codes = [self._codes[value] for value in values if value in self._codes]
+            return np.isin(codes[tag], value_codes)
+
+        if settings.all_oneway is True:
+            return ~no_ways, no_ways
+        elif bidirectional:
+            return no_ways, no_ways
+
+        # the list of values OSM uses in its 'oneway' tag to denote True. paths
+        # with a one-way value of -1 are one-way, but in the reverse direction
+        # of the nodes' order, see osm documentation. roundabouts are also
+        # oneway but not tagged as is
+        tagged_one_way = has_value('oneway', ['yes', 'true', '1', '-1'])
+        reverse = has_value('oneway', ['-1'])
+        one_way = tagged_one_way | has_value('junction', ['roundabout'])
+        return one_way, reverse
+
+
+def osm_arrays_from_file(filename, osm_filter=None, remove_unused_nodes=True,
+                         useful_tags_node=None, useful_tags_path=None):
+    """
+    Read OSM XML from input filename straight into flat node and way arrays.
+
+    Faster than overpass_json_from_file's SAX handler, and uses flat memory
+    however large the file is: elements are parsed incrementally with
+    iterparse, added to the arrays as each one ends, and then cleared.
+
+    Parameters
+    ----------
+    filename : string
+        name of file containing OSM XML data, optionally compressed as .bz2
+        or .gz
+    osm_filter : string
+        if not None, an Overpass QL filter like 'way["highway"]' plus the
+        filter get_osm_filter returns for a network type: keep only the ways
+        that pass it, and the nodes they reference
+    remove_unused_nodes : bool
+        if True and filtering the ways, remove the nodes no remaining way
+        references. pass False when the nodes may be referenced by ways in
+        other files
+    useful_tags_node : list
+        the node tags to keep, if None use settings.useful_tags_node
+    useful_tags_path : list
+        the way tags to keep, if None use settings.useful_tags_path
+
+    Returns
+    -------
+    OSMArrays
+    """
+    way_filter = parse_osm_filter(osm_filter) if osm_filter else None
+    osm_arrays = OSMArrays(useful_tags_node=useful_tags_node, useful_tags_path=useful_tags_path)
+    with open_osm_file(filename) as file:
+        context = iterparse(file, events=('start', 'end'))
+        _, root = next(context)
+        for event, element in context:
+            if event != 'end':
+                continue
+            if element.tag == 'node':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                osm_arrays.add_node(int(element.get('id')), float(element.get('lat')), float(element.get('lon')), tags)
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                if way_filter is None or way_filter(tags):
+                    osm_arrays.add_way(int(element.get('id')), [int(nd.get('ref')) for nd in element.iter('nd')], tags)
+            elif element.tag != 'relation':
+                continue
+
+            # drop the finished element (and anything before it) from the tree
+            root.clear()
+
+    if way_filter is not None and remove_unused_nodes:
+        osm_arrays.remove_unused_nodes()
+    return osm_arrays
+
+
+def deduplicate(ids):
+    """
+    Find the unique values of an array of OSM ids, and the positions where
+    each first and last appears.
+
+    Parameters
+    ----------
+    ids : array
+        the OSM ids
+
+    Returns
+    -------
+    unique_ids, first, last : tuple
+        numpy arrays, with unique_ids sorted
+    """
+    ids = np.array(ids, dtype=np.int64)
+    unique_ids, first = np.unique(ids, return_index=True)
+    _, last = np.unique(ids[::-1], return_index=True)
+    return unique_ids, first, len(ids) - 1 - last
+
+
+def lookup_coords(unique_ids, lat, lon, ids):
+    """
+    Look up the coordinates of nodes by OSM id.
+
+    Parameters
+    ----------
+    unique_ids : numpy array
+        the sorted OSM ids of all the nodes
+    lat : numpy array
+        the nodes' latitudes
+    lon : numpy array
+        the nodes' longitudes
+    ids : numpy array
+        the OSM ids of the nodes to look up
+
+    Returns
+    -------
+    lat, lon : tuple
+        numpy arrays, with nan for ids that are not in unique_ids
+    """
+    if len(unique_ids) == 0:
+        return np.full(len(ids), np.nan), np.full(len(ids), np.nan)
+    index = np.minimum(np.searchsorted(unique_ids, ids), len(unique_ids) - 1)
+    found = unique_ids[index] == ids
+    return np.where(found, lat[index], np.nan), np.where(found, lon[index], np.nan)
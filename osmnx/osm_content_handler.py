@@ -8,10 +8,18 @@ class OSMContentHandler(xml.sax.handler.ContentHandler):
     Used to build an Overpass-like response JSON object in self.object. For format
     notes, see http://wiki.openstreetmap.org/wiki/OSM_XML#OSM_XML_file_format_notes
     and http://overpass-api.de/output_formats.html#json
+
+    Tags can be whitelisted separately for nodes and ways, and ways can be
+    filtered by their tags while parsing, like the Overpass API does with the
+    filters from get_osm_filter. When ways are filtered, only the nodes the
+    remaining ways reference are kept. Relations are kept with their members
+    and all their tags.
     """
 
-    def __init__(self):
+    def __init__(self, useful_tags_node=None, useful_tags_path=None, way_filter=None):
         self._element = None
+        self._useful_tags = {'node': useful_tags_node, 'way': useful_tags_path, 'relation': None}
+        self._way_filter = way_filter
         self.object = {'elements': []}
 
     def startElement(self, name, attrs):
@@ -19,8 +27,12 @@ class OSMContentHandler(xml.sax.handler.ContentHandler):
             self.object.update({k: attrs[k] for k in attrs.keys()
                                 if k in ('version', 'generator')})
 
-        elif name in ('node', 'way'):
-            self._element = dict(type=name, tags={}, nodes=[], **attrs)
+        elif name in ('node', 'way', 'relation'):
+            self._element = dict(type=name, tags={}, **attrs)
+            if name == 'relation':
+                self._element['members'] = []
+            else:
+                self._element['nodes'] = []
             self._element.update({k: float(attrs[k]) for k in attrs.keys()
                                   if k in ('lat', 'lon')})
             self._element.update({k: int(attrs[k]) for k in attrs.keys()
@@ -32,11 +44,30 @@ class OSMContentHandler(xml.sax.handler.ContentHandler):
         elif name == 'nd':
             self._element['nodes'].append(int(attrs['ref']))
 
-        elif name == 'relation':
-            # Placeholder for future relation support.
-            # Look for nested members and tags.
-            pass
+        elif name == 'member':
+            self._element['members'].append({'type': attrs['type'],
+                                             'ref': int(attrs['ref']),
+                                             'role': attrs.get('role', '')})
 
     def endElement(self, name):
-        if name in ('node', 'way'):
-            self.object['elements'].append(self._element)
+        if name in ('node', 'way', 'relation'):
+            element = self._element
+            if name == 'way' and self._way_filter is not None and not self._way_filter(element['tags']):
+                return
+
+            # keep only the whitelisted tags, once the way filter has seen them all
+            useful_tags = self._useful_tags[name]
+            if useful_tags is not None:
+                element['tags'] = {k: v for k, v in element['tags'].items() if k in useful_tags}
+            self.object['elements'].append(element)
+
+    def endDocument(self):
+        if self._way_filter is not None:
+            # like the Overpass API's recurse down, keep only the nodes of the
+            # ways that passed the filter
+            way_nodes = set()
+            for element in self.object['elements']:
+                if element['type'] == 'way':
+                    way_nodes.update(element['nodes'])
+            self.object['elements'] = [element for element in self.object['elements']
+                                       if element['type'] != 'node' or element['id'] in way_nodes]
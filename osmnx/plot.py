@@ -1011,11 +1011,11 @@ def plot_figure_ground(G=None, address=None, point=None, dist=805,
     elif address is not None:
         G, point = graph_from_address(address, distance=dist*multiplier, distance_type='bbox', network_type=network_type,
                                       simplify=False, truncate_by_edge=True, return_coords=True)
-        G = simplify_graph(G, strict=False)
+        G = simplify_graph(G, strict=False, inplace=True)
     elif point is not None:
         G = graph_from_point(point, distance=dist*multiplier, distance_type='bbox', network_type=network_type,
                              simplify=False, truncate_by_edge=True)
-        G = simplify_graph(G, strict=False)
+        G = simplify_graph(G, strict=False, inplace=True)
     else:
         raise ValueError('You must pass an address or lat-long point or graph.')
 
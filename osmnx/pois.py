@@ -15,7 +15,8 @@ from shapely.geometry import Polygon
 from . import settings
 from .core import bbox_from_point
 from .core import gdf_from_place
-from .core import overpass_request
+from .downloader import overpass_request
+from .downloader import parse_osm_filter
 from .geo_utils import geocode, bbox_to_poly
 from .utils import log
 
@@ -108,6 +109,44 @@ def osm_poi_download(polygon=None, amenities=None, north=None, south=None, east=
     return responses
 
 
+def filter_poi_response(response, amenities=None):
+    """
+    Keep only the elements of an Overpass-like response json that the query
+    from parse_poi_query would have returned: the nodes, ways and relations
+    tagged with the amenities, the member ways of those relations, and the
+    nodes of all those ways.
+
+    Parameters
+    ----------
+    response : dict
+        Overpass-like response json, for example from overpass_json_from_file
+    amenities : list
+        List of amenities to keep, if None keep all amenities
+
+    Returns
+    -------
+    dict
+    """
+    if amenities:
+        amenity_filter = parse_osm_filter('["amenity"~"{}"]'.format('|'.join(amenities)))
+    else:
+        amenity_filter = parse_osm_filter('["amenity"]')
+
+    elements = response['elements']
+    is_poi = [amenity_filter(element.get('tags', {})) for element in elements]
+    member_ways = set(member['ref'] for element, poi in zip(elements, is_poi) if poi and element['type'] == 'relation'
+                      for member in element['members'] if member['type'] == 'way')
+    keep = [poi or (element['type'] == 'way' and element['id'] in member_ways)
+            for element, poi in zip(elements, is_poi)]
+    way_nodes = set(node for element, kept in zip(elements, keep) if kept and element['type'] == 'way'
+                    for node in element['nodes'])
+
+    filtered = dict(response)
+    filtered['elements'] = [element for element, kept in zip(elements, keep)
+                            if kept or (element['type'] == 'node' and element['id'] in way_nodes)]
+    return filtered
+
+
 def parse_nodes_coords(osm_response):
     """
     Parse node coordinates from OSM response. Some nodes are
@@ -249,7 +288,7 @@ def parse_osm_relations(relations, osm_way_df):
 
     # Iterate over relations and extract the items
     for relation in relations:
-        if relation['tags']['type'] == 'multipolygon':
+        if relation.get('tags', {}).get('type') == 'multipolygon':
             try:
                 # Parse member 'way' ids
                 member_way_ids = [member['ref'] for member in relation['members'] if member['type'] == 'way']
@@ -287,7 +326,7 @@ def parse_osm_relations(relations, osm_way_df):
     return osm_way_df
 
 
-def create_poi_gdf(polygon=None, amenities=None, north=None, south=None, east=None, west=None):
+def create_poi_gdf(polygon=None, amenities=None, north=None, south=None, east=None, west=None, response=None):
     """
     Parse GeoDataFrames from POI json that was returned by Overpass API.
 
@@ -306,13 +345,20 @@ def create_poi_gdf(polygon=None, amenities=None, north=None, south=None, east=No
         eastern longitude of bounding box
     west : float
         western longitude of bounding box
+    response : dict
+        an Overpass-like response json, for example from
+        overpass_json_from_file, to take the POIs from instead of downloading
+        them
 
     Returns
     -------
     Geopandas GeoDataFrame with POIs and the associated attributes.
     """
 
-    responses = osm_poi_download(polygon=polygon, amenities=amenities, north=north, south=south, east=east, west=west)
+    if response is None:
+        responses = osm_poi_download(polygon=polygon, amenities=amenities, north=north, south=south, east=east, west=west)
+    else:
+        responses = filter_poi_response(response, amenities=amenities)
 
     # Parse coordinates from all the nodes in the response
     coords = parse_nodes_coords(responses)
@@ -327,7 +373,7 @@ def create_poi_gdf(polygon=None, amenities=None, north=None, south=None, east=No
     relations = []
 
     for result in responses['elements']:
-        if result['type'] == 'node' and 'tags' in result:
+        if result['type'] == 'node' and result.get('tags'):
             poi = parse_osm_node(response=result)
             # Add element_type
             poi['element_type'] = 'node'
@@ -7,14 +7,20 @@
 
 import time
 import math
-import geopandas as gpd
-import networkx as nx
+from functools import lru_cache
+
+import numpy as np
 from pyproj import CRS
-from shapely.geometry import Point
+from pyproj import Transformer
+from shapely.geometry import LineString
+from shapely.ops import transform
 
 from . import settings
 from .utils import log
 
+# the number of distinct crs inputs and (source, target) crs pairs whose pyproj
+# CRS and Transformer objects are kept for reuse
+PROJECTION_CACHE_SIZE = 256
 
 
 def is_crs_utm(crs):
@@ -33,13 +39,207 @@ def is_crs_utm(crs):
     """
     if not crs:
         return False
-    crs_obj = CRS.from_user_input(crs)
+    crs_obj = get_crs(crs)
     if crs_obj.coordinate_operation and crs_obj.coordinate_operation.name.upper().startswith('UTM'):
         return True
     return False
 
 
 
+def get_utm_crs(longitude):
+    """
+    Get the proj string of the UTM zone containing a longitude.
+
+    Parameters
+    ----------
+    longitude : float
+        the longitude in decimal degrees
+
+    Returns
+    -------
+    string
+    """
+    utm_zone = int(math.floor((longitude + 180) / 6.) + 1)
+    return '+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs'.format(utm_zone)
+
+
+
+def crs_key(crs):
+    """
+    Get a hashable key that identifies a coordinate reference system, as
+    passed in, for the projection caches.
+
+    Parameters
+    ----------
+    crs : dict or string or int or pyproj.CRS
+        a coordinate reference system
+
+    Returns
+    -------
+    hashable
+    """
+    if isinstance(crs, CRS):
+        return crs.srs
+    if isinstance(crs, dict):
+        return tuple(sorted(crs.items()))
+    return crs
+
+
+@lru_cache(maxsize=PROJECTION_CACHE_SIZE)
+def _cached_crs(key):
+    return CRS.from_user_input(dict(key) if isinstance(key, tuple) else key)
+
+
+@lru_cache(maxsize=PROJECTION_CACHE_SIZE)
+def _cached_transformer(key, to_key):
+    return Transformer.from_crs(_cached_crs(key), _cached_crs(to_key), always_xy=True)
+
+
+def get_crs(crs):
+    """
+    Get the pyproj CRS of a coordinate reference system, built once and then
+    reused from a least recently used cache.
+
+    Parameters
+    ----------
+    crs : dict or string or int or pyproj.CRS
+        a coordinate reference system
+
+    Returns
+    -------
+    pyproj.CRS
+    """
+    if isinstance(crs, CRS):
+        return crs
+    return _cached_crs(crs_key(crs))
+
+
+def get_transformer(crs, to_crs):
+    """
+    Get a pyproj Transformer from one coordinate reference system to another,
+    with x/y (lng/lat) axis order. Transformers are built once per (crs,
+    to_crs) pair and then reused from a least recently used cache, so batch
+    jobs that project many places do not rebuild them for every geometry.
+
+    Parameters
+    ----------
+    crs : dict or string or int or pyproj.CRS
+        the coordinate reference system to transform from
+    to_crs : dict or string or int or pyproj.CRS
+        the coordinate reference system to transform to
+
+    Returns
+    -------
+    pyproj.Transformer
+    """
+    return _cached_transformer(crs_key(crs), crs_key(to_crs))
+
+
+def clear_projection_cache():
+    """
+    Empty the caches of CRS and Transformer objects.
+
+    Returns
+    -------
+    None
+    """
+    _cached_transformer.cache_clear()
+    _cached_crs.cache_clear()
+
+
+def get_points_crs(x, y, crs, to_crs=None):
+    """
+    Get the coordinate reference system to project points to: to_crs if
+    passed in, else crs if it is already UTM, else the UTM zone of the
+    centroid of the distinct points.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        the points' x coordinates
+    y : numpy.ndarray
+        the points' y coordinates
+    crs : dict or string or pyproj.CRS
+        the points' coordinate reference system
+    to_crs : dict or string or pyproj.CRS
+        if not None, just project to this CRS instead of to UTM
+
+    Returns
+    -------
+    pyproj.CRS
+    """
+    if to_crs is not None:
+        return get_crs(to_crs)
+    if is_crs_utm(crs):
+        return get_crs(crs)
+    avg_longitude = np.unique(np.column_stack([x, y]), axis=0)[:, 0].mean()
+    return get_crs(get_utm_crs(avg_longitude))
+
+
+def transform_geometries(geometries, transformer):
+    """
+    Transform a list of geometries with a pyproj Transformer, passing the
+    coordinates of all the 2d LineStrings to it in one call.
+
+    Parameters
+    ----------
+    geometries : list
+        shapely geometries
+    transformer : pyproj.Transformer
+        the transformer, with x/y axis order
+
+    Returns
+    -------
+    list
+        the transformed geometries, in the same order
+    """
+    transformed = list(geometries)
+    positions = []
+    coords = []
+    for i, geometry in enumerate(geometries):
+        if isinstance(geometry, LineString) and not geometry.has_z:
+            positions.append(i)
+            coords.append(np.asarray(geometry.coords))
+        else:
+            transformed[i] = transform(transformer.transform, geometry)
+
+    # transform the lines' coordinates end to end, then split them back up
+    if coords:
+        offsets = np.cumsum([len(line_coords) for line_coords in coords])[:-1]
+        coords = np.concatenate(coords)
+        coords = np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+        for i, line_coords in zip(positions, np.split(coords, offsets)):
+            transformed[i] = LineString(line_coords)
+    return transformed
+
+
+def transform_gdf(gdf, to_crs):
+    """
+    Transform a GeoDataFrame's geometries to a coordinate reference system
+    with a cached transformer, like GeoDataFrame.to_crs.
+
+    Parameters
+    ----------
+    gdf : GeoDataFrame
+        the gdf to transform, with its crs set
+    to_crs : dict or string or int or pyproj.CRS
+        the coordinate reference system to transform to
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    crs = get_crs(gdf.crs)
+    to_crs = get_crs(to_crs)
+    transformed_gdf = gdf.copy()
+    if not crs.is_exact_same(to_crs):
+        transformer = get_transformer(crs, to_crs)
+        transformed_gdf[gdf.geometry.name] = [None if geometry is None else transform(transformer.transform, geometry)
+                                              for geometry in gdf.geometry]
+    transformed_gdf.crs = to_crs
+    return transformed_gdf
+
+
 def project_geometry(geometry, crs=None, to_crs=None, to_latlong=False):
     """
     Project a shapely Polygon or MultiPolygon from lat-long to UTM, or
@@ -68,14 +268,20 @@ def project_geometry(geometry, crs=None, to_crs=None, to_latlong=False):
     if crs is None:
         crs = settings.default_crs
 
-    gdf = gpd.GeoDataFrame()
-    gdf.crs = crs
-    gdf.gdf_name = 'geometry to project'
-    gdf['geometry'] = None
-    gdf.loc[0, 'geometry'] = geometry
-    gdf_proj = project_gdf(gdf, to_crs=to_crs, to_latlong=to_latlong)
-    geometry_proj = gdf_proj['geometry'].iloc[0]
-    return geometry_proj, gdf_proj.crs
+    if to_crs is None:
+        if to_latlong:
+            to_crs = settings.default_crs
+        elif is_crs_utm(crs):
+            # if the geometry is already in UTM, just return it
+            return geometry, get_crs(crs)
+        else:
+            to_crs = get_utm_crs(geometry.centroid.x)
+
+    crs = get_crs(crs)
+    to_crs = get_crs(to_crs)
+    if not crs.is_exact_same(to_crs):
+        geometry = transform(get_transformer(crs, to_crs).transform, geometry)
+    return geometry, to_crs
 
 
 def project_gdf(gdf, to_crs=None, to_latlong=False):
@@ -109,7 +315,7 @@ def project_gdf(gdf, to_crs=None, to_latlong=False):
 
     # if to_crs was passed-in, use this value to project the gdf
     if to_crs is not None:
-        projected_gdf = gdf.to_crs(to_crs)
+        projected_gdf = transform_gdf(gdf, to_crs)
 
     # if to_crs was not passed-in, calculate the centroid of the geometry to
     # determine UTM zone
@@ -117,7 +323,7 @@ def project_gdf(gdf, to_crs=None, to_latlong=False):
         if to_latlong:
             # if to_latlong is True, project the gdf to latlong
             latlong_crs = settings.default_crs
-            projected_gdf = gdf.to_crs(latlong_crs)
+            projected_gdf = transform_gdf(gdf, latlong_crs)
             log('Projected the GeoDataFrame "{}" to default_crs in {:,.2f} seconds'.format(gdf.gdf_name, time.time()-start_time))
         else:
             # else, project the gdf to UTM
@@ -131,12 +337,11 @@ def project_gdf(gdf, to_crs=None, to_latlong=False):
 
             # calculate the UTM zone from this avg longitude and define the UTM
             # CRS to project
-            utm_zone = int(math.floor((avg_longitude + 180) / 6.) + 1)
-            utm_crs = '+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs'.format(utm_zone)
+            utm_crs = get_utm_crs(avg_longitude)
 
             # project the GeoDataFrame to the UTM CRS
-            projected_gdf = gdf.to_crs(utm_crs)
-            log('Projected the GeoDataFrame "{}" to UTM-{} in {:,.2f} seconds'.format(gdf.gdf_name, utm_zone, time.time()-start_time))
+            projected_gdf = transform_gdf(gdf, utm_crs)
+            log('Projected the GeoDataFrame "{}" to {} in {:,.2f} seconds'.format(gdf.gdf_name, utm_crs, time.time()-start_time))
 
     projected_gdf.gdf_name = gdf.gdf_name
     return projected_gdf
@@ -147,6 +352,10 @@ def project_graph(G, to_crs=None):
     Project a graph from lat-long to the UTM zone appropriate for its geographic
     location.
 
+    The nodes' x/y arrays and the coordinates of every edge geometry are each
+    transformed in one call to a single pyproj Transformer, and written back
+    onto a copy of the graph in place.
+
     Parameters
     ----------
     G : networkx multidigraph
@@ -158,77 +367,40 @@ def project_graph(G, to_crs=None):
     -------
     networkx multidigraph
     """
-
-    G_proj = G.copy()
+    assert len(G) > 0, 'You cannot project an empty graph.'
     start_time = time.time()
+    crs = get_crs(G.graph['crs'])
+    node_data = [data for _, data in G.nodes(data=True)]
+    x = np.array([data['x'] for data in node_data], dtype=float)
+    y = np.array([data['y'] for data in node_data], dtype=float)
 
-    # create a GeoDataFrame of the nodes, name it, convert osmid to str
-    nodes, data = zip(*G_proj.nodes(data=True))
-    gdf_nodes = gpd.GeoDataFrame(list(data), index=nodes)
-    gdf_nodes.crs = G_proj.graph['crs']
-    gdf_nodes.gdf_name = '{}_nodes'.format(G_proj.name)
-
-    # create new lat/lon columns just to save that data for later, and create a
-    # geometry column from x/y
-    gdf_nodes['lon'] = gdf_nodes['x']
-    gdf_nodes['lat'] = gdf_nodes['y']
-    gdf_nodes['geometry'] = gdf_nodes.apply(lambda row: Point(row['x'], row['y']), axis=1)
-    gdf_nodes.set_geometry('geometry', inplace=True)
-    log('Created a GeoDataFrame from graph in {:,.2f} seconds'.format(time.time()-start_time))
-
-    # project the nodes GeoDataFrame to UTM
-    gdf_nodes_utm = project_gdf(gdf_nodes, to_crs=to_crs)
-
-    # extract data for all edges that have geometry attribute
-    edges_with_geom = []
-    for u, v, key, data in G_proj.edges(keys=True, data=True):
-        if 'geometry' in data:
-            edges_with_geom.append({'u':u, 'v':v, 'key':key, 'geometry':data['geometry']})
-
-    # create an edges GeoDataFrame and project to UTM, if there were any edges
-    # with a geometry attribute. geom attr only exists if graph has been
-    # simplified, otherwise you don't have to project anything for the edges
-    # because the nodes still contain all spatial data
-    if len(edges_with_geom) > 0:
-        gdf_edges = gpd.GeoDataFrame(edges_with_geom)
-        gdf_edges.crs = G_proj.graph['crs']
-        gdf_edges.gdf_name = '{}_edges'.format(G_proj.name)
-        gdf_edges_utm = project_gdf(gdf_edges, to_crs=to_crs)
-
-    # extract projected x and y values from the nodes' geometry column
-    start_time = time.time()
-    gdf_nodes_utm['x'] = gdf_nodes_utm['geometry'].map(lambda point: point.x)
-    gdf_nodes_utm['y'] = gdf_nodes_utm['geometry'].map(lambda point: point.y)
-    gdf_nodes_utm = gdf_nodes_utm.drop('geometry', axis=1)
-    log('Extracted projected node geometries from GeoDataFrame in {:,.2f} seconds'.format(time.time()-start_time))
-
-    # clear the graph to make it a blank slate for the projected data
+    to_crs = get_points_crs(x, y, crs, to_crs)
+    G_proj = G.copy()
+    transformer = None if crs.is_exact_same(to_crs) else get_transformer(crs, to_crs)
+
+    # project the nodes' coordinates, keeping the originals as lon/lat
+    x_proj, y_proj = transformer.transform(x, y) if transformer else (x, y)
+    for data, lon, lat, x_node, y_node in zip(G_proj._node.values(), x.tolist(), y.tolist(),
+                                              np.asarray(x_proj).tolist(), np.asarray(y_proj).tolist()):
+        data['lon'] = lon
+        data['lat'] = lat
+        data['x'] = x_node
+        data['y'] = y_node
+    log('Projected {:,} nodes in {:,.2f} seconds'.format(len(G_proj), time.time()-start_time))
+
+    # project every edge geometry at once and reattach the new geometries to
+    # their edges by position. geometry only exists if the graph has been
+    # simplified, otherwise the nodes hold all the spatial data
     start_time = time.time()
-    edges = list(G_proj.edges(keys=True, data=True))
-    graph_name = G_proj.graph['name']
-    G_proj.clear()
-
-    # add the projected nodes and all their attributes to the graph
-    G_proj.add_nodes_from(gdf_nodes_utm.index)
-    attributes = gdf_nodes_utm.to_dict()
-    for label in gdf_nodes_utm.columns:
-        nx.set_node_attributes(G_proj, name=label, values=attributes[label])
-
-    # add the edges and all their attributes (including reconstructed geometry,
-    # when it exists) to the graph
-    for u, v, key, attributes in edges:
-        if 'geometry' in attributes:
-            row = gdf_edges_utm[(gdf_edges_utm['u']==u) & (gdf_edges_utm['v']==v) & (gdf_edges_utm['key']==key)]
-            attributes['geometry'] = row['geometry'].iloc[0]
-
-        # attributes dict contains key, so we don't need to explicitly pass it here
-        G_proj.add_edge(u, v, **attributes)
+    if transformer:
+        edge_data = [data for _, _, data in G_proj.edges(data=True) if 'geometry' in data]
+        geometries = transform_geometries([data['geometry'] for data in edge_data], transformer)
+        for data, geometry in zip(edge_data, geometries):
+            data['geometry'] = geometry
+        log('Projected {:,} edge geometries in {:,.2f} seconds'.format(len(edge_data), time.time()-start_time))
 
     # set the graph's CRS attribute to the new, projected CRS and return the
     # projected graph
-    G_proj.graph['crs'] = gdf_nodes_utm.crs
-    G_proj.graph['name'] = '{}_UTM'.format(graph_name)
-    if 'streets_per_node' in G.graph:
-        G_proj.graph['streets_per_node'] = G.graph['streets_per_node']
-    log('Rebuilt projected graph in {:,.2f} seconds'.format(time.time()-start_time))
+    G_proj.graph['crs'] = to_crs
+    G_proj.graph['name'] = '{}_UTM'.format(G.graph['name'])
     return G_proj
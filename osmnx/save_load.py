@@ -9,18 +9,26 @@ import re
 import time
 import os
 import ast
+import json
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
 from shapely.geometry import Point
+from pyproj import CRS
 from shapely.geometry import LineString
+from shapely.geometry.base import BaseGeometry
+from shapely import wkb
 from shapely import wkt
 from xml.etree import ElementTree as etree
 
 from . import settings
+from .projection import get_crs
 from .utils import make_str, log, get_unique_nodes_ordered_from_way
 
+# identifies files saved by save_graph_binary, and their layout version
+BINARY_GRAPH_FORMAT = 'osmnx-graph-binary-1'
+
 
 def save_gdf_shapefile(gdf, filename=None, folder=None):
     """
@@ -417,6 +425,491 @@ def load_graphml(filename, folder=None, node_type=int):
     return G
 
 
+def save_graph_binary(G, filename='graph.npz', folder=None, compress=False):
+    """
+    Save graph to disk in a columnar binary format, as numpy arrays in a .npz
+    file.
+
+    Each node and edge attribute is stored as one typed column rather than as
+    a string per value: numbers and booleans as numeric arrays, strings as one
+    utf-8 buffer, geometries as well-known binary, and lists (such as the
+    osmids of simplified edges) as a column of their elements. Columns that
+    mix types, and tuples and dicts, are stored as json with the types json
+    does not have recorded (see to_json_value), and other values raise a
+    ValueError. Load the graph with load_graph_binary.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    filename : string
+        the name of the file (including file extension)
+    folder : string
+        the folder to contain the file, if None, use default data folder
+    compress : bool
+        if True, compress the arrays in the file, which makes it smaller but
+        slower to save and load
+
+    Returns
+    -------
+    None
+    """
+    start_time = time.time()
+    if folder is None:
+        folder = settings.data_folder
+    arrays = {}
+
+    nodes = list(G.nodes())
+    node_positions = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(keys=True, data=True))
+    arrays['edge_u'] = np.array([node_positions[u] for u, _, _, _ in edges], dtype=np.int64)
+    arrays['edge_v'] = np.array([node_positions[v] for _, v, _, _ in edges], dtype=np.int64)
+
+    meta = {'format': BINARY_GRAPH_FORMAT,
+            'graph': encode_graph_attributes(G.graph, arrays),
+            'node_ids': encode_column(nodes, arrays, 'node_ids'),
+            'nodes': encode_columns([data for _, data in G.nodes(data=True)], arrays, 'node'),
+            'edge_keys': encode_column([key for _, _, key, _ in edges], arrays, 'edge_keys'),
+            'edges': encode_columns([data for _, _, _, data in edges], arrays, 'edge')}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    path = os.path.join(folder, filename)
+    with open(path, 'wb') as f:
+        if compress:
+            np.savez_compressed(f, **arrays)
+        else:
+            np.savez(f, **arrays)
+    log('Saved graph "{}" to disk as binary arrays at "{}" in {:,.2f} seconds'.format(G.name, path, time.time()-start_time))
+
+
+def load_graph_binary(filename='graph.npz', folder=None):
+    """
+    Load a graph saved by save_graph_binary from disk, with its node and edge
+    attributes in the types they were saved in.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the file (including file extension)
+    folder : string
+        the folder containing the file, if None, use default data folder
+
+    Returns
+    -------
+    networkx multidigraph
+    """
+    start_time = time.time()
+    if folder is None:
+        folder = settings.data_folder
+    path = os.path.join(folder, filename)
+
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        if meta.get('format') != BINARY_GRAPH_FORMAT:
+            raise ValueError('"{}" is not a graph saved by save_graph_binary'.format(path))
+
+        G = nx.MultiDiGraph()
+        G.graph.update(decode_graph_attributes(meta['graph'], arrays))
+        nodes = decode_column(meta['node_ids'], arrays, 'node_ids')
+        G.add_nodes_from(zip(nodes, decode_columns(meta['nodes'], arrays, 'node', len(nodes))))
+
+        edge_keys = decode_column(meta['edge_keys'], arrays, 'edge_keys')
+        edge_u = [nodes[position] for position in arrays['edge_u'].tolist()]
+        edge_v = [nodes[position] for position in arrays['edge_v'].tolist()]
+        G.add_edges_from(zip(edge_u, edge_v, edge_keys, decode_columns(meta['edges'], arrays, 'edge', len(edge_keys))))
+
+    log('Loaded graph with {:,} nodes and {:,} edges in {:,.2f} seconds from "{}"'.format(len(G),
+                                                                                          len(edge_keys),
+                                                                                          time.time()-start_time,
+                                                                                          path))
+    return G
+
+
+def value_kind(values):
+    """
+    Determine how to store a column of attribute values.
+
+    Parameters
+    ----------
+    values : list
+        the values, none of them lists
+
+    Returns
+    -------
+    string
+        'bool', 'int', 'float', 'str', 'geometry' or 'crs' if all the values
+        are of that type, else 'json'
+    """
+    if all(isinstance(value, (bool, np.bool_)) for value in values):
+        return 'bool'
+    if all(isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)) for value in values):
+        if all(-2 ** 63 <= value < 2 ** 63 for value in values):
+            return 'int'
+    elif all(isinstance(value, (float, np.floating)) for value in values):
+        return 'float'
+    elif all(isinstance(value, str) for value in values):
+        return 'str'
+    elif all(isinstance(value, BaseGeometry) for value in values):
+        return 'geometry'
+    elif all(isinstance(value, CRS) for value in values):
+        return 'crs'
+    return 'json'
+
+
+def to_json_value(value):
+    """
+    Convert an attribute value to a value json can save, tagging the types
+    json does not have so that from_json_value can rebuild them exactly.
+
+    numpy scalars become the python values they hold. tuples, geometries and
+    dicts (whose keys need not be strings) become one-key dicts naming their
+    type, so every json object in the result is such a tag.
+
+    Parameters
+    ----------
+    value : any
+        the attribute value
+
+    Returns
+    -------
+    the json-serializable value
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [to_json_value(element) for element in value]
+    if isinstance(value, tuple):
+        return {'tuple': [to_json_value(element) for element in value]}
+    if isinstance(value, dict):
+        return {'dict': [[to_json_value(key), to_json_value(element)] for key, element in value.items()]}
+    if isinstance(value, BaseGeometry):
+        return {'geometry': value.wkb_hex}
+    raise ValueError('cannot save attribute value {} of type {} in binary format'.format(repr(value), type(value).__name__))
+
+
+def from_json_value(value):
+    """
+    Rebuild an attribute value converted by to_json_value.
+
+    Parameters
+    ----------
+    value : any
+        the value loaded from json
+
+    Returns
+    -------
+    the attribute value
+    """
+    if isinstance(value, list):
+        return [from_json_value(element) for element in value]
+    if isinstance(value, dict):
+        (kind, data), = value.items()
+        if kind == 'tuple':
+            return tuple(from_json_value(element) for element in data)
+        if kind == 'dict':
+            return {from_json_value(key): from_json_value(element) for key, element in data}
+        if kind == 'geometry':
+            return wkb.loads(data, hex=True)
+    return value
+
+
+def encode_column(values, arrays, prefix, random_access=False):
+    """
+    Encode a column of attribute values into typed numpy arrays.
+
+    Parameters
+    ----------
+    values : list
+        the values, which may be lists of values
+    arrays : dict
+        dict of arrays to add the column's arrays to
+    prefix : string
+        the prefix of the column's array names
+    random_access : bool
+        if True, store the offsets of each value's bytes and of each list's
+        elements rather than their lengths, so that single values can be read
+        with column_value without decoding the whole column
+
+    Returns
+    -------
+    dict
+        the column's metadata, to pass to decode_column
+    """
+    # store the elements of lists end to end, with each value's element count
+    # and whether it was a list
+    is_list = [isinstance(value, list) for value in values]
+    column = {'lists': any(is_list), 'random_access': random_access}
+    if column['lists']:
+        counts = np.array([len(value) if listed else 1 for value, listed in zip(values, is_list)], dtype=np.int64)
+        arrays[prefix + '_is_list'] = np.array(is_list, dtype=bool)
+        if random_access:
+            arrays[prefix + '_list_offsets'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        else:
+            arrays[prefix + '_counts'] = counts
+        values = [element for value, listed in zip(values, is_list) for element in (value if listed else [value])]
+
+    column['kind'] = kind = value_kind(values)
+    if kind in ('bool', 'int', 'float'):
+        arrays[prefix + '_values'] = np.array(values, dtype={'bool': bool, 'int': np.int64, 'float': float}[kind])
+        return column
+
+    if kind == 'geometry':
+        data = [value.wkb for value in values]
+    else:
+        if kind == 'crs':
+            values = [value.srs for value in values]
+        elif kind == 'json':
+            values = [json.dumps(to_json_value(value)) for value in values]
+        # lengths in characters, to slice the text once it is decoded, unless
+        # each value is decoded on its own
+        data = [value.encode('utf-8') for value in values] if random_access else values
+    lengths = np.array([len(value) for value in data], dtype=np.int64)
+    if random_access:
+        arrays[prefix + '_offsets'] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        data = b''.join(data)
+    else:
+        arrays[prefix + '_lengths'] = lengths
+        data = b''.join(data) if kind == 'geometry' else ''.join(data).encode('utf-8')
+    arrays[prefix + '_data'] = np.frombuffer(data, dtype=np.uint8)
+    return column
+
+
+def decode_column(column, arrays, prefix):
+    """
+    Decode a column of attribute values encoded by encode_column.
+
+    Parameters
+    ----------
+    column : dict
+        the column's metadata
+    arrays : dict or numpy.lib.npyio.NpzFile
+        the arrays the column was encoded into
+    prefix : string
+        the prefix of the column's array names
+
+    Returns
+    -------
+    list
+    """
+    kind = column['kind']
+    if kind in ('bool', 'int', 'float'):
+        values = arrays[prefix + '_values'].tolist()
+    else:
+        if column.get('random_access'):
+            offsets = arrays[prefix + '_offsets'].tolist()
+            starts, ends = offsets[:-1], offsets[1:]
+        else:
+            ends = np.cumsum(arrays[prefix + '_lengths']).tolist()
+            starts = [0] + ends[:-1]
+        data = arrays[prefix + '_data'].tobytes()
+        if kind == 'geometry':
+            values = [wkb.loads(data[start:end]) for start, end in zip(starts, ends)]
+        else:
+            if column.get('random_access'):
+                values = [data[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+            else:
+                text = data.decode('utf-8')
+                values = [text[start:end] for start, end in zip(starts, ends)]
+            if kind == 'crs':
+                values = [get_crs(value) for value in values]
+            elif kind == 'json':
+                values = [from_json_value(json.loads(value)) for value in values]
+
+    # regroup the elements of lists
+    if column['lists']:
+        if column.get('random_access'):
+            counts = np.diff(arrays[prefix + '_list_offsets']).tolist()
+        else:
+            counts = arrays[prefix + '_counts'].tolist()
+        elements = values
+        values = []
+        start = 0
+        for listed, count in zip(arrays[prefix + '_is_list'].tolist(), counts):
+            values.append(elements[start:start+count] if listed else elements[start])
+            start += count
+    return values
+
+
+def column_value(column, arrays, prefix, i):
+    """
+    Decode the ith value of a column encoded by encode_column with
+    random_access=True, reading only that value's part of its arrays.
+
+    Parameters
+    ----------
+    column : dict
+        the column's metadata
+    arrays : dict
+        the arrays the column was encoded into, which may be memory-mapped
+    prefix : string
+        the prefix of the column's array names
+    i : int
+        the position of the value in the column
+
+    Returns
+    -------
+    the value
+    """
+    def element(j):
+        kind = column['kind']
+        if kind in ('bool', 'int', 'float'):
+            return arrays[prefix + '_values'][j].item()
+        start, end = arrays[prefix + '_offsets'][j:j+2].tolist()
+        data = arrays[prefix + '_data'][start:end].tobytes()
+        if kind == 'geometry':
+            return wkb.loads(data)
+        value = data.decode('utf-8')
+        if kind == 'crs':
+            return get_crs(value)
+        if kind == 'json':
+            return from_json_value(json.loads(value))
+        return value
+
+    if column['lists']:
+        start, end = arrays[prefix + '_list_offsets'][i:i+2].tolist()
+        if arrays[prefix + '_is_list'][i]:
+            return [element(j) for j in range(start, end)]
+        return element(start)
+    return element(i)
+
+
+def encode_columns(items, arrays, prefix, random_access=False):
+    """
+    Encode the attributes of a list of nodes or edges into one column per
+    attribute with encode_column. Columns of attributes that only some of the
+    items have also store the positions of those items.
+
+    Parameters
+    ----------
+    items : list
+        the nodes' or edges' attribute dicts
+    arrays : dict
+        dict of arrays to add the columns' arrays to
+    prefix : string
+        the prefix of the columns' array names, followed by their number
+    random_access : bool
+        see encode_column
+
+    Returns
+    -------
+    list
+        the columns' metadata, to pass to decode_columns
+    """
+    # collect each attribute's values, with the positions of the items that
+    # have it
+    columns = {}
+    for i, data in enumerate(items):
+        for name, value in data.items():
+            columns.setdefault(name, ([], []))
+            columns[name][0].append(i)
+            columns[name][1].append(value)
+
+    encoded = []
+    for i, (name, (positions, values)) in enumerate(columns.items()):
+        column = encode_column(values, arrays, '{}{}'.format(prefix, i), random_access=random_access)
+        column['name'] = name
+        if len(positions) < len(items):
+            arrays['{}{}_positions'.format(prefix, i)] = np.array(positions, dtype=np.int64)
+        encoded.append(column)
+    return encoded
+
+
+def decode_columns(columns, arrays, prefix, length):
+    """
+    Decode columns encoded by encode_columns into the items' attribute dicts,
+    filling them in one column at a time.
+
+    Parameters
+    ----------
+    columns : list
+        the columns' metadata
+    arrays : dict or numpy.lib.npyio.NpzFile
+        the arrays the columns were encoded into
+    prefix : string
+        the prefix of the columns' array names
+    length : int
+        the number of items
+
+    Returns
+    -------
+    list
+        the items' attribute dicts
+    """
+    items = [{} for _ in range(length)]
+    for i, column in enumerate(columns):
+        values = decode_column(column, arrays, '{}{}'.format(prefix, i))
+        positions_name = '{}{}_positions'.format(prefix, i)
+        if positions_name in arrays:
+            positions = arrays[positions_name].tolist()
+        else:
+            positions = range(length)
+        name = column['name']
+        for position, value in zip(positions, values):
+            items[position][name] = value
+    return items
+
+
+def encode_graph_attributes(attributes, arrays):
+    """
+    Encode a graph's attributes as columns of one value, or as a column of
+    keys and a column of values if they are dicts, like streets_per_node.
+
+    Parameters
+    ----------
+    attributes : dict
+        the graph's attributes
+    arrays : dict
+        dict of arrays to add the columns' arrays to
+
+    Returns
+    -------
+    list
+        the columns' metadata, to pass to decode_graph_attributes
+    """
+    columns = []
+    for i, (name, value) in enumerate(attributes.items()):
+        prefix = 'graph{}'.format(i)
+        if isinstance(value, dict):
+            column = {'name': name,
+                      'keys': encode_column(list(value.keys()), arrays, prefix + 'keys'),
+                      'values': encode_column(list(value.values()), arrays, prefix + 'values')}
+        else:
+            column = encode_column([value], arrays, prefix)
+            column['name'] = name
+        columns.append(column)
+    return columns
+
+
+def decode_graph_attributes(columns, arrays):
+    """
+    Decode a graph's attributes encoded by encode_graph_attributes.
+
+    Parameters
+    ----------
+    columns : list
+        the columns' metadata
+    arrays : dict or numpy.lib.npyio.NpzFile
+        the arrays the columns were encoded into
+
+    Returns
+    -------
+    dict
+    """
+    attributes = {}
+    for i, column in enumerate(columns):
+        prefix = 'graph{}'.format(i)
+        if 'keys' in column:
+            keys = decode_column(column['keys'], arrays, prefix + 'keys')
+            values = decode_column(column['values'], arrays, prefix + 'values')
+            attributes[column['name']] = dict(zip(keys, values))
+        else:
+            attributes[column['name']] = decode_column(column, arrays, prefix)[0]
+    return attributes
+
+
 def is_duplicate_edge(data, data_other):
     """
     Check if two edge data dictionaries are the same based on OSM ID and
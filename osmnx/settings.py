@@ -18,6 +18,29 @@ cache_folder = 'cache'
 # cache server responses
 use_cache = False
 
+# where to store cached responses: 'file' saves one compressed file per
+# response in cache_folder, 'sqlite' saves them all in a single database file
+# in cache_folder
+cache_backend = 'file'
+
+# max total size of the cache in bytes, beyond which the least recently used
+# responses get evicted. if None, the cache can grow without limit
+cache_max_bytes = None
+
+# max age of cached responses in seconds, beyond which they are treated as
+# misses and evicted. if None, cached responses never expire
+cache_ttl = None
+
+# http connections to keep open per host in the shared session's pool. this
+# should be at least overpass_max_workers so concurrent queries reuse them
+http_pool_size = 10
+
+# how many times the shared session retries a request that failed to connect,
+# failed to read, or got a 502 or 503 from the server, waiting
+# http_backoff_factor * 2 ** (retry - 1) seconds between retries
+http_max_retries = 3
+http_backoff_factor = 0.5
+
 # write log to file and/or to console
 log_file = False
 log_console = False
@@ -70,4 +93,9 @@ nominatim_endpoint = "https://nominatim.openstreetmap.org/"
 nominatim_key = None
 
 # which API endpoint to use for overpass queries
-overpass_endpoint = "http://overpass-api.de/api" 
+overpass_endpoint = "http://overpass-api.de/api"
+
+# max number of overpass queries to run at once when a query geometry gets
+# subdivided into several sub-queries. the number actually used is also capped
+# by the number of slots the endpoint reports as available
+overpass_max_workers = 1
@@ -7,14 +7,18 @@
 
 import time
 import logging as lg
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
-from shapely.geometry import Polygon
+import networkx as nx
+import numpy as np
 from shapely.geometry import Point
+from shapely.geometry import Polygon
 from shapely.geometry import LineString
 
 from .save_load import graph_to_gdfs
 from .utils import log
 from .geo_utils import count_streets_per_node
+from .spatial_index import get_projected_nodes
 
 
 def is_endpoint(G, node, strict=True):
@@ -88,9 +92,61 @@ def is_endpoint(G, node, strict=True):
         return False
 
 
+def get_endpoints(G, strict=True):
+    """
+    Identify all the nodes in the graph that are "real" endpoints of an edge,
+    by the same rules as is_endpoint, computed for all nodes at once from
+    arrays of the edges' endpoints.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    strict : bool
+        if False, allow nodes to be end points even if they fail all other rules
+        but have edges with different OSM IDs
+
+    Returns
+    -------
+    endpoints : set
+    """
+    nodes = list(G.nodes())
+    n = len(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in G.edges()], dtype=np.int64).reshape(-1, 2)
+    u = edges[:, 0]
+    v = edges[:, 1]
+
+    # count each node's incoming and outgoing edges and distinct neighbors
+    in_degree = np.bincount(v, minlength=n)
+    out_degree = np.bincount(u, minlength=n)
+    degree = in_degree + out_degree
+    neighbor_pairs = np.unique(np.concatenate([u * n + v, v * n + u]))
+    neighbors = np.bincount(neighbor_pairs // n, minlength=n)
+    self_loops = np.zeros(n, dtype=bool)
+    self_loops[u[u == v]] = True
+
+    # self-loops, nodes with no incoming or no outgoing edges, and nodes
+    # without exactly 2 neighbors and 2 or 4 edges are endpoints
+    is_endpoint = self_loops | (in_degree == 0) | (out_degree == 0)
+    is_endpoint |= ~((neighbors == 2) & ((degree == 2) | (degree == 4)))
+
+    # in non-strict mode, so are nodes whose edges have different OSM IDs
+    if not strict:
+        codes = {}
+        osmids = np.array([codes.setdefault(osmid, len(codes)) for _, _, osmid in G.edges(data='osmid')], dtype=np.int64)
+        node_osmids = np.unique(np.concatenate([u, v]) * max(len(codes), 1) + np.concatenate([osmids, osmids]))
+        is_endpoint |= np.bincount(node_osmids // max(len(codes), 1), minlength=n) > 1
+
+    return set([node for node, endpoint in zip(nodes, is_endpoint.tolist()) if endpoint])
+
+
 def build_path(G, node, endpoints, path):
     """
-    Recursively build a path of nodes until you hit an endpoint node.
+    Build a path of nodes from node, following successors until you hit an
+    endpoint node.
+
+    Walks the chain iteratively, so there is no limit on how many interstitial
+    nodes the path can have.
 
     Parameters
     ----------
@@ -106,20 +162,20 @@ def build_path(G, node, endpoints, path):
     -------
     paths_to_simplify : list
     """
-    # for each successor in the passed-in node
-    for successor in G.successors(node):
-        if successor not in path:
-            # if this successor is already in the path, ignore it, otherwise add
-            # it to the path
-            path.append(successor)
-            if successor not in endpoints:
-                # if this successor is not an endpoint, recursively call
-                # build_path until you find an endpoint
-                path = build_path(G, successor, endpoints, path)
-            else:
-                # if this successor is an endpoint, we've completed the path,
-                # so return it
-                return path
+    visited = set(path)
+    while True:
+        # interstitial nodes have at most one successor not yet in the path:
+        # add it to the path and stop if it is an endpoint
+        for successor in G.successors(node):
+            if successor not in visited:
+                break
+        else:
+            break
+        path.append(successor)
+        visited.add(successor)
+        if successor in endpoints:
+            return path
+        node = successor
 
     if (path[-1] not in endpoints) and (path[0] in G.successors(path[-1])):
         # if the end of the path is not actually an endpoint and the path's
@@ -136,9 +192,7 @@ def get_paths_to_simplify(G, strict=True):
     Create a list of all the paths to be simplified between endpoint nodes.
 
     The path is ordered from the first endpoint, through the interstitial nodes,
-    to the second endpoint. If your street network is in a rural area with many
-    interstitial nodes between true edge endpoints, you may want to increase
-    your system's recursion limit to avoid recursion errors.
+    to the second endpoint.
 
     Parameters
     ----------
@@ -154,7 +208,7 @@ def get_paths_to_simplify(G, strict=True):
 
     # first identify all the nodes that are endpoints
     start_time = time.time()
-    endpoints = set([node for node in G.nodes() if is_endpoint(G, node, strict=strict)])
+    endpoints = get_endpoints(G, strict=strict)
     log('Identified {:,} edge endpoints in {:,.2f} seconds'.format(len(endpoints), time.time()-start_time))
 
     start_time = time.time()
@@ -166,20 +220,8 @@ def get_paths_to_simplify(G, strict=True):
             if successor not in endpoints:
                 # if the successor is not an endpoint, build a path from the
                 # endpoint node to the next endpoint node
-                try:
-                    path = build_path(G, successor, endpoints, path=[node, successor])
-                    paths_to_simplify.append(path)
-                except RuntimeError:
-                    log('Recursion error: exceeded max depth, moving on to next endpoint successor', level=lg.WARNING)
-                    # recursion errors occur if some connected component is a
-                    # self-contained ring in which all nodes are not end points.
-                    # could also occur in extremely long street segments (eg, in
-                    # rural areas) with too many nodes between true endpoints.
-                    # handle it by just ignoring that component and letting its
-                    # topology remain intact (this should be a rare occurrence)
-                    # RuntimeError is what Python <3.5 will throw, Py3.5+ throws
-                    # RecursionError but it is a subtype of RuntimeError so it
-                    # still gets handled
+                path = build_path(G, successor, endpoints, path=[node, successor])
+                paths_to_simplify.append(path)
 
     log('Constructed all paths to simplify in {:,.2f} seconds'.format(time.time()-start_time))
     return paths_to_simplify
@@ -204,7 +246,180 @@ def is_simplified(G):
     return 'simplified' in G.graph and G.graph['simplified']
 
 
-def simplify_graph(G, strict=True):
+def collapse_path(G, path):
+    """
+    Merge the attributes of the edges along a path into the attributes of the
+    single edge that replaces them.
+
+    Attributes with a single value along the path keep it, others become a
+    list of their distinct values. The lengths are summed and the geometry
+    is a LineString through all the path's nodes.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    path : list
+        the nodes of the path, in order
+
+    Returns
+    -------
+    edge_attributes : dict
+    """
+
+    # add the interstitial edges we're removing to a list so we can retain
+    # their spatial geometry
+    edge_attributes = {}
+    for u, v in zip(path[:-1], path[1:]):
+
+        # there shouldn't be multiple edges between interstitial nodes
+        if not G.number_of_edges(u, v) == 1:
+            log('Multiple edges between "{}" and "{}" found when simplifying'.format(u, v), level=lg.WARNING)
+
+        # the only element in this list as long as above check is True
+        # (MultiGraphs use keys (the 0 here), indexed with ints from 0 and
+        # up)
+        edge = G.edges[u, v, 0]
+        for key in edge:
+            if key in edge_attributes:
+                # if this key already exists in the dict, append it to the
+                # value list
+                edge_attributes[key].append(edge[key])
+            else:
+                # if this key doesn't already exist, set the value to a list
+                # containing the one value
+                edge_attributes[key] = [edge[key]]
+
+    for key in edge_attributes:
+        # don't touch the length attribute, we'll sum it at the end
+        if len(set(edge_attributes[key])) == 1 and not key == 'length':
+            # if there's only 1 unique value in this attribute list,
+            # consolidate it to the single value (the zero-th)
+            edge_attributes[key] = edge_attributes[key][0]
+        elif not key == 'length':
+            # otherwise, if there are multiple values, keep one of each value
+            edge_attributes[key] = list(set(edge_attributes[key]))
+
+    # construct the geometry and sum the lengths of the segments
+    edge_attributes['geometry'] = LineString([(G.nodes[node]['x'], G.nodes[node]['y']) for node in path])
+    edge_attributes['length'] = sum(edge_attributes['length'])
+    return edge_attributes
+
+
+def get_tiles(G, tiles):
+    """
+    Partition a graph's nodes into spatial tiles with about the same number
+    of nodes each: columns split by the nodes' x coordinates, each split into
+    rows by their y coordinates.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    tiles : int
+        the minimum number of tiles
+
+    Returns
+    -------
+    tile_of, count : tuple
+        dict of each node's tile number, and the number of tiles
+    """
+    nodes = list(G.nodes())
+    n = len(nodes)
+    x = np.array([x for _, x in G.nodes(data='x')], dtype=float)
+    y = np.array([y for _, y in G.nodes(data='y')], dtype=float)
+    columns = int(np.ceil(np.sqrt(tiles)))
+    rows = int(np.ceil(tiles / columns))
+
+    column = np.empty(n, dtype=np.int64)
+    column[np.argsort(x, kind='stable')] = np.arange(n) * columns // max(n, 1)
+    tile = np.empty(n, dtype=np.int64)
+    for c in range(columns):
+        members = np.flatnonzero(column == c)
+        row = np.arange(len(members)) * rows // max(len(members), 1)
+        tile[members[np.argsort(y[members], kind='stable')]] = c * rows + row
+
+    return dict(zip(nodes, tile.tolist())), columns * rows
+
+
+def build_tile_path(G, node, endpoints, path, tile):
+    """
+    Build a path of nodes from node like build_path does, but stop before
+    following a successor outside the tile.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+        a graph of the tile's nodes and all of their outgoing edges
+    node : int
+        the current node to start from
+    endpoints : set
+        the set of the tile's nodes that are endpoints
+    path : list
+        the list of nodes in order in the path so far
+    tile : set
+        the tile's nodes
+
+    Returns
+    -------
+    path, finished : tuple
+        the path, and False if it was stopped at the edge of the tile
+    """
+    visited = set(path)
+    while True:
+        for successor in G.successors(node):
+            if successor not in visited:
+                break
+        else:
+            break
+        if successor not in tile:
+            return path, False
+        path.append(successor)
+        visited.add(successor)
+        if successor in endpoints:
+            return path, True
+        node = successor
+
+    if (path[-1] not in endpoints) and (path[0] in G.successors(path[-1])):
+        path.append(path[0])
+
+    return path, True
+
+
+def simplify_tile(nodes, edges, endpoints, starts):
+    """
+    Build and collapse the paths to simplify that start in one tile, as far as
+    they stay within it. Runs in a worker process.
+
+    Parameters
+    ----------
+    nodes : list
+        the tile's nodes, as (node, data) tuples with their x and y
+    edges : list
+        the outgoing edges of the tile's nodes, as (u, v, key, data) tuples in
+        the graph's order
+    endpoints : set
+        the set of the tile's nodes that are endpoints
+    starts : list
+        the first two nodes of each path, both in the tile
+
+    Returns
+    -------
+    list
+        (path, edge_attributes) for each path, with edge_attributes None if
+        the path leaves the tile
+    """
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    tile = set(node for node, _ in nodes)
+
+    results = []
+    for node, successor in starts:
+        path, finished = build_tile_path(G, successor, endpoints, [node, successor], tile)
+        results.append((path, collapse_path(G, path) if finished else None))
+    return results
+
+
+def simplify_graph(G, strict=True, tiles=1, max_workers=None, inplace=False):
     """
     Simplify a graph's topology by removing all nodes that are not intersections
     or dead-ends.
@@ -219,6 +434,16 @@ def simplify_graph(G, strict=True):
     strict : bool
         if False, allow nodes to be end points even if they fail all other rules
         but have edges with different OSM IDs
+    tiles : int
+        if greater than 1, partition the graph into at least this many spatial
+        tiles and simplify them in a pool of worker processes, see
+        simplify_graph_by_tiles
+    max_workers : int
+        max number of worker processes when tiles is greater than 1, if None
+        use the number of processors
+    inplace : bool
+        if True, simplify G itself and return it, instead of simplifying a copy
+        of it
 
     Returns
     -------
@@ -228,10 +453,14 @@ def simplify_graph(G, strict=True):
     if is_simplified(G):
         raise Exception('This graph has already been simplified, cannot simplify it again.')
 
+    if tiles > 1:
+        return simplify_graph_by_tiles(G, strict=strict, tiles=tiles, max_workers=max_workers, inplace=inplace)
+
     log('Begin topologically simplifying the graph...')
-    G = G.copy()
-    initial_node_count = len(list(G.nodes()))
-    initial_edge_count = len(list(G.edges()))
+    if not inplace:
+        G = G.copy()
+    initial_node_count = len(G)
+    initial_edge_count = G.number_of_edges()
     all_nodes_to_remove = []
     all_edges_to_add = []
 
@@ -240,49 +469,11 @@ def simplify_graph(G, strict=True):
 
     start_time = time.time()
     for path in paths:
-
-        # add the interstitial edges we're removing to a list so we can retain
-        # their spatial geometry
-        edge_attributes = {}
-        for u, v in zip(path[:-1], path[1:]):
-
-            # there shouldn't be multiple edges between interstitial nodes
-            if not G.number_of_edges(u, v) == 1:
-                log('Multiple edges between "{}" and "{}" found when simplifying'.format(u, v), level=lg.WARNING)
-
-            # the only element in this list as long as above check is True
-            # (MultiGraphs use keys (the 0 here), indexed with ints from 0 and
-            # up)
-            edge = G.edges[u, v, 0]
-            for key in edge:
-                if key in edge_attributes:
-                    # if this key already exists in the dict, append it to the
-                    # value list
-                    edge_attributes[key].append(edge[key])
-                else:
-                    # if this key doesn't already exist, set the value to a list
-                    # containing the one value
-                    edge_attributes[key] = [edge[key]]
-
-        for key in edge_attributes:
-            # don't touch the length attribute, we'll sum it at the end
-            if len(set(edge_attributes[key])) == 1 and not key == 'length':
-                # if there's only 1 unique value in this attribute list,
-                # consolidate it to the single value (the zero-th)
-                edge_attributes[key] = edge_attributes[key][0]
-            elif not key == 'length':
-                # otherwise, if there are multiple values, keep one of each value
-                edge_attributes[key] = list(set(edge_attributes[key]))
-
-        # construct the geometry and sum the lengths of the segments
-        edge_attributes['geometry'] = LineString([Point((G.nodes[node]['x'], G.nodes[node]['y'])) for node in path])
-        edge_attributes['length'] = sum(edge_attributes['length'])
-
         # add the nodes and edges to their lists for processing at the end
         all_nodes_to_remove.extend(path[1:-1])
         all_edges_to_add.append({'origin':path[0],
                                  'destination':path[-1],
-                                 'attr_dict':edge_attributes})
+                                 'attr_dict':collapse_path(G, path)})
 
     # for each edge to add in the list we assembled, create a new edge between
     # the origin and destination
@@ -294,12 +485,126 @@ def simplify_graph(G, strict=True):
 
     G.graph['simplified'] = True
 
+    msg = 'Collapsed {:,} interstitial nodes and {:,} edges into {:,} edges'
+    log(msg.format(len(set(all_nodes_to_remove)), sum(len(path) - 1 for path in paths), len(paths)))
     msg = 'Simplified graph (from {:,} to {:,} nodes and from {:,} to {:,} edges) in {:,.2f} seconds'
-    log(msg.format(initial_node_count, len(list(G.nodes())), initial_edge_count, len(list(G.edges())), time.time()-start_time))
+    log(msg.format(initial_node_count, len(G), initial_edge_count, G.number_of_edges(), time.time()-start_time))
     return G
 
 
-def clean_intersections(G, tolerance=15, dead_ends=False):
+def simplify_graph_by_tiles(G, strict=True, tiles=4, max_workers=None, inplace=False):
+    """
+    Simplify a graph's topology like simplify_graph, in parallel by spatial
+    tile.
+
+    The endpoints are identified for the whole graph at once. Then each
+    tile's paths are built and collapsed in a pool of worker processes, which
+    each receive only their tile's nodes and outgoing edges. Paths that cross
+    a tile boundary are finished in a final stitching pass over the whole
+    graph. The simplified graph is assembled from the surviving nodes and
+    edges without copying the input graph first, and is identical to the one
+    simplify_graph returns.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    strict : bool
+        if False, allow nodes to be end points even if they fail all other rules
+        but have edges with different OSM IDs
+    tiles : int
+        the minimum number of spatial tiles to partition the graph into
+    max_workers : int
+        max number of worker processes, if None use the number of processors
+    inplace : bool
+        if True, simplify G itself and return it, instead of assembling a new
+        graph
+
+    Returns
+    -------
+    networkx multidigraph
+    """
+
+    if is_simplified(G):
+        raise Exception('This graph has already been simplified, cannot simplify it again.')
+
+    log('Begin topologically simplifying the graph in {:,} tiles...'.format(tiles))
+    start_time = time.time()
+    initial_node_count = len(G)
+    initial_edge_count = G.number_of_edges()
+
+    endpoints = get_endpoints(G, strict=strict)
+    log('Identified {:,} edge endpoints in {:,.2f} seconds'.format(len(endpoints), time.time()-start_time))
+
+    # each path starts at an endpoint and one of its successors that is not an
+    # endpoint, in the same order as get_paths_to_simplify. the tile of both
+    # nodes builds the path, or the stitching pass if they are in different
+    # tiles
+    tile_of, count = get_tiles(G, tiles)
+    starts = [(node, successor) for node in endpoints for successor in G.successors(node) if successor not in endpoints]
+    tile_starts = [[] for _ in range(count)]
+    for i, (node, successor) in enumerate(starts):
+        if tile_of[node] == tile_of[successor]:
+            tile_starts[tile_of[node]].append(i)
+
+    tile_nodes = [[] for _ in range(count)]
+    tile_endpoints = [set() for _ in range(count)]
+    for node, data in G.nodes(data=True):
+        tile_nodes[tile_of[node]].append((node, {'x': data['x'], 'y': data['y']}))
+        if node in endpoints:
+            tile_endpoints[tile_of[node]].add(node)
+    tile_edges = [[] for _ in range(count)]
+    for u, v, key, data in G.edges(keys=True, data=True):
+        tile_edges[tile_of[u]].append((u, v, key, data))
+
+    paths = [list(start) for start in starts]
+    edge_attributes = [None] * len(starts)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(executor.submit(simplify_tile, tile_nodes[tile], tile_edges[tile], tile_endpoints[tile],
+                                    [starts[i] for i in tile_starts[tile]]), tile_starts[tile])
+                   for tile in range(count) if tile_starts[tile]]
+        for future, positions in futures:
+            for i, (path, attributes) in zip(positions, future.result()):
+                paths[i] = path
+                edge_attributes[i] = attributes
+
+    # stitch together the paths that cross tile boundaries, continuing each
+    # from where its tile left off
+    crossing = [i for i, attributes in enumerate(edge_attributes) if attributes is None]
+    for i in crossing:
+        paths[i] = build_path(G, paths[i][-1], endpoints, paths[i])
+        edge_attributes[i] = collapse_path(G, paths[i])
+    log('Stitched {:,} of {:,} paths across tile boundaries'.format(len(crossing), len(paths)))
+
+    # assemble the simplified graph the way simplify_graph's copy of G ends up:
+    # the remaining nodes and edges in their original order, then the new
+    # edges, except any whose nodes are interstitial to another path. in place,
+    # that is exactly what simplify_graph does to its copy
+    nodes_to_remove = set(node for path in paths for node in path[1:-1])
+    if inplace:
+        H = G
+        for path, attributes in zip(paths, edge_attributes):
+            H.add_edge(path[0], path[-1], **attributes)
+        H.remove_nodes_from(nodes_to_remove)
+    else:
+        H = G.__class__()
+        H.graph.update(G.graph)
+        H.add_nodes_from((node, data.copy()) for node, data in G.nodes(data=True) if node not in nodes_to_remove)
+        H.add_edges_from((u, v, key, data.copy()) for u, v, key, data in G.edges(keys=True, data=True)
+                         if u not in nodes_to_remove and v not in nodes_to_remove)
+        for path, attributes in zip(paths, edge_attributes):
+            if path[0] not in nodes_to_remove and path[-1] not in nodes_to_remove:
+                H.add_edge(path[0], path[-1], **attributes)
+
+    H.graph['simplified'] = True
+
+    msg = 'Collapsed {:,} interstitial nodes and {:,} edges into {:,} edges'
+    log(msg.format(len(nodes_to_remove), sum(len(path) - 1 for path in paths), len(paths)))
+    msg = 'Simplified graph (from {:,} to {:,} nodes and from {:,} to {:,} edges) in {:,.2f} seconds'
+    log(msg.format(initial_node_count, len(H), initial_edge_count, H.number_of_edges(), time.time()-start_time))
+    return H
+
+
+def clean_intersections(G, tolerance=15, dead_ends=False, projected=False):
     """
     Clean-up intersections comprising clusters of nodes by merging them and
     returning their centroids.
@@ -322,36 +627,48 @@ def clean_intersections(G, tolerance=15, dead_ends=False):
     dead_ends : bool
         if False, discard dead-end nodes to return only street-intersection
         points
+    projected : bool
+        if True, buffer the nodes' UTM coordinates from get_projected_nodes
+        rather than their graph coordinates, so tolerance is in meters on an
+        unprojected graph
 
     Returns
     ----------
     intersection_centroids : geopandas.GeoSeries
         a GeoSeries of shapely Points representing the centroids of street
-        intersections
+        intersections, in UTM with its crs set if projected is True
     """
 
     # if dead_ends is False, discard dead-end nodes to only work with edge
     # intersections
+    dead_end_nodes = set()
     if not dead_ends:
         if 'streets_per_node' in G.graph:
             streets_per_node = G.graph['streets_per_node']
         else:
             streets_per_node = count_streets_per_node(G)
 
-        dead_end_nodes = [node for node, count in streets_per_node.items() if count <= 1]
-        G = G.copy()
-        G.remove_nodes_from(dead_end_nodes)
+        dead_end_nodes = set(node for node, count in streets_per_node.items() if count <= 1)
 
-    # create a GeoDataFrame of nodes, buffer to passed-in distance, merge
+    # create a GeoSeries of node points, buffer to passed-in distance, merge
     # overlaps
-    gdf_nodes = graph_to_gdfs(G, edges=False)
-    buffered_nodes = gdf_nodes.buffer(tolerance).unary_union
+    crs = None
+    if projected:
+        nodes, x, y, crs = get_projected_nodes(G)
+        keep = np.array([node not in dead_end_nodes for node in nodes.tolist()], dtype=bool)
+        points = gpd.GeoSeries([Point(xy) for xy in zip(x[keep], y[keep])], crs=crs)
+    else:
+        if not dead_ends:
+            G = G.copy()
+            G.remove_nodes_from(dead_end_nodes)
+        points = graph_to_gdfs(G, edges=False)
+    buffered_nodes = points.buffer(tolerance).unary_union
     if isinstance(buffered_nodes, Polygon):
         # if only a single node results, make it iterable so we can turn it into
         # a GeoSeries
         buffered_nodes = [buffered_nodes]
 
     # get the centroids of the merged intersection polygons
-    unified_intersections = gpd.GeoSeries(list(buffered_nodes))
+    unified_intersections = gpd.GeoSeries(list(buffered_nodes), crs=crs)
     intersection_centroids = unified_intersections.centroid
     return intersection_centroids
@@ -0,0 +1,1047 @@
+################################################################################
+# Module: spatial_index.py
+# Description: Spatial index of a graph's nodes and edges, built once per graph
+#              and reused by every nearest node and edge search
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+import threading
+import time
+import weakref
+from itertools import chain
+import networkx as nx
+import numpy as np
+from rtree.index import Index
+from shapely.geometry import LineString
+
+from .projection import crs_key
+from .projection import get_crs
+from .projection import get_points_crs
+from .projection import get_transformer
+from .projection import transform_geometries
+from .utils import great_circle_vec
+from .utils import log
+
+# scipy and sklearn are optional dependencies for faster nearest node search
+try:
+    from scipy.spatial import cKDTree
+except ImportError as e:
+    cKDTree = None
+try:
+    from sklearn.neighbors import BallTree
+except ImportError as e:
+    BallTree = None
+
+# mean radius of the earth in meters, as in great_circle_vec, to convert ball
+# tree distances in radians
+EARTH_RADIUS = 6371009
+
+
+class SpatialIndex(object):
+    """
+    Spatial index of a graph's nodes and edges.
+
+    The node ids and coordinates are copied into arrays when the index is
+    created. Everything else is built the first time a search needs it and
+    kept for the next one: the k-d tree or ball tree of the nodes, the edges'
+    ids and geometries, the R-tree of the edges' straight segments, the
+    trees of points spaced along the edges at each spacing searched with, and
+    the node coordinates and edge geometries projected to each crs asked for.
+
+    Use get_spatial_index to get the index of a graph, rather than creating
+    one directly, so that it is shared by every search on the graph and
+    rebuilt when the graph changes.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    nodes : tuple
+        the graph's crs and node arrays from get_node_arrays, if None get
+        them from G
+    """
+
+    def __init__(self, G, nodes=None):
+        start_time = time.time()
+        self.graph = weakref.ref(G)
+        if nodes is None:
+            nodes = get_node_arrays(G)
+        self.crs, self.node_ids, self.x, self.y = nodes
+        if isinstance(G, nx.Graph):
+            self.summary = graph_summary(G)
+            self.node_set = frozenset(self.node_ids.tolist())
+
+        self.node_trees = {}
+        self.edge_list = None
+        self.edge_uv = None
+        self.edge_keys = None
+        self.edge_geometries = None
+        self.segments = None
+        self.segment_tree = None
+        self.edge_point_trees = {}
+        self.projected_nodes = {}
+        self.projected_edges = {}
+        log('Created spatial index of {:,} nodes in {:,.2f} seconds'.format(len(self.x), time.time()-start_time))
+
+    def is_current(self, G):
+        """
+        Return True if G still has the summary this index was created from,
+        and the same set of node ids.
+
+        This takes a few milliseconds however large the graph is, but does
+        not notice nodes that moved, edge geometries that changed or parallel
+        edges added or removed.
+
+        Parameters
+        ----------
+        G : networkx multidigraph
+
+        Returns
+        -------
+        bool
+        """
+        return graph_summary(G) == self.summary and G._node.keys() == self.node_set
+
+    def has_nodes(self, nodes):
+        """
+        Return True if this index was created from the same crs, node ids and
+        node coordinates.
+
+        Parameters
+        ----------
+        nodes : tuple
+            the graph's crs and node arrays from get_node_arrays
+
+        Returns
+        -------
+        bool
+        """
+        crs, node_ids, x, y = nodes
+        return ((crs is self.crs or crs == self.crs) and np.array_equal(node_ids, self.node_ids)
+                and np.array_equal(x, self.x, equal_nan=True) and np.array_equal(y, self.y, equal_nan=True))
+
+    def has_edges(self, G):
+        """
+        Return True if this index has not built its edge arrays yet, or built
+        them from the same (u, v, key) edges with the same geometries as G has
+        now.
+
+        Geometries are compared by identity first, so an unchanged graph is
+        checked without comparing any coordinates.
+
+        Parameters
+        ----------
+        G : networkx multidigraph
+
+        Returns
+        -------
+        bool
+        """
+        return self.edge_list is None or get_edge_list(G) == self.edge_list
+
+    def with_new_edges(self, G):
+        """
+        Return a new index of G that shares this one's node trees and
+        projected node coordinates, for when only G's edges have changed.
+
+        Parameters
+        ----------
+        G : networkx multidigraph
+
+        Returns
+        -------
+        SpatialIndex
+        """
+        index = SpatialIndex(G, nodes=(self.crs, self.node_ids, self.x, self.y))
+        index.node_trees = self.node_trees
+        index.projected_nodes = self.projected_nodes
+        return index
+
+    def get_node_tree(self, method):
+        """
+        Return the tree of the graph's nodes for a search method, building it
+        on first use.
+
+        Parameters
+        ----------
+        method : str {'kdtree', 'balltree'}
+            'kdtree' for a scipy cKDTree of the nodes' (x, y) coordinates, or
+            'balltree' for a sklearn haversine BallTree of their (lat, lng)
+            coordinates in radians
+
+        Returns
+        -------
+        scipy.spatial.cKDTree or sklearn.neighbors.BallTree
+        """
+        if method not in self.node_trees:
+            self.node_trees[method] = build_tree(np.column_stack([self.x, self.y]), method)
+        return self.node_trees[method]
+
+    def nearest_nodes_haversine(self, X, Y, chunk_size=None):
+        """
+        Find the nearest node to each of a list of points by great circle
+        distance, with no tree.
+
+        Each chunk of points is compared to every node at once, in arrays of
+        chunk_size rows by one column per node, so memory use is bounded by
+        chunk_size rather than by the number of points.
+
+        Parameters
+        ----------
+        X : list-like
+            the points' longitudes
+        Y : list-like
+            the points' latitudes
+        chunk_size : int
+            the number of points to compare to every node at once, if None use
+            as many as make about a million distances per chunk
+
+        Returns
+        -------
+        tuple of (positions, distances)
+            the position in the node arrays of each point's nearest node, and
+            the great circle distance to it in meters
+        """
+        if len(self.x) == 0:
+            raise ValueError('G argument must be not be empty or should contain at least one node')
+        lat = np.asarray(Y, dtype=float)
+        lng = np.asarray(X, dtype=float)
+        if chunk_size is None:
+            chunk_size = max(1, 2 ** 20 // len(self.x))
+
+        # the haversine formula up to its monotonic arcsine, which is all the
+        # comparison needs, with the nodes' terms computed once
+        node_phi = np.deg2rad(self.y)
+        node_theta = np.deg2rad(self.x)
+        node_cos_phi = np.cos(node_phi)
+        positions = np.empty(len(lat), dtype=int)
+        for start in range(0, len(lat), chunk_size):
+            phi = np.deg2rad(lat[start:start+chunk_size])[:, None]
+            theta = np.deg2rad(lng[start:start+chunk_size])[:, None]
+            h = np.sin((node_phi - phi) / 2) ** 2 + np.cos(phi) * node_cos_phi * np.sin((node_theta - theta) / 2) ** 2
+            positions[start:start+chunk_size] = np.argmin(h, axis=1)
+
+        distances = great_circle_vec(lat1=lat, lng1=lng, lat2=self.y[positions], lng2=self.x[positions])
+        return positions, distances
+
+    def get_edges(self):
+        """
+        Return the graph's edges, building the edge arrays on first use.
+
+        Edges without a geometry attribute get a straight LineString between
+        their nodes, as in graph_to_gdfs with fill_edge_geometry=True.
+
+        Returns
+        -------
+        tuple of (edge_uv, edge_keys, edge_geometries)
+            edge_uv is an array of the edges' (u, v) rows in the order of
+            G.edges, edge_keys an array of their keys and edge_geometries a
+            list of their LineStrings
+        """
+        if self.edge_uv is None:
+            G = self.graph()
+            edge_list = get_edge_list(G)
+            edge_uv = []
+            edge_keys = []
+            edge_geometries = []
+            for u, v, key, geometry in zip(edge_list[0::4], edge_list[1::4], edge_list[2::4], edge_list[3::4]):
+                edge_uv.append((u, v))
+                edge_keys.append(key)
+                if geometry is not None:
+                    edge_geometries.append(geometry)
+                else:
+                    edge_geometries.append(LineString([(G.nodes[u]['x'], G.nodes[u]['y']),
+                                                       (G.nodes[v]['x'], G.nodes[v]['y'])]))
+            self.edge_list = edge_list
+            self.edge_uv = np.array(edge_uv).reshape(-1, 2)
+            self.edge_keys = np.array(edge_keys)
+            self.edge_geometries = edge_geometries
+        return self.edge_uv, self.edge_keys, self.edge_geometries
+
+    def get_edge_point_tree(self, method, dist):
+        """
+        Return the tree of points spaced along the graph's edges for a search
+        method, building it on first use for each spacing.
+
+        Parameters
+        ----------
+        method : str {'kdtree', 'balltree'}
+            see get_node_tree
+        dist : float
+            spacing of the points along the edges, see redistribute_vertices
+
+        Returns
+        -------
+        tuple of (tree, positions)
+            the tree of the points, and the position in the edge arrays of the
+            edge each point lies on
+        """
+        if (method, dist) not in self.edge_point_trees:
+            x, y, positions = redistribute_edge_vertices(self.get_edges()[2], dist)
+            tree = build_tree(np.column_stack([x, y]), method)
+            self.edge_point_trees[(method, dist)] = (tree, positions)
+        return self.edge_point_trees[(method, dist)]
+
+    def get_projected_nodes(self, to_crs=None):
+        """
+        Return the graph's node coordinates projected to a crs, computing them
+        on first use for each crs.
+
+        Parameters
+        ----------
+        to_crs : dict or string or pyproj.CRS
+            if not None, project to this CRS instead of to the UTM zone of the
+            nodes' centroid
+
+        Returns
+        -------
+        tuple of (crs, x, y)
+            the crs projected to, and the projected coordinate arrays in the
+            order of the node arrays
+        """
+        key = None if to_crs is None else crs_key(to_crs)
+        if key not in self.projected_nodes:
+            start_time = time.time()
+            crs = get_crs(self.crs)
+            to_crs = get_points_crs(self.x, self.y, crs, to_crs)
+            if crs.is_exact_same(to_crs):
+                x, y = self.x, self.y
+            else:
+                x, y = (np.asarray(c) for c in get_transformer(crs, to_crs).transform(self.x, self.y))
+            self.projected_nodes[key] = (to_crs, x, y)
+            log('Projected spatial index of {:,} nodes in {:,.2f} seconds'.format(len(x), time.time()-start_time))
+        return self.projected_nodes[key]
+
+    def get_projected_edges(self, to_crs=None):
+        """
+        Return the graph's edge geometries projected to a crs, computing them
+        on first use for each crs.
+
+        Parameters
+        ----------
+        to_crs : dict or string or pyproj.CRS
+            see get_projected_nodes
+
+        Returns
+        -------
+        tuple of (crs, geometries)
+            the crs projected to, and a list of the projected LineStrings in
+            the order of the edge arrays
+        """
+        key = None if to_crs is None else crs_key(to_crs)
+        if key not in self.projected_edges:
+            start_time = time.time()
+            crs = get_crs(self.crs)
+            to_crs = self.get_projected_nodes(to_crs)[0]
+            geometries = self.get_edges()[2]
+            if not crs.is_exact_same(to_crs):
+                geometries = transform_geometries(geometries, get_transformer(crs, to_crs))
+            self.projected_edges[key] = (to_crs, geometries)
+            log('Projected spatial index of {:,} edges in {:,.2f} seconds'.format(len(geometries), time.time()-start_time))
+        return self.projected_edges[key]
+
+    def get_segments(self):
+        """
+        Return the straight segments between consecutive vertices of the
+        graph's edges, building the segment arrays on first use.
+
+        Each segment's ends are ordered by x then y, so the two edges of a
+        two-way street have identical segments.
+
+        Returns
+        -------
+        tuple of (x0, y0, x1, y1, positions)
+            the segments' end coordinate arrays, and the position in the edge
+            arrays of the edge each segment belongs to
+        """
+        if self.segments is None:
+            coords, starts, ends = concatenate_coords(self.get_edges()[2])
+            first = np.ones(len(coords), dtype=bool)
+            first[ends] = False
+            first = np.flatnonzero(first)
+            positions = np.repeat(np.arange(len(starts)), ends - starts)
+            x0, y0 = coords[first, 0], coords[first, 1]
+            x1, y1 = coords[first + 1, 0], coords[first + 1, 1]
+            swap = (x1 < x0) | ((x1 == x0) & (y1 < y0))
+            x0, x1 = np.where(swap, x1, x0), np.where(swap, x0, x1)
+            y0, y1 = np.where(swap, y1, y0), np.where(swap, y0, y1)
+            self.segments = (x0, y0, x1, y1, positions)
+        return self.segments
+
+    def get_segment_tree(self):
+        """
+        Return the R-tree of the bounding boxes of the graph's edge segments,
+        building it on first use.
+
+        Returns
+        -------
+        rtree.index.Index
+            R-tree whose ids are positions in the segment arrays
+        """
+        if self.segment_tree is None:
+            x0, y0, x1, y1, _ = self.get_segments()
+            bounds = np.column_stack([x0, np.minimum(y0, y1), x1, np.maximum(y0, y1)]).tolist()
+            self.segment_tree = Index((i, box, None) for i, box in enumerate(bounds))
+        return self.segment_tree
+
+    def nearest_edges(self, X, Y):
+        """
+        Find the exact nearest edge to each of a list of points, in the graph's
+        coordinate units.
+
+        The R-tree of the edge segments gives the segments with the k nearest
+        bounding boxes to each point, and the distances to them are computed
+        in one vectorized pass. A segment's bounding box is never further from
+        a point than the segment itself, so the nearest of those segments is
+        the nearest of all once it is nearer than the kth bounding box. The
+        points for which it is not are searched again with twice as many
+        segments. Ties go to the first edge in G.edges.
+
+        Parameters
+        ----------
+        X : list-like
+            the points' x coordinates
+        Y : list-like
+            the points' y coordinates
+
+        Returns
+        -------
+        tuple of (positions, distances, nearest_x, nearest_y)
+            the position in the edge arrays of each point's nearest edge, the
+            distance to it, and the coordinates of the nearest point on it
+        """
+        points = np.column_stack([np.asarray(X, dtype=float), np.asarray(Y, dtype=float)])
+        segments = self.get_segments()
+        positions = np.zeros(len(points), dtype=int)
+        distances, nearest_x, nearest_y = (np.zeros(len(points)) for _ in range(3))
+        if len(segments[0]) == 0:
+            raise ValueError('G argument must contain at least one edge')
+        tree = self.get_segment_tree()
+
+        remaining = np.arange(len(points))
+        k = 8
+        while len(remaining) > 0:
+            # the segments with the k nearest bounding boxes to each point,
+            # exactly k of them so ties at the kth cannot overflow the results
+            ids, counts, kth_distances = tree.nearest_v(points[remaining], points[remaining], num_results=k,
+                                                        strict=True, return_max_dists=True)
+            which = np.repeat(remaining, counts.astype(int))
+            candidate_distances, candidate_x, candidate_y = segment_distances(points[which, 0], points[which, 1],
+                                                                              segments, ids)
+            candidate_positions = segments[4][ids]
+
+            # the nearest candidate for each point, the first edge if tied
+            order = np.lexsort((ids, candidate_positions, candidate_distances, which))
+            nearest = order[np.concatenate([[0], np.cumsum(counts.astype(int))[:-1]])]
+            positions[remaining] = candidate_positions[nearest]
+            distances[remaining] = candidate_distances[nearest]
+            nearest_x[remaining] = candidate_x[nearest]
+            nearest_y[remaining] = candidate_y[nearest]
+
+            # search again for the points whose nearest candidate is not
+            # nearer than every segment outside the k
+            if k >= len(segments[0]):
+                break
+            remaining = remaining[kth_distances <= distances[remaining]]
+            k *= 2
+
+        return positions, distances, nearest_x, nearest_y
+
+    def query_nodes(self, X, Y, method='kdtree', k=None, radius=None):
+        """
+        Find the k nearest nodes to each of a list of points, or all the nodes
+        within some radius of each point.
+
+        Parameters
+        ----------
+        X : list-like
+            the points' x coordinates or longitudes
+        Y : list-like
+            the points' y coordinates or latitudes
+        method : str {'kdtree', 'balltree'}
+            search the node tree for this method, see get_node_tree
+        k : int
+            the number of nodes to find for each point, if radius is None
+        radius : float
+            find all the nodes within this distance of each point, in the
+            graph's coordinate units for 'kdtree' or in meters for 'balltree'
+
+        Returns
+        -------
+        tuple of (which, positions, distances)
+            flat arrays of the position in X and Y of each point, the position
+            in the node arrays of each node found for it and the distance to
+            that node, sorted by point and then by distance
+        """
+        tree = self.get_node_tree(method)
+        which, positions, distances, _ = query_tree(tree, method, X, Y, k=k, radius=radius)
+        return nearest_per_item(which, positions, distances)
+
+    def query_edges(self, X, Y, method=None, k=None, radius=None, dist=0.0001):
+        """
+        Find the k nearest edges to each of a list of points, or all the edges
+        within some radius of each point.
+
+        The candidate edges come from the R-tree of the edge segments, with
+        exact euclidean distances, or from the tree of points spaced dist
+        apart along the edges for 'kdtree' or 'balltree'. For k nearest
+        edges, each point gets 4k candidate segments or points at first. Once
+        its kth nearest edge is nearer than any candidate left out, the k
+        edges are final. Otherwise the point is searched again with twice as
+        many candidates.
+
+        Parameters
+        ----------
+        X : list-like
+            the points' x coordinates or longitudes
+        Y : list-like
+            the points' y coordinates or latitudes
+        method : str {None, 'kdtree', 'balltree'}
+            None for exact search of the edge segments, or search the tree of
+            points along the edges for this method, see get_node_tree
+        k : int
+            the number of edges to find for each point, if radius is None
+        radius : float
+            find all the edges within this distance of each point, in the
+            graph's coordinate units, or in meters for 'balltree'
+        dist : float
+            spacing of the points along the edges for 'kdtree' or 'balltree'
+
+        Returns
+        -------
+        tuple of (which, positions, distances)
+            flat arrays of the position in X and Y of each point, the position
+            in the edge arrays of each edge found for it and the distance to
+            that edge, sorted by point and then by distance
+        """
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        if method is None:
+            segments = self.get_segments()
+            if len(segments[0]) == 0:
+                raise ValueError('G argument must contain at least one edge')
+            tree = self.get_segment_tree()
+            candidate_count = len(segments[0])
+            edge_of = segments[4]
+
+            def query(points, k=None, radius=None):
+                return query_segments(tree, segments, X[points], Y[points], k=k, radius=radius)
+        else:
+            tree, edge_of = self.get_edge_point_tree(method, dist)
+            candidate_count = len(edge_of)
+
+            def query(points, k=None, radius=None):
+                return query_tree(tree, method, X[points], Y[points], k=k, radius=radius)
+
+        if radius is not None:
+            which, ids, distances, _ = query(np.arange(len(X)), radius=radius)
+            return nearest_per_item(which, edge_of[ids], distances)
+
+        k = min(k, len(self.get_edges()[0]))
+        results = []
+        remaining = np.arange(len(X))
+        candidates = 4 * k
+        while len(remaining) > 0:
+            which, ids, distances, bounds = query(remaining, k=min(candidates, candidate_count))
+            which, positions, distances = nearest_per_item(which, edge_of[ids], distances, k=k)
+
+            # the points whose kth edge is nearer than every left out candidate
+            counts = np.bincount(which, minlength=len(remaining))
+            kth = np.full(len(remaining), np.inf)
+            kth[counts == k] = distances[np.cumsum(counts)[counts == k] - 1]
+            final = (kth < bounds) | (candidates >= candidate_count)
+            keep = final[which]
+            results.append((remaining[which[keep]], positions[keep], distances[keep]))
+            remaining = remaining[~final]
+            candidates *= 2
+
+        which, positions, distances = (np.concatenate(arrays) for arrays in zip(*results))
+        return nearest_per_item(which, positions, distances)
+
+
+_spatial_indexes = weakref.WeakKeyDictionary()
+_spatial_indexes_lock = threading.Lock()
+
+
+def get_spatial_index(G, rebuild=False, edges=False, full_check=False):
+    """
+    Return the spatial index of a graph, creating it if the graph does not
+    have one yet or if the graph has changed since it was created.
+
+    By default, every call makes a check that takes a few milliseconds
+    however large the graph is (see graph_summary): a new index is created
+    if nodes were added or removed, edges were added or removed between new
+    pairs of nodes, or the crs changed. Moving nodes, changing edge
+    geometries or adding and removing parallel edges in place is not
+    noticed: call invalidate_spatial_index after doing so, or pass
+    full_check=True.
+
+    With full_check=True, the graph's node ids and coordinates are read into
+    arrays and compared to the index's, and with edges=True too the graph's
+    (u, v, key) edges and their geometries are compared to those the index's
+    edge arrays were built from. If only the edges differ, the new index
+    keeps the node trees. This reads the whole graph, so costs about as much
+    as a search on it.
+
+    The index is kept alongside the graph, not in G.graph, so it is never
+    saved with it, and is dropped when the graph is garbage collected.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    rebuild : bool
+        if True, create a new index even if the graph already has one
+    edges : bool
+        if True, the caller searches the index's edges, so full_check also
+        compares them
+    full_check : bool
+        if True, compare the graph's node coordinates, and edges if edges is
+        True, to the index's rather than only its summary
+
+    Returns
+    -------
+    SpatialIndex
+    """
+    # read-only graphs like MappedGraph never change, so are never checked
+    if not isinstance(G, nx.Graph):
+        with _spatial_indexes_lock:
+            index = _spatial_indexes.get(G)
+            if rebuild or index is None:
+                index = _spatial_indexes[G] = SpatialIndex(G)
+        return index
+
+    with _spatial_indexes_lock:
+        index = _spatial_indexes.get(G)
+        if rebuild or index is None or not index.is_current(G):
+            index = _spatial_indexes[G] = SpatialIndex(G)
+        elif full_check:
+            nodes = get_node_arrays(G)
+            if not index.has_nodes(nodes):
+                index = _spatial_indexes[G] = SpatialIndex(G, nodes=nodes)
+            elif edges and not index.has_edges(G):
+                index = _spatial_indexes[G] = index.with_new_edges(G)
+    return index
+
+
+def invalidate_spatial_index(G):
+    """
+    Drop a graph's spatial index, so the next search creates a new one.
+
+    Call this after changing a graph in place in a way get_spatial_index's
+    default check does not notice: moving nodes, changing edge geometries or
+    adding and removing parallel edges.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+
+    Returns
+    -------
+    None
+    """
+    with _spatial_indexes_lock:
+        _spatial_indexes.pop(G, None)
+
+
+def get_projected_nodes(G, to_crs=None):
+    """
+    Get a graph's node coordinates projected to UTM, or to to_crs, without
+    projecting the graph.
+
+    The projected coordinates are computed the first time they are asked for
+    and kept in arrays in the graph's spatial index, next to the original
+    coordinates, until the graph changes (see get_spatial_index and
+    invalidate_spatial_index). One unprojected graph can then serve both lat-lng and
+    projected computations, instead of also holding a projected copy of it
+    from project_graph.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    to_crs : dict or string or pyproj.CRS
+        if not None, project to this CRS instead of to the UTM zone of the
+        nodes' centroid
+
+    Returns
+    -------
+    tuple of (nodes, x, y, crs)
+        array of the node ids in the order of G.nodes, arrays of their
+        projected coordinates, and the crs they are in
+    """
+    index = get_spatial_index(G)
+    crs, x, y = index.get_projected_nodes(to_crs)
+    return index.node_ids, x, y, crs
+
+
+def get_projected_edges(G, to_crs=None):
+    """
+    Get a graph's edge geometries projected to UTM, or to to_crs, without
+    projecting the graph, computed and kept as in get_projected_nodes.
+
+    Edges without a geometry attribute get a straight LineString between their
+    projected nodes.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    to_crs : dict or string or pyproj.CRS
+        if not None, project to this CRS instead of to the UTM zone of the
+        nodes' centroid
+
+    Returns
+    -------
+    tuple of (edge_uv, edge_keys, geometries, crs)
+        array of the edges' (u, v) rows in the order of G.edges, array of
+        their keys, list of their projected LineStrings, and the crs they are
+        in
+    """
+    index = get_spatial_index(G, edges=True)
+    edge_uv, edge_keys, _ = index.get_edges()
+    crs, geometries = index.get_projected_edges(to_crs)
+    return edge_uv, edge_keys, geometries, crs
+
+
+def graph_summary(G):
+    """
+    Summarize a graph cheaply, to tell whether it has changed since a
+    spatial index of it was created.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+
+    Returns
+    -------
+    tuple
+        the identities of the graph's node and adjacency dicts, its crs, the
+        number of nodes and the number of adjacent (u, v) node pairs
+    """
+    # counting every parallel edge through G.number_of_edges takes a python
+    # loop over all the edges, so count the adjacent node pairs in the raw
+    # adjacency dicts instead
+    return id(G._node), id(G._adj), G.graph.get('crs'), len(G), sum(map(len, G._adj.values()))
+
+
+def get_node_arrays(G):
+    """
+    Read a graph's crs and its node ids and coordinates into arrays.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+
+    Returns
+    -------
+    tuple of (crs, node_ids, x, y)
+        the graph's crs, an array of its node ids in the order of G.nodes and
+        arrays of their x and y coordinates
+    """
+    node_ids = np.array(list(G.nodes()))
+    x = np.array([x for _, x in G.nodes(data='x')], dtype=float)
+    y = np.array([y for _, y in G.nodes(data='y')], dtype=float)
+    return G.graph.get('crs'), node_ids, x, y
+
+
+def get_edge_list(G):
+    """
+    Read a graph's edges and their geometries into one flat list.
+
+    The list is flat, rather than a list of tuples, so that keeping it does
+    not slow down the garbage collector.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+
+    Returns
+    -------
+    list
+        u, v, key and geometry (or None) of each edge in the order of G.edges,
+        one after another
+    """
+    return list(chain.from_iterable(G.edges(keys=True, data='geometry')))
+
+
+def build_tree(coords, method):
+    """
+    Build a tree for nearest neighbor search over an array of (x, y) points.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        array of (x, y) rows, or (lng, lat) rows in degrees for 'balltree'
+    method : str {'kdtree', 'balltree'}
+        see SpatialIndex.get_node_tree
+
+    Returns
+    -------
+    scipy.spatial.cKDTree or sklearn.neighbors.BallTree
+    """
+    if method == 'kdtree':
+        # check if we were able to import scipy.spatial.cKDTree successfully
+        if not cKDTree:
+            raise ImportError('The scipy package must be installed to use this optional feature.')
+        return cKDTree(data=coords, compact_nodes=True, balanced_tree=True)
+
+    elif method == 'balltree':
+        # check if we were able to import sklearn.neighbors.BallTree successfully
+        if not BallTree:
+            raise ImportError('The scikit-learn package must be installed to use this optional feature.')
+
+        # haversine requires data in form of [lat, lng] and inputs/outputs in
+        # units of radians
+        return BallTree(np.deg2rad(coords[:, ::-1]), metric='haversine')
+
+    else:
+        raise ValueError('You must pass a valid method name, or None.')
+
+
+def concatenate_coords(geometries):
+    """
+    Concatenate the coordinates of many LineStrings into one array.
+
+    Parameters
+    ----------
+    geometries : list
+        LineStrings
+
+    Returns
+    -------
+    tuple of (coords, starts, ends)
+        array of the lines' (x, y) vertex rows end to end, and arrays of the
+        positions of each line's first and last vertex in it
+    """
+    coords = [np.asarray(geometry.coords)[:, :2] for geometry in geometries]
+    counts = np.array([len(c) for c in coords], dtype=int)
+    coords = np.concatenate(coords) if coords else np.empty((0, 2))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+    return coords, starts, starts + counts - 1
+
+
+def segment_distances(x, y, segments, ids):
+    """
+    Calculate the euclidean distance from each of a list of points to a
+    segment, and the nearest point on the segment.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        the points' x coordinates
+    y : numpy.ndarray
+        the points' y coordinates
+    segments : tuple
+        the segment arrays, see SpatialIndex.get_segments
+    ids : numpy.ndarray
+        the position in the segment arrays of the segment to measure each point
+        against
+
+    Returns
+    -------
+    tuple of (distances, nearest_x, nearest_y)
+    """
+    x0, y0, x1, y1 = (segments[i][ids] for i in range(4))
+    dx, dy = x1 - x0, y1 - y0
+    squared_length = dx ** 2 + dy ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(((x - x0) * dx + (y - y0) * dy) / squared_length, 0, 1)
+    t[squared_length == 0] = 0
+    nearest_x, nearest_y = x0 + t * dx, y0 + t * dy
+    return np.hypot(x - nearest_x, y - nearest_y), nearest_x, nearest_y
+
+
+def query_tree(tree, method, X, Y, k=None, radius=None):
+    """
+    Query a tree built by build_tree for the k nearest of its points to each of
+    a list of points, or for all of its points within some radius of them.
+
+    Parameters
+    ----------
+    tree : scipy.spatial.cKDTree or sklearn.neighbors.BallTree
+    method : str {'kdtree', 'balltree'}
+        the method the tree was built for
+    X : numpy.ndarray
+        the points' x coordinates or longitudes
+    Y : numpy.ndarray
+        the points' y coordinates or latitudes
+    k : int
+        the number of tree points to find for each point, if radius is None
+    radius : float
+        find all the tree points within this distance of each point, in meters
+        for 'balltree'
+
+    Returns
+    -------
+    tuple of (which, ids, distances, bounds)
+        flat arrays of the position in X and Y of each point, the position in
+        the tree's data of each tree point found for it and the distance to
+        it, in meters for 'balltree'. bounds is an array of each point's
+        distance to its kth tree point, infinite if the tree has no more
+        points, or None for a radius query
+    """
+    points = np.column_stack([np.asarray(X, dtype=float), np.asarray(Y, dtype=float)])
+    if method == 'balltree':
+        points = np.deg2rad(points[:, ::-1])
+    size = tree.n if method == 'kdtree' else tree.get_arrays()[0].shape[0]
+
+    if radius is None:
+        k = min(k, size)
+        distances, ids = tree.query(points, k=k)
+        if method == 'balltree':
+            distances = distances * EARTH_RADIUS
+        distances, ids = distances.reshape(len(points), k), ids.reshape(len(points), k)
+        bounds = distances[:, -1] if k < size else np.full(len(points), np.inf)
+        return np.repeat(np.arange(len(points)), k), ids.ravel(), distances.ravel(), bounds
+
+    if method == 'kdtree':
+        ids = tree.query_ball_point(points, radius)
+        counts = np.array([len(point_ids) for point_ids in ids], dtype=int)
+        ids = np.concatenate([np.array(point_ids, dtype=int) for point_ids in ids] + [np.array([], dtype=int)])
+        which = np.repeat(np.arange(len(points)), counts)
+        distances = np.hypot(*(tree.data[ids] - points[which]).T)
+    else:
+        ids, distances = tree.query_radius(points, radius / EARTH_RADIUS, return_distance=True)
+        counts = np.array([len(point_ids) for point_ids in ids], dtype=int)
+        ids = np.concatenate(list(ids) + [np.array([], dtype=int)]).astype(int)
+        distances = np.concatenate(list(distances) + [np.array([])]) * EARTH_RADIUS
+        which = np.repeat(np.arange(len(points)), counts)
+    return which, ids, distances, None
+
+
+def query_segments(tree, segments, X, Y, k=None, radius=None):
+    """
+    Query the R-tree of a graph's edge segments for the segments with the k
+    nearest bounding boxes to each of a list of points, or for all the segments
+    within some radius of them.
+
+    Parameters
+    ----------
+    tree : rtree.index.Index
+        see SpatialIndex.get_segment_tree
+    segments : tuple
+        the segment arrays, see SpatialIndex.get_segments
+    X : numpy.ndarray
+        the points' x coordinates
+    Y : numpy.ndarray
+        the points' y coordinates
+    k : int
+        the number of segments to find for each point, if radius is None
+    radius : float
+        find all the segments within this distance of each point
+
+    Returns
+    -------
+    tuple of (which, ids, distances, bounds)
+        flat arrays of the position in X and Y of each point, the position in
+        the segment arrays of each segment found for it and the exact distance
+        to it. bounds is an array of each point's distance to the kth nearest
+        bounding box, which no segment left out is nearer than, or None for a
+        radius query
+    """
+    points = np.column_stack([X, Y])
+    if radius is None:
+        # exactly k results each, so that ties at the kth cannot overflow
+        # rtree's result arrays
+        ids, counts, bounds = tree.nearest_v(points, points, num_results=k, strict=True, return_max_dists=True)
+        which = np.repeat(np.arange(len(points)), counts.astype(int))
+        distances, _, _ = segment_distances(X[which], Y[which], segments, ids)
+        return which, ids, distances, bounds
+
+    # the nearest bounding boxes within radius, k at a time, until fewer than
+    # k are found
+    results = []
+    remaining = np.arange(len(points))
+    k = 16
+    while len(remaining) > 0:
+        ids, counts = tree.nearest_v(points[remaining], points[remaining], num_results=k, strict=True,
+                                     max_dists=np.full(len(remaining), float(radius)))
+        counts = counts.astype(int)
+        complete = counts < k
+        which = np.repeat(np.arange(len(remaining)), counts)
+        keep = complete[which]
+        results.append((remaining[which[keep]], ids[keep]))
+        remaining = remaining[~complete]
+        k *= 2
+    which, ids = (np.concatenate(arrays) for arrays in zip(*results))
+    distances, _, _ = segment_distances(X[which], Y[which], segments, ids)
+    within = distances <= radius
+    return which[within], ids[within], distances[within], None
+
+
+def nearest_per_item(which, items, distances, k=None):
+    """
+    Keep only the nearest result for each point and item, as when a point is
+    near several segments of the same edge, sorted by point, then distance,
+    then item.
+
+    Parameters
+    ----------
+    which : numpy.ndarray
+        the position of the point each result is for
+    items : numpy.ndarray
+        the position of the item, such as a node or edge, each result found
+    distances : numpy.ndarray
+        the distance from the point to the item
+    k : int
+        if not None, keep only the k nearest items to each point
+
+    Returns
+    -------
+    tuple of (which, items, distances)
+    """
+    order = np.lexsort((distances, items, which))
+    which, items, distances = which[order], items[order], distances[order]
+    first = np.ones(len(which), dtype=bool)
+    first[1:] = (which[1:] != which[:-1]) | (items[1:] != items[:-1])
+    which, items, distances = which[first], items[first], distances[first]
+
+    order = np.lexsort((items, distances, which))
+    which, items, distances = which[order], items[order], distances[order]
+    if k is not None:
+        rank = np.arange(len(which)) - np.searchsorted(which, which)
+        which, items, distances = which[rank < k], items[rank < k], distances[rank < k]
+    return which, items, distances
+
+
+def redistribute_edge_vertices(geometries, dist):
+    """
+    Space points along many LineStrings at once, like redistribute_vertices
+    does for one: round(length / dist) (at least 1) equal steps along each
+    line, from its first point to its last.
+
+    Parameters
+    ----------
+    geometries : list
+        LineStrings
+    dist : float
+        approximate spacing of the points, in the LineStrings' units
+
+    Returns
+    -------
+    tuple of (x, y, positions)
+        the points' coordinate arrays, and the position in geometries of the
+        line each point lies on
+    """
+    # all the lines' vertices end to end, with each vertex's distance along
+    # the concatenated lines. the step from one line to the next has no length
+    coords, starts, ends = concatenate_coords(geometries)
+    steps = np.hypot(*np.diff(coords, axis=0).T)
+    steps[ends[:-1]] = 0
+    along = np.concatenate([[0], np.cumsum(steps)])
+
+    # the distance along the concatenated lines of each point to place
+    lengths = along[ends] - along[starts]
+    num_vert = np.maximum(np.rint(lengths / dist).astype(int), 1)
+    positions = np.repeat(np.arange(len(geometries)), num_vert + 1)
+    first_point = np.concatenate([[0], np.cumsum(num_vert + 1)[:-1]])
+    n = np.arange(len(positions)) - np.repeat(first_point, num_vert + 1)
+    targets = along[starts][positions] + lengths[positions] * n / num_vert[positions]
+
+    # interpolate each point on the segment of its line it falls on
+    segment = np.searchsorted(along, targets, side='right') - 1
+    segment = np.clip(segment, starts[positions], ends[positions] - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.clip((targets - along[segment]) / steps[segment], 0, 1)
+    fraction[steps[segment] == 0] = 0
+    x = coords[segment, 0] + fraction * (coords[segment + 1, 0] - coords[segment, 0])
+    y = coords[segment, 1] + fraction * (coords[segment + 1, 1] - coords[segment, 1])
+    return x, y, positions
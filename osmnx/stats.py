@@ -16,20 +16,22 @@ from .simplify import clean_intersections
 from .geo_utils import get_largest_component
 from .utils import great_circle_vec
 from .geo_utils import count_streets_per_node
+from .spatial_index import get_projected_nodes
 from .utils import euclidean_dist_vec
 from .utils import log
 
 
 
 def basic_stats(G, area=None, clean_intersects=False, tolerance=15,
-                circuity_dist='gc'):
+                circuity_dist='gc', projected=False):
     """
     Calculate basic descriptive metric and topological stats for a graph.
 
     For an unprojected lat-lng graph, tolerance and graph units should be in
     degrees, and circuity_dist should be 'gc'. For a projected graph, tolerance
     and graph units should be in meters (or similar) and circuity_dist should be
-    'euclidean'.
+    'euclidean'. For an unprojected graph measured with projected=True,
+    tolerance should be in meters.
 
     Parameters
     ----------
@@ -47,6 +49,11 @@ def basic_stats(G, area=None, clean_intersects=False, tolerance=15,
         'gc' or 'euclidean', how to calculate straight-line distances for
         circuity measurement; use former for lat-lng networks and latter for
         projected networks
+    projected : bool
+        if True, clean intersections and measure euclidean circuity with the
+        nodes' UTM coordinates from get_projected_nodes, so an unprojected
+        graph can be measured in meters without a projected copy of it;
+        circuity_dist is then ignored
 
     Returns
     -------
@@ -144,7 +151,7 @@ def basic_stats(G, area=None, clean_intersects=False, tolerance=15,
 
     # calculate clean intersection counts
     if clean_intersects:
-        clean_intersection_points = clean_intersections(G, tolerance=tolerance, dead_ends=False )
+        clean_intersection_points = clean_intersections(G, tolerance=tolerance, dead_ends=False, projected=projected)
         clean_intersection_count = len(clean_intersection_points)
     else:
         clean_intersection_count = None
@@ -182,8 +189,16 @@ def basic_stats(G, area=None, clean_intersects=False, tolerance=15,
     # distance between edge endpoints. first load all the edges origin and
     # destination coordinates as a dataframe, then calculate the straight-line
     # distance
-    coords = np.array([[G.nodes[u]['y'], G.nodes[u]['x'], G.nodes[v]['y'], G.nodes[v]['x']] for u, v, k in G.edges(keys=True)])
-    df_coords = pd.DataFrame(coords, columns=['u_y', 'u_x', 'v_y', 'v_x'])
+    if projected:
+        # look up the edges' nodes' positions in the projected coordinate arrays
+        nodes, x, y, _ = get_projected_nodes(G)
+        positions = dict(zip(nodes.tolist(), range(len(nodes))))
+        u, v = np.array([[positions[u], positions[v]] for u, v in G.edges()], dtype=int).reshape(-1, 2).T
+        df_coords = pd.DataFrame({'u_y': y[u], 'u_x': x[u], 'v_y': y[v], 'v_x': x[v]})
+        circuity_dist = 'euclidean'
+    else:
+        coords = np.array([[G.nodes[u]['y'], G.nodes[u]['x'], G.nodes[v]['y'], G.nodes[v]['x']] for u, v, k in G.edges(keys=True)])
+        df_coords = pd.DataFrame(coords, columns=['u_y', 'u_x', 'v_y', 'v_x'])
     if circuity_dist == 'gc':
         gc_distances = great_circle_vec(lat1=df_coords['u_y'],
                                         lng1=df_coords['u_x'],
@@ -1,6 +1,11 @@
 import sys
 import os
+import bz2
+import codecs
 import datetime as dt
+import gzip
+import json
+import re
 import unicodedata
 import numpy as np
 import logging as lg
@@ -62,6 +67,12 @@ def config(data_folder=settings.data_folder,
            imgs_folder=settings.imgs_folder,
            cache_folder=settings.cache_folder,
            use_cache=settings.use_cache,
+           cache_backend=settings.cache_backend,
+           cache_max_bytes=settings.cache_max_bytes,
+           cache_ttl=settings.cache_ttl,
+           http_pool_size=settings.http_pool_size,
+           http_max_retries=settings.http_max_retries,
+           http_backoff_factor=settings.http_backoff_factor,
            log_file=settings.log_file,
            log_console=settings.log_console,
            log_level=settings.log_level,
@@ -81,6 +92,7 @@ def config(data_folder=settings.data_folder,
            nominatim_endpoint=settings.nominatim_endpoint,
            nominatim_key=settings.nominatim_key,
            overpass_endpoint=settings.overpass_endpoint,
+           overpass_max_workers=settings.overpass_max_workers,
            all_oneway=settings.all_oneway):
     """
     Configure osmnx by setting the default global vars to desired values.
@@ -98,6 +110,21 @@ def config(data_folder=settings.data_folder,
     use_cache : bool
         if True, use a local cache to save/retrieve http responses instead of
         calling API repetitively for the same request URL
+    cache_backend : string
+        {'file', 'sqlite'} where to store cached responses: one compressed file
+        per response in cache_folder, or a single database file
+    cache_max_bytes : int
+        max size of the cache in bytes, beyond which the least recently used
+        responses are evicted. if None, the cache size is unlimited
+    cache_ttl : float
+        max age of cached responses in seconds. if None, they never expire
+    http_pool_size : int
+        how many connections per host the shared http session keeps open
+    http_max_retries : int
+        how many times the shared http session retries a request that failed
+        to connect or read, or got a 502 or 503 response
+    http_backoff_factor : float
+        retries wait http_backoff_factor * 2 ** (retry - 1) seconds
     log_file : bool
         if true, save log output to a log file in logs_folder
     log_console : bool
@@ -126,6 +153,9 @@ def config(data_folder=settings.data_folder,
         your API key, if you are using an endpoint that requires one
     overpass_endpoint : string
         which API endpoint to use for overpass queries
+    overpass_max_workers : int
+        max number of overpass sub-queries to run concurrently, capped by the
+        number of slots the endpoint has available
     all_oneway : boolean
         if True, forces all paths to be loaded as oneway ways, preserving
         the original order of nodes stored in the OSM way XML.
@@ -137,6 +167,12 @@ def config(data_folder=settings.data_folder,
 
     # set each global variable to the passed-in parameter value
     settings.use_cache = use_cache
+    settings.cache_backend = cache_backend
+    settings.cache_max_bytes = cache_max_bytes
+    settings.cache_ttl = cache_ttl
+    settings.http_pool_size = http_pool_size
+    settings.http_max_retries = http_max_retries
+    settings.http_backoff_factor = http_backoff_factor
     settings.cache_folder = cache_folder
     settings.data_folder = data_folder
     settings.imgs_folder = imgs_folder
@@ -162,6 +198,7 @@ def config(data_folder=settings.data_folder,
     settings.nominatim_endpoint = nominatim_endpoint
     settings.nominatim_key = nominatim_key
     settings.overpass_endpoint = overpass_endpoint
+    settings.overpass_max_workers = overpass_max_workers
     settings.all_oneway = all_oneway
 
     # if logging is turned on, log that we are configured
@@ -422,3 +459,127 @@ def get_unique_nodes_ordered_from_way(way_edges_df):
             len(unique_ordered_nodes), num_unique_nodes))
 
     return unique_ordered_nodes
+
+
+def iter_json_elements(chunks, key='elements', meta=None):
+    """
+    Incrementally parse a JSON object from an iterable of text or bytes chunks,
+    such as the body of a streamed HTTP response, and yield the items of its
+    array-valued key one at a time.
+
+    Only one chunk and the item being parsed are held in memory at once. The
+    object's other keys are parsed whole and saved into meta, if passed.
+
+    Parameters
+    ----------
+    chunks : iterable
+        str or utf-8 encoded bytes chunks of the JSON document
+    key : string
+        the key of the array whose items to yield
+    meta : dict
+        if not None, save the object's other key-value pairs into it
+
+    Returns
+    -------
+    generator
+        yields each item of the array
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    whitespace = re.compile(r'[ \t\n\r]*')
+    chunks = iter(chunks)
+    state = {'buffer': '', 'pos': 0, 'exhausted': False}
+
+    def read_chunk():
+        # append the next non-empty chunk to the unparsed rest of the buffer
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = text_decoder.decode(chunk)
+            if chunk:
+                state['buffer'] = state['buffer'][state['pos']:] + chunk
+                state['pos'] = 0
+                return
+        state['buffer'] = state['buffer'][state['pos']:] + text_decoder.decode(b'', final=True)
+        state['pos'] = 0
+        state['exhausted'] = True
+
+    def peek():
+        # skip whitespace and return the next character without consuming it
+        while True:
+            state['pos'] = whitespace.match(state['buffer'], state['pos']).end()
+            if state['pos'] < len(state['buffer']):
+                return state['buffer'][state['pos']]
+            if state['exhausted']:
+                raise ValueError('Unexpected end of JSON document')
+            read_chunk()
+
+    def expect(chars):
+        char = peek()
+        if char not in chars:
+            raise ValueError('Expected one of "{}" but found "{}" in JSON document'.format(chars, char))
+        state['pos'] += 1
+        return char
+
+    def decode():
+        # decode the next value, reading more chunks until it is complete. a
+        # number might continue in the next chunk, so only accept one once the
+        # text after it shows it has ended, or there are no more chunks
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(state['buffer'], state['pos'])
+                buffer = state['buffer']
+                if state['exhausted'] or (end < len(buffer) and buffer[end] not in '0123456789.eE+-'):
+                    state['pos'] = end
+                    return value
+            except ValueError:
+                if state['exhausted']:
+                    raise
+            read_chunk()
+
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        name = decode()
+        expect(':')
+        if name == key:
+            expect('[')
+            if peek() == ']':
+                state['pos'] += 1
+            else:
+                while True:
+                    yield decode()
+                    if expect(',]') == ']':
+                        break
+        else:
+            value = decode()
+            if meta is not None:
+                meta[name] = value
+        if expect(',}') == '}':
+            break
+
+
+def open_osm_file(filename):
+    """
+    Open a file of OSM XML data for reading in binary mode, decompressing it
+    on the fly if its extension is .bz2 or .gz.
+
+    Parameters
+    ----------
+    filename : string
+        name of file containing OSM XML data
+
+    Returns
+    -------
+    file object
+    """
+    _, ext = os.path.splitext(filename)
+
+    if ext == '.bz2':
+        return bz2.BZ2File(filename)
+    elif ext == '.gz':
+        return gzip.open(filename, mode='rb')
+    else:
+        # assume an unrecognized file extension is just XML
+        return open(filename, mode='rb')
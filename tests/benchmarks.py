@@ -0,0 +1,637 @@
+################################################################################
+# benchmarks.py
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+#
+# Compare the speed of OSMnx's bulk operations against the one-at-a-time
+# approaches they replaced. Run from the repository root, optionally naming the
+# benchmarks to run:
+#
+#     python tests/benchmarks.py [benchmark ...]
+################################################################################
+
+import bz2
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pandas as pd
+from shapely.geometry import MultiPolygon
+from shapely.geometry import Point
+
+import osmnx as ox
+
+ox.config(log_console=False, log_file=False, use_cache=False)
+
+# the west oakland fixture, scaled up by tiling copies of it next to each other
+# with distinct osm ids
+FIXTURE = 'tests/input_data/West-Oakland.osm.bz2'
+SCALE = 50
+
+
+def scaled_fixture(scale=SCALE):
+    """
+    Load the west oakland fixture as an overpass-like response, tiled scale
+    times with each copy's ids offset and its coordinates shifted north.
+    """
+    response_json = ox.overpass_json_from_file(FIXTURE)
+    elements = []
+    for i in range(scale):
+        offset = i * 10 ** 10
+        for element in response_json['elements']:
+            element = dict(element, id=element['id'] + offset)
+            if element['type'] == 'node':
+                element['lat'] += i * 0.01
+            elif element['type'] == 'way':
+                element['nodes'] = [node + offset for node in element['nodes']]
+            else:
+                continue
+            elements.append(element)
+    return {'elements': elements}
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    """
+    Run function with args and kwargs repeat times, return its last result and
+    its best time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(*args, **kwargs)
+        times.append(time.perf_counter() - start_time)
+    return result, min(times)
+
+
+def report(name, baseline_time, new_time):
+    print('{:<40} {:>9.3f}s {:>9.3f}s {:>7.1f}x'.format(name, baseline_time, new_time, baseline_time / new_time))
+
+
+def add_edge_lengths_dataframe(G):
+    """
+    Add edge lengths the way add_edge_lengths used to: walk every edge to
+    build a dataframe of coordinates indexed by u, v, key.
+    """
+    coords = np.array([[u, v, k, G.nodes[u]['y'], G.nodes[u]['x'], G.nodes[v]['y'], G.nodes[v]['x']] for u, v, k in G.edges(keys=True)])
+    df_coords = pd.DataFrame(coords, columns=['u', 'v', 'k', 'u_y', 'u_x', 'v_y', 'v_x'])
+    df_coords[['u', 'v', 'k']] = df_coords[['u', 'v', 'k']].astype(np.int64)
+    df_coords = df_coords.set_index(['u', 'v', 'k'])
+    gc_distances = ox.great_circle_vec(lat1=df_coords['u_y'], lng1=df_coords['u_x'],
+                                       lat2=df_coords['v_y'], lng2=df_coords['v_x'])
+    gc_distances = gc_distances.fillna(value=0).round(3)
+    nx.set_edge_attributes(G, name='length', values=gc_distances.to_dict())
+    return G
+
+
+def create_graph_node_by_node(response_jsons, name='unnamed', retain_all=False, bidirectional=False):
+    """
+    Build a graph the way create_graph used to: add each node, then each
+    way's edges, one at a time, then walk every edge again to add lengths.
+    """
+    nodes = {}
+    paths = {}
+    for osm_data in response_jsons:
+        nodes_temp, paths_temp = ox.parse_osm_nodes_paths(osm_data)
+        nodes.update(nodes_temp)
+        paths.update(paths_temp)
+
+    G = nx.MultiDiGraph(name=name, crs=ox.settings.default_crs)
+    for node, data in nodes.items():
+        G.add_node(node, **data)
+    G = ox.add_paths(G, paths, bidirectional=bidirectional)
+    if not retain_all:
+        G = ox.get_largest_component(G)
+    if len(G.edges) > 0:
+        G = add_edge_lengths_dataframe(G)
+    return G
+
+
+def benchmark_create_graph():
+    response_json = scaled_fixture()
+    G_baseline, baseline_time = timed(create_graph_node_by_node, [response_json], retain_all=True)
+    G, new_time = timed(ox.create_graph, [response_json], retain_all=True)
+    assert list(G.nodes(data=True)) == list(G_baseline.nodes(data=True))
+    assert list(G.edges(keys=True, data=True)) == list(G_baseline.edges(keys=True, data=True))
+    report('create_graph ({:,} edges)'.format(len(G.edges)), baseline_time, new_time)
+
+
+def benchmark_graph_binary():
+    # save and load mebane and a simplified scaled fixture as graphml and as
+    # binary arrays, with their file sizes
+    G_scaled = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    graphs = [('Mebane', ox.load_graphml('Mebane', folder='data')), ('scaled fixture', G_scaled)]
+    folder = tempfile.mkdtemp()
+    for name, G in graphs:
+        _, baseline_save_time = timed(ox.save_graphml, G, filename='graph.graphml', folder=folder, repeat=1)
+        _, new_save_time = timed(ox.save_graph_binary, G, filename='graph.npz', folder=folder)
+        G_baseline, baseline_load_time = timed(ox.load_graphml, 'graph.graphml', folder=folder, repeat=1)
+        G_binary, new_load_time = timed(ox.load_graph_binary, 'graph.npz', folder=folder)
+        assert list(G_binary.edges(keys=True, data='length')) == list(G.edges(keys=True, data='length'))
+        assert list(G_binary.edges(keys=True, data='osmid')) == list(G_baseline.edges(keys=True, data='osmid'))
+        sizes = [os.path.getsize(os.path.join(folder, filename)) for filename in ['graph.graphml', 'graph.npz']]
+        report('save_graph_binary ({})'.format(name), baseline_save_time, new_save_time)
+        report('load_graph_binary ({})'.format(name), baseline_load_time, new_load_time)
+        print('{:<40} {:>8.2f}MB {:>8.2f}MB {:>7.1f}x'.format('file size ({})'.format(name), sizes[0] / 1e6,
+                                                             sizes[1] / 1e6, sizes[0] / sizes[1]))
+    shutil.rmtree(folder)
+
+
+def benchmark_graph_mapped(routes=100):
+    # opening a mapped graph against loading a graphml file, and reading the
+    # lengths along shortest paths from the mapped arrays against from dicts
+    G = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    folder = tempfile.mkdtemp()
+    ox.save_graphml(G, filename='graph.graphml', folder=folder)
+    ox.save_graph_mapped(G, folder=folder)
+    G_loaded, baseline_time = timed(ox.load_graphml, 'graph.graphml', folder=folder, repeat=1)
+    G_mapped, new_time = timed(ox.load_graph_mapped, folder=folder)
+    report('load_graph_mapped', baseline_time, new_time)
+
+    random_state = np.random.RandomState(0)
+    nodes = list(G.nodes())
+    paths = []
+    while len(paths) < routes:
+        origin, destination = random_state.choice(len(nodes), 2)
+        try:
+            paths.append(nx.shortest_path(G, nodes[origin], nodes[destination], weight='length'))
+        except nx.NetworkXNoPath:
+            pass
+    def route_lengths(G):
+        return [sum(ox.get_route_edge_attributes(G, path, 'length')) for path in paths]
+    baseline_lengths, baseline_time = timed(route_lengths, G_loaded)
+    lengths, new_time = timed(route_lengths, G_mapped)
+    assert np.allclose(lengths, baseline_lengths)
+    report('get_route_edge_attributes ({} mapped)'.format(routes), baseline_time, new_time)
+    shutil.rmtree(folder)
+
+
+def benchmark_graph_from_file():
+    # the fixture's xml with its nodes and ways repeated, written out
+    # uncompressed so that parsing dominates
+    with bz2.BZ2File(FIXTURE) as file:
+        data = file.read()
+    head, body = data.split(b'<node', 1)
+    body, tail = body.rsplit(b'</osm>', 1)
+    handle, filename = tempfile.mkstemp(suffix='.osm')
+    with os.fdopen(handle, 'wb') as file:
+        file.write(head + (b'<node' + body) * SCALE + b'</osm>' + tail)
+
+    G_baseline, baseline_time = timed(ox.graph_from_file, filename, simplify=False, retain_all=True, parser='sax')
+    G, new_time = timed(ox.graph_from_file, filename, simplify=False, retain_all=True)
+    os.remove(filename)
+    assert list(G.edges(keys=True, data=True)) == list(G_baseline.edges(keys=True, data=True))
+    report('graph_from_file ({:.0f} MB)'.format(len(data) * SCALE / 1e6), baseline_time, new_time)
+
+
+def benchmark_graph_from_files():
+    # tiles of the fixture's xml with offset ids, each also written into one
+    # big file for the baseline
+    with bz2.BZ2File(FIXTURE) as file:
+        data = file.read()
+    head, body = data.split(b'<node', 1)
+    body, tail = body.rsplit(b'</osm>', 1)
+    body = b'<node' + body
+
+    folder = tempfile.mkdtemp()
+    tile_count = 8
+    tiles = []
+    for i in range(tile_count):
+        offset = i * 10 ** 10
+        tile_body = re.sub(b'(id|ref)="([0-9]+)"', lambda match: match.group(1) + b'="'
+                           + str(int(match.group(2)) + offset).encode() + b'"', body)
+        tiles.append(tile_body * (SCALE // tile_count))
+    filenames = [os.path.join(folder, 'tile{}.osm'.format(i)) for i in range(tile_count)]
+    for filename, tile_body in zip(filenames, tiles):
+        with open(filename, 'wb') as file:
+            file.write(head + tile_body + b'</osm>' + tail)
+    filename = os.path.join(folder, 'all.osm')
+    with open(filename, 'wb') as file:
+        file.write(head + b''.join(tiles) + b'</osm>' + tail)
+
+    G_baseline, baseline_time = timed(ox.graph_from_file, filename, simplify=False, retain_all=True)
+    G, new_time = timed(ox.graph_from_files, filenames, simplify=False, retain_all=True)
+    shutil.rmtree(folder)
+    assert list(G.edges(keys=True, data=True)) == list(G_baseline.edges(keys=True, data=True))
+    report('graph_from_files ({} files, {} cpus)'.format(tile_count, os.cpu_count()), baseline_time, new_time)
+
+
+def truncate_graph_bbox_node_by_node(G, north, south, east, west, truncate_by_edge=False):
+    """
+    Truncate a graph the way truncate_graph_bbox used to: copy it, check each
+    node and, if truncating by edge, each outside node's neighbors one at a
+    time, then remove the nodes outside.
+    """
+    G = G.copy()
+    nodes_outside_bbox = []
+    for node, data in G.nodes(data=True):
+        if data['y'] > north or data['y'] < south or data['x'] > east or data['x'] < west:
+            if not truncate_by_edge:
+                nodes_outside_bbox.append(node)
+            else:
+                neighbors = list(G.successors(node)) + list(G.predecessors(node))
+                if not any(south < G.nodes[neighbor]['y'] < north and west < G.nodes[neighbor]['x'] < east
+                           for neighbor in neighbors):
+                    nodes_outside_bbox.append(node)
+    G.remove_nodes_from(nodes_outside_bbox)
+    return G
+
+
+def benchmark_truncate_graph_bbox():
+    # the middle half of the tiled fixture, north to south
+    G = ox.create_graph([scaled_fixture()], retain_all=True)
+    y = [data['y'] for _, data in G.nodes(data=True)]
+    north, south = np.percentile(y, 75), np.percentile(y, 25)
+    east, west = -122.2990, -122.3025
+    for truncate_by_edge in [False, True]:
+        G_baseline, baseline_time = timed(truncate_graph_bbox_node_by_node, G, north, south, east, west,
+                                          truncate_by_edge=truncate_by_edge)
+        G_truncated, new_time = timed(ox.truncate_graph_bbox, G, north, south, east, west,
+                                      truncate_by_edge=truncate_by_edge, retain_all=True)
+        assert list(G_truncated.edges(keys=True, data=True)) == list(G_baseline.edges(keys=True, data=True))
+        report('truncate_graph_bbox (by_edge={})'.format(truncate_by_edge), baseline_time, new_time)
+
+
+def truncate_graph_polygon_quadrats(G, polygon):
+    """
+    Truncate a graph the way truncate_graph_polygon used to: copy it, build a
+    GeoDataFrame of node points and intersect it with the polygon's quadrats
+    through an r-tree, then remove the nodes outside.
+    """
+    G = G.copy()
+    node_geom = [Point(data['x'], data['y']) for _, data in G.nodes(data=True)]
+    gdf_nodes = gpd.GeoDataFrame({'node': pd.Series(list(G.nodes())), 'geometry': node_geom})
+    points_within_geometry = ox.intersect_index_quadrats(gdf_nodes, polygon)
+    nodes_outside_polygon = gdf_nodes[~gdf_nodes.index.isin(points_within_geometry.index)]
+    G.remove_nodes_from(nodes_outside_polygon['node'])
+    return G
+
+
+def benchmark_truncate_graph_polygon(sizes=(100000, 1000000, 5000000), max_baseline_size=1000000):
+    # random nodes spread over 0.2 by 0.2 degrees, and a ring-shaped polygon
+    # plus a second disk covering about a quarter of them. the baseline takes
+    # several minutes and gigabytes of memory for millions of nodes, so it is
+    # only run up to max_baseline_size nodes
+    polygon = Point(-122.3, 37.8).buffer(0.08).difference(Point(-122.31, 37.8).buffer(0.04))
+    polygon = MultiPolygon([polygon, Point(-122.22, 37.72).buffer(0.02)])
+    random_state = np.random.RandomState(0)
+    for size in sizes:
+        G = nx.MultiDiGraph(crs=ox.settings.default_crs)
+        G.add_nodes_from((node, {'x': x, 'y': y}) for node, x, y in
+                         zip(range(size), random_state.uniform(-122.4, -122.2, size).tolist(),
+                             random_state.uniform(37.7, 37.9, size).tolist()))
+        G_truncated, new_time = timed(ox.truncate_graph_polygon, G, polygon, retain_all=True, repeat=1)
+        G_chunked, chunked_time = timed(ox.truncate_graph_polygon, G, polygon, retain_all=True,
+                                        chunk_size=size // 4, repeat=1)
+        assert list(G_chunked.nodes()) == list(G_truncated.nodes())
+        if size > max_baseline_size:
+            print('{:<40} {:>10} {:>9.3f}s'.format('truncate_graph_polygon ({:,} nodes)'.format(size), '-', new_time))
+            print('{:<40} {:>10} {:>9.3f}s'.format('truncate_graph_polygon ({:,} nodes, {} cpus)'.format(
+                size, os.cpu_count()), '-', chunked_time))
+            continue
+        G_baseline, baseline_time = timed(truncate_graph_polygon_quadrats, G, polygon, repeat=1)
+        assert list(G_truncated.nodes()) == list(G_baseline.nodes())
+        report('truncate_graph_polygon ({:,} nodes)'.format(size), baseline_time, new_time)
+        report('truncate_graph_polygon ({:,} nodes, {} cpus)'.format(size, os.cpu_count()), baseline_time, chunked_time)
+
+
+def truncate_graph_dist_unbounded(G, source_nodes, max_distance, weight='length'):
+    """
+    Truncate a graph the way truncate_graph_dist used to, once per source node:
+    copy it, measure the distance to every reachable node, then remove the
+    nodes beyond max_distance of every source.
+    """
+    G = G.copy()
+    nearby_nodes = set()
+    for source_node in source_nodes:
+        distances = nx.shortest_path_length(G, source=source_node, weight=weight)
+        nearby_nodes.update(node for node, distance in distances.items() if distance <= max_distance)
+    G.remove_nodes_from([node for node in list(G.nodes()) if node not in nearby_nodes])
+    return G
+
+
+def benchmark_truncate_graph_dist(size=500):
+    # a size by size street grid of 100 meter blocks, and isochrones of 1 km
+    # around one or ten source nodes
+    G = nx.MultiDiGraph(nx.convert_node_labels_to_integers(nx.grid_2d_graph(size, size).to_directed()))
+    nx.set_edge_attributes(G, 100, 'length')
+    random_state = np.random.RandomState(0)
+    for source_count in [1, 10]:
+        source_nodes = random_state.choice(len(G), source_count, replace=False).tolist()
+        G_baseline, baseline_time = timed(truncate_graph_dist_unbounded, G, source_nodes, 1000, repeat=1)
+        G_truncated, new_time = timed(ox.truncate_graph_dist, G, source_nodes, max_distance=1000, retain_all=True,
+                                      repeat=1)
+        assert list(G_truncated.edges(keys=True)) == list(G_baseline.edges(keys=True))
+        report('truncate_graph_dist ({:,} nodes, {} sources)'.format(len(G), source_count), baseline_time, new_time)
+
+
+def get_nearest_nodes_rebuilding(G, X, Y):
+    """
+    Find nearest nodes the way get_nearest_nodes(method='kdtree') used to:
+    build a frame of node coordinates and a k-d tree of it on every call.
+    """
+    from scipy.spatial import cKDTree
+    nodes = pd.DataFrame({'x': nx.get_node_attributes(G, 'x'), 'y': nx.get_node_attributes(G, 'y')})
+    tree = cKDTree(data=nodes[['x', 'y']], compact_nodes=True, balanced_tree=True)
+    _, idx = tree.query(np.array([X, Y]).T, k=1)
+    return np.array(nodes.iloc[idx].index)
+
+
+def benchmark_spatial_index(requests=20, points=100):
+    # a map matching service answering many small batches of points on the
+    # same graph, with the index created by the first request
+    G = ox.create_graph([scaled_fixture()], retain_all=True)
+    y = [data['y'] for _, data in G.nodes(data=True)]
+    random_state = np.random.RandomState(0)
+    batches = [(random_state.uniform(-122.306, -122.292, points), random_state.uniform(min(y), max(y), points))
+               for _ in range(requests)]
+
+    def run(function):
+        return [function(G, X, Y) for X, Y in batches]
+
+    baseline_nodes, baseline_time = timed(run, get_nearest_nodes_rebuilding, repeat=1)
+    nodes, new_time = timed(run, lambda G, X, Y: ox.get_nearest_nodes(G, X, Y, method='kdtree'), repeat=1)
+    assert all((batch == baseline_batch).all() for batch, baseline_batch in zip(nodes, baseline_nodes))
+    report('get_nearest_nodes ({} requests)'.format(requests), baseline_time, new_time)
+
+
+def get_k_nearest_edges_one_by_one(G, X, Y, k):
+    """
+    Find each point's k nearest edges the way one would with get_nearest_edge:
+    measure the distance to every edge geometry and sort them, one point at a
+    time.
+    """
+    edges = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    return np.array([np.sort(edges['geometry'].distance(Point(x, y)).values)[:k] for x, y in zip(X, Y)])
+
+
+def benchmark_k_nearest_edges(points=100, k=5):
+    G = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    y = [data['y'] for _, data in G.nodes(data=True)]
+    random_state = np.random.RandomState(0)
+    X, Y = random_state.uniform(-122.306, -122.292, points), random_state.uniform(min(y), max(y), points)
+    baseline_distances, baseline_time = timed(get_k_nearest_edges_one_by_one, G, X, Y, k, repeat=1)
+    ox.get_spatial_index(G).get_segment_tree()
+    (_, distances), new_time = timed(ox.get_k_nearest_edges, G, X, Y, k=k, repeat=1)
+    assert np.allclose(distances, baseline_distances, rtol=0, atol=1e-12)
+    report('get_k_nearest_edges ({:,} points, k={})'.format(points, k), baseline_time, new_time)
+
+
+def get_nearest_nodes_one_by_one(G, X, Y):
+    """
+    Find nearest nodes the way get_nearest_nodes(method=None) used to: build a
+    frame of every node's coordinates and their haversine distances to each
+    point, one point at a time.
+    """
+    nn = []
+    for x, y in zip(X, Y):
+        coords = [[node, data['x'], data['y']] for node, data in G.nodes(data=True)]
+        df = pd.DataFrame(coords, columns=['node', 'x', 'y']).set_index('node')
+        nn.append(ox.great_circle_vec(lat1=y, lng1=x, lat2=df['y'], lng2=df['x']).idxmin())
+    return np.array(nn)
+
+
+def benchmark_nearest_nodes(points=300):
+    # the default search without scipy or scikit-learn
+    G = ox.create_graph([scaled_fixture()], retain_all=True)
+    y = [data['y'] for _, data in G.nodes(data=True)]
+    random_state = np.random.RandomState(0)
+    X, Y = random_state.uniform(-122.306, -122.292, points), random_state.uniform(min(y), max(y), points)
+    baseline_nodes, baseline_time = timed(get_nearest_nodes_one_by_one, G, X, Y, repeat=1)
+    nodes, new_time = timed(ox.get_nearest_nodes, G, X, Y, repeat=1)
+    assert (nodes == baseline_nodes).all()
+    report('get_nearest_nodes ({:,} points, {:,} nodes)'.format(points, len(G)), baseline_time, new_time)
+
+
+def get_nearest_edges_densified(G, X, Y, dist=0.0001):
+    """
+    Find nearest edges the way get_nearest_edges(method='kdtree') used to:
+    space shapely points dist apart along every edge, explode them into a
+    frame and build a k-d tree of them on every call.
+    """
+    from scipy.spatial import cKDTree
+    edges = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    edges['points'] = edges.apply(lambda x: ox.redistribute_vertices(x.geometry, dist), axis=1)
+    extended = edges['points'].apply([pd.Series]).stack().reset_index(level=1, drop=True).join(edges).reset_index()
+    nbdata = np.array(list(zip(extended['Series'].apply(lambda x: x.x), extended['Series'].apply(lambda x: x.y))))
+    btree = cKDTree(data=nbdata, compact_nodes=True, balanced_tree=True)
+    _, idx = btree.query(np.array([X, Y]).T, k=1)
+    return np.array(edges.loc[extended.loc[idx, 'index'], ['u', 'v']])
+
+
+def benchmark_nearest_edges(points=10000):
+    # the exact search builds its segment r-tree on first use, which is
+    # included in its time, against one approximate densified search
+    G = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    y = [data['y'] for _, data in G.nodes(data=True)]
+    random_state = np.random.RandomState(0)
+    X, Y = random_state.uniform(-122.306, -122.292, points), random_state.uniform(min(y), max(y), points)
+    def get_nearest_edges(G, X, Y):
+        ox.get_spatial_index(G, rebuild=True)
+        return ox.get_nearest_edges(G, X, Y)
+
+    _, baseline_time = timed(get_nearest_edges_densified, G, X, Y, repeat=1)
+    ne, new_time = timed(get_nearest_edges, G, X, Y, repeat=1)
+
+    # spot check that the edges found are as near as the nearest geometry
+    edges = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    for (u, v), x, y in zip(ne[:20], X, Y):
+        distances = edges['geometry'].distance(Point(x, y))
+        assert abs(distances[(edges['u'] == u) & (edges['v'] == v)].min() - distances.min()) < 1e-12
+    report('get_nearest_edges ({:,} points, exact)'.format(points), baseline_time, new_time)
+
+
+def project_geometry_by_gdf(geometry, crs=None, to_latlong=False):
+    """
+    Project a geometry the way project_geometry used to: put it in a
+    one-row GeoDataFrame and project that, building new crs and transformer
+    objects every time.
+    """
+    import math
+    gdf = gpd.GeoDataFrame()
+    gdf.crs = crs or ox.settings.default_crs
+    gdf['geometry'] = None
+    gdf.loc[0, 'geometry'] = geometry
+    if to_latlong:
+        gdf_proj = gdf.to_crs(ox.settings.default_crs)
+    else:
+        utm_zone = int(math.floor((gdf['geometry'].unary_union.centroid.x + 180) / 6.) + 1)
+        gdf_proj = gdf.to_crs('+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs'.format(utm_zone))
+    return gdf_proj['geometry'].iloc[0], gdf_proj.crs
+
+
+def benchmark_project_geometry(places=200):
+    # project a buffered point to utm and its buffer back, as graph_from_point
+    # and graph_from_polygon do, for many places
+    points = [Point(-122.3 + i * 0.001, 37.8) for i in range(places)]
+    def project_places(project_geometry):
+        buffers = []
+        for point in points:
+            point_proj, crs_proj = project_geometry(point)
+            buffers.append(project_geometry(point_proj.buffer(1000), crs=crs_proj, to_latlong=True)[0])
+        return buffers
+
+    baseline_buffers, baseline_time = timed(project_places, project_geometry_by_gdf, repeat=1)
+    buffers, new_time = timed(project_places, ox.project_geometry)
+    assert all(buffer.equals_exact(baseline_buffer, 1e-9) for buffer, baseline_buffer in zip(buffers, baseline_buffers))
+    report('project_geometry ({} places)'.format(places), baseline_time, new_time)
+
+
+def project_graph_by_gdfs(G):
+    """
+    Project a graph the way project_graph used to: project a frame of node
+    points and one of edge geometries, then rebuild the graph looking up each
+    edge's projected geometry by its u, v and key.
+    """
+    from shapely.geometry import Point
+    G_proj = G.copy()
+    nodes, data = zip(*G_proj.nodes(data=True))
+    gdf_nodes = gpd.GeoDataFrame(list(data), index=nodes)
+    gdf_nodes.crs = G_proj.graph['crs']
+    gdf_nodes['lon'] = gdf_nodes['x']
+    gdf_nodes['lat'] = gdf_nodes['y']
+    gdf_nodes['geometry'] = gdf_nodes.apply(lambda row: Point(row['x'], row['y']), axis=1)
+    gdf_nodes.set_geometry('geometry', inplace=True)
+    gdf_nodes_utm = ox.project_gdf(gdf_nodes)
+    edges_with_geom = [{'u': u, 'v': v, 'key': key, 'geometry': data['geometry']}
+                       for u, v, key, data in G_proj.edges(keys=True, data=True) if 'geometry' in data]
+    gdf_edges = gpd.GeoDataFrame(edges_with_geom)
+    gdf_edges.crs = G_proj.graph['crs']
+    gdf_edges_utm = ox.project_gdf(gdf_edges)
+    gdf_nodes_utm['x'] = gdf_nodes_utm['geometry'].map(lambda point: point.x)
+    gdf_nodes_utm['y'] = gdf_nodes_utm['geometry'].map(lambda point: point.y)
+    gdf_nodes_utm = gdf_nodes_utm.drop('geometry', axis=1)
+    edges = list(G_proj.edges(keys=True, data=True))
+    G_proj.clear()
+    G_proj.add_nodes_from(gdf_nodes_utm.index)
+    attributes = gdf_nodes_utm.to_dict()
+    for label in gdf_nodes_utm.columns:
+        nx.set_node_attributes(G_proj, name=label, values=attributes[label])
+    for u, v, key, attributes in edges:
+        if 'geometry' in attributes:
+            row = gdf_edges_utm[(gdf_edges_utm['u']==u) & (gdf_edges_utm['v']==v) & (gdf_edges_utm['key']==key)]
+            attributes['geometry'] = row['geometry'].iloc[0]
+        G_proj.add_edge(u, v, **attributes)
+    G_proj.graph['crs'] = gdf_nodes_utm.crs
+    return G_proj
+
+
+def benchmark_project_graph():
+    G = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    G_baseline, baseline_time = timed(project_graph_by_gdfs, G, repeat=1)
+    G_proj, new_time = timed(ox.project_graph, G)
+    assert G_proj.graph['crs'] == G_baseline.graph['crs']
+    assert np.allclose([data['x'] for _, data in G_proj.nodes(data=True)],
+                       [data['x'] for _, data in G_baseline.nodes(data=True)])
+    report('project_graph ({:,} edges)'.format(G.number_of_edges()), baseline_time, new_time)
+
+
+def benchmark_projected_stats():
+    # measure an unprojected graph in meters from its lazily projected
+    # coordinates, against projecting a copy of the graph to measure
+    G = ox.simplify_graph(ox.create_graph([scaled_fixture()], retain_all=True))
+    def project_and_measure(G):
+        return ox.basic_stats(ox.project_graph(G), clean_intersects=True, circuity_dist='euclidean')
+    def measure_projected(G):
+        ox.get_spatial_index(G, rebuild=True)
+        return ox.basic_stats(G, clean_intersects=True, projected=True)
+
+    baseline_stats, baseline_time = timed(project_and_measure, G, repeat=1)
+    stats, new_time = timed(measure_projected, G, repeat=1)
+    assert stats['clean_intersection_count'] == baseline_stats['clean_intersection_count']
+    assert np.isclose(stats['circuity_avg'], baseline_stats['circuity_avg'])
+    report('basic_stats (projected=True)', baseline_time, new_time)
+
+
+def build_path_recursive(G, node, endpoints, path):
+    """
+    Build a path the way build_path used to: one recursive call per
+    interstitial node, checking membership in the path list.
+    """
+    for successor in G.successors(node):
+        if successor not in path:
+            path.append(successor)
+            if successor not in endpoints:
+                path = build_path_recursive(G, successor, endpoints, path)
+            else:
+                return path
+    if (path[-1] not in endpoints) and (path[0] in G.successors(path[-1])):
+        path.append(path[0])
+    return path
+
+
+def get_paths_to_simplify_node_by_node(G, strict=True):
+    """
+    Find the paths to simplify the way get_paths_to_simplify used to: call
+    is_endpoint on each node, then build each path recursively.
+    """
+    endpoints = set([node for node in G.nodes() if ox.is_endpoint(G, node, strict=strict)])
+    paths_to_simplify = []
+    for node in endpoints:
+        for successor in G.successors(node):
+            if successor not in endpoints:
+                paths_to_simplify.append(build_path_recursive(G, successor, endpoints, path=[node, successor]))
+    return paths_to_simplify
+
+
+def benchmark_get_paths_to_simplify():
+    G = ox.create_graph([scaled_fixture()], retain_all=True)
+    for strict in [True, False]:
+        baseline_paths, baseline_time = timed(get_paths_to_simplify_node_by_node, G, strict=strict)
+        paths, new_time = timed(ox.get_paths_to_simplify, G, strict=strict)
+        assert paths == baseline_paths
+        report('get_paths_to_simplify (strict={})'.format(strict), baseline_time, new_time)
+
+    # rural-style chains of many interstitial nodes, just short enough for the
+    # recursive version not to hit the recursion limit
+    G = nx.MultiDiGraph()
+    chain_length = 800
+    for chain in range(100):
+        nodes = [0] + list(range(chain * chain_length + 1, (chain + 1) * chain_length)) + [-1 - chain % 10]
+        nx.add_path(G, nodes, osmid=chain)
+        nx.add_path(G, nodes[::-1], osmid=chain)
+    baseline_paths, baseline_time = timed(get_paths_to_simplify_node_by_node, G)
+    paths, new_time = timed(ox.get_paths_to_simplify, G)
+    assert paths == baseline_paths
+    report('get_paths_to_simplify (long chains)', baseline_time, new_time)
+
+
+def benchmark_simplify_graph_by_tiles():
+    # parallel speedup depends on the number of processors available
+    G = ox.create_graph([scaled_fixture()], retain_all=True)
+    G_serial, baseline_time = timed(ox.simplify_graph, G)
+    for tiles in [4, 16]:
+        G_tiled, new_time = timed(ox.simplify_graph, G, tiles=tiles)
+        assert list(G_tiled.edges(keys=True, data='length')) == list(G_serial.edges(keys=True, data='length'))
+        report('simplify_graph (tiles={}, {} cpus)'.format(tiles, os.cpu_count()), baseline_time, new_time)
+
+
+benchmarks = {'create_graph': benchmark_create_graph,
+              'graph_binary': benchmark_graph_binary,
+              'graph_from_file': benchmark_graph_from_file,
+              'graph_mapped': benchmark_graph_mapped,
+              'graph_from_files': benchmark_graph_from_files,
+              'get_paths_to_simplify': benchmark_get_paths_to_simplify,
+              'k_nearest_edges': benchmark_k_nearest_edges,
+              'nearest_edges': benchmark_nearest_edges,
+              'nearest_nodes': benchmark_nearest_nodes,
+              'project_geometry': benchmark_project_geometry,
+              'project_graph': benchmark_project_graph,
+              'projected_stats': benchmark_projected_stats,
+              'simplify_graph_by_tiles': benchmark_simplify_graph_by_tiles,
+              'spatial_index': benchmark_spatial_index,
+              'truncate_graph_bbox': benchmark_truncate_graph_bbox,
+              'truncate_graph_dist': benchmark_truncate_graph_dist,
+              'truncate_graph_polygon': benchmark_truncate_graph_polygon}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(benchmarks)
+    print('{:<40} {:>10} {:>10} {:>8}'.format('benchmark', 'baseline', 'new', 'speedup'))
+    for name in names:
+        benchmarks[name]()
@@ -16,6 +16,12 @@ import os, shutil
 if os.path.exists('.temp'):
     shutil.rmtree('.temp')
 
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
 import osmnx as ox
 from networkx.exception import NetworkXNotImplemented
 
@@ -25,6 +31,78 @@ ox.config(log_console=True, log_file=True, use_cache=True,
           imgs_folder='.temp/imgs', cache_folder='.temp/cache')
 
 
+def configure_temp(**kwargs):
+    """
+    Configure OSMnx like the module does above, with settings overridden by
+    kwargs.
+    """
+    settings = dict(log_console=True, log_file=True, use_cache=True,
+                    data_folder='.temp/data', logs_folder='.temp/logs',
+                    imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+    settings.update(kwargs)
+    ox.config(**settings)
+
+
+def stub_overpass_status(slots):
+    """
+    Return an overpass status endpoint response reporting slots free slots.
+    """
+    return 200, ('Connected as: 1\nCurrent time: 2020-01-01T00:00:00Z\n'
+                 'Rate limit: {0}\n{0} slots available now.\n'.format(slots))
+
+
+@contextmanager
+def stub_server(get=None, post=None, keep_alive=False):
+    """
+    Serve get and post callables from a local http server for the duration
+    of a with block, yielding its endpoint url, then restore the module's
+    OSMnx configuration.
+
+    Each callable is passed the request handler, and post the request body
+    too. It returns a (status, body) tuple, where body is bytes, a string or
+    an object to send as json, or None to send no response.
+    """
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+
+        def do_GET(self):
+            self._respond(get(self))
+
+        def do_POST(self):
+            self._respond(post(self, self.rfile.read(int(self.headers['Content-Length']))))
+
+        def _respond(self, response):
+            if response is None:
+                return
+            status, body = response
+            content_type = 'text/plain'
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            elif not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+                content_type = 'application/json'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class StubServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield 'http://127.0.0.1:{}/api'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        configure_temp()
+
+
 def test_imports():
     # test all of OSMnx's module imports
     import ast
@@ -139,6 +217,446 @@ def test_graph_from_file():
     os.remove(temp_filename)
 
 
+def test_graph_from_file_parsers():
+    # test that the iterparse and sax readers build the same graph from
+    # plain, .bz2 and .gz files, the iterparse one in less memory
+    import bz2, gzip, tempfile, tracemalloc
+
+    with bz2.BZ2File('tests/input_data/West-Oakland.osm.bz2') as input:
+        data = input.read()
+    temp_folder = tempfile.mkdtemp()
+    filenames = ['tests/input_data/West-Oakland.osm.bz2', os.path.join(temp_folder, 'West-Oakland.osm'),
+                 os.path.join(temp_folder, 'West-Oakland.osm.gz')]
+    with open(filenames[1], 'wb') as output:
+        output.write(data)
+    with gzip.open(filenames[2], 'wb') as output:
+        output.write(data)
+
+    for filename in filenames:
+        G_sax = ox.graph_from_file(filename, simplify=False, retain_all=True, parser='sax')
+        G = ox.graph_from_file(filename, simplify=False, retain_all=True)
+        assert list(G.nodes(data=True)) == list(G_sax.nodes(data=True))
+        assert list(G.edges(keys=True, data=True)) == list(G_sax.edges(keys=True, data=True))
+
+    tracemalloc.start()
+    ox.overpass_json_from_file(filenames[1])
+    _, sax_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    ox.osm_arrays_from_file(filenames[1])
+    _, iterparse_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert iterparse_peak < sax_peak / 2
+
+    shutil.rmtree(temp_folder)
+
+
+def test_graph_from_file_filters():
+    # test filtering ways by network type and keeping only useful tags while
+    # reading a file, and parsing its relations for footprints and pois
+    filename = 'tests/input_data/West-Oakland.osm.bz2'
+
+    response_json = ox.overpass_json_from_file(filename)
+    relations = [element for element in response_json['elements'] if element['type'] == 'relation']
+    assert len(relations) == 23
+    assert all(relation['members'] for relation in relations)
+    assert {'type': 'way', 'ref': 6358365, 'role': ''} in relations[0]['members']
+
+    osm_filter = 'way["highway"]' + ox.get_osm_filter('drive')
+    passes = ox.parse_osm_filter(osm_filter)
+    assert passes({'highway': 'residential'})
+    assert not passes({'highway': 'footway'})
+    assert not passes({'highway': 'residential', 'access': 'private'})
+    assert not passes({'building': 'yes'})
+
+    response_json = ox.overpass_json_from_file(filename, useful_tags_node=[], useful_tags_path=['highway'],
+                                               osm_filter=osm_filter)
+    ways = [element for element in response_json['elements'] if element['type'] == 'way']
+    nodes = [element for element in response_json['elements'] if element['type'] == 'node']
+    assert 0 < len(ways) < 66
+    assert all(passes(way['tags']) and list(way['tags']) == ['highway'] for way in ways)
+    assert set(node['id'] for node in nodes) == set(node for way in ways for node in way['nodes'])
+    assert not any(node['tags'] for node in nodes)
+
+    G = ox.graph_from_file(filename, network_type='drive', simplify=False, retain_all=True)
+    G_sax = ox.graph_from_file(filename, network_type='drive', simplify=False, retain_all=True, parser='sax')
+    assert list(G.nodes(data=True)) == list(G_sax.nodes(data=True))
+    assert list(G.edges(keys=True, data=True)) == list(G_sax.edges(keys=True, data=True))
+    assert set(G.nodes()) == set(node['id'] for node in nodes)
+    assert set(osmid for _, _, osmid in G.edges(data='osmid')) == set(way['id'] for way in ways)
+
+    response_json = ox.overpass_json_from_file(filename)
+    footprints = ox.create_footprints_gdf(responses=[response_json])
+    assert len(footprints) == 23
+    pois = ox.create_poi_gdf(response=response_json, amenities=['place_of_worship', 'school'])
+    assert set(pois['amenity']) == {'place_of_worship', 'school'}
+
+
+def test_graph_from_files():
+    # split the west oakland file into tiles whose ways share boundary nodes,
+    # with one way repeated in two tiles, and build one graph from them
+    import bz2, gzip, tempfile
+    import xml.etree.ElementTree as etree
+
+    with bz2.BZ2File('tests/input_data/West-Oakland.osm.bz2') as input:
+        root = etree.parse(input).getroot()
+    nodes = {element.get('id'): element for element in root.iter('node')}
+    ways = list(root.iter('way'))
+    tiles = [ways[:30], ways[29:50], ways[50:]]
+
+    temp_folder = tempfile.mkdtemp()
+    filenames = []
+    response_jsons = []
+    for i, tile_ways in enumerate(tiles):
+        tile = etree.Element('osm', version='0.6')
+        tile_nodes = set(nd.get('ref') for way in tile_ways for nd in way.iter('nd'))
+        tile.extend(element for node_id, element in nodes.items() if node_id in tile_nodes)
+        tile.extend(tile_ways)
+        filename = os.path.join(temp_folder, 'tile{}.osm.gz'.format(i))
+        with gzip.open(filename, 'wb') as output:
+            output.write(etree.tostring(tile))
+        filenames.append(filename)
+        response_jsons.append(ox.overpass_json_from_file(filename))
+
+    G = ox.graph_from_files(filenames, simplify=False, retain_all=True, max_workers=2)
+    G_expected = ox.create_graph(response_jsons, retain_all=True)
+    assert list(G.nodes(data=True)) == list(G_expected.nodes(data=True))
+    assert list(G.edges(keys=True, data=True)) == list(G_expected.edges(keys=True, data=True))
+
+    G_file = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', simplify=False, retain_all=True)
+    assert set(G.nodes()) <= set(G_file.nodes())
+    assert sorted(G.edges(keys=True)) == sorted(G_file.edges(keys=True))
+
+    G = ox.graph_from_files(filenames, network_type='drive', max_workers=2)
+    G_file = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', network_type='drive')
+    assert sorted(G.edges(keys=True, data='length')) == sorted(G_file.edges(keys=True, data='length'))
+
+    # useful tags set in the parent reach workers that do not inherit its settings
+    import multiprocessing
+    start_method = multiprocessing.get_start_method()
+    useful_tags_path = ox.settings.useful_tags_path
+    multiprocessing.set_start_method('spawn', force=True)
+    ox.settings.useful_tags_path = useful_tags_path + ['tiger:cfcc']
+    try:
+        G = ox.graph_from_files(filenames, simplify=False, retain_all=True, max_workers=2)
+    finally:
+        multiprocessing.set_start_method(start_method, force=True)
+        ox.settings.useful_tags_path = useful_tags_path
+    assert any('tiger:cfcc' in data for u, v, data in G.edges(data=True))
+
+    shutil.rmtree(temp_folder)
+
+
+def test_truncate_graph_bbox():
+    # the vectorized truncation keeps the nodes inside the bbox, plus with
+    # truncate_by_edge those with a neighbor strictly inside it, in their
+    # original order and with all the edges between them
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', simplify=False, retain_all=True)
+    north, south, east, west = 37.8085, 37.8065, -122.2990, -122.3025
+
+    def inside(node, strict=False):
+        y, x = G.nodes[node]['y'], G.nodes[node]['x']
+        if strict:
+            return south < y < north and west < x < east
+        return south <= y <= north and west <= x <= east
+
+    for truncate_by_edge in [False, True]:
+        G_truncated = ox.truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=truncate_by_edge,
+                                             retain_all=True)
+        expected_nodes = [node for node in G.nodes() if inside(node) or (truncate_by_edge and any(
+            inside(neighbor, strict=True) for neighbor in list(G.successors(node)) + list(G.predecessors(node))))]
+        assert list(G_truncated.nodes()) == expected_nodes
+        assert list(G_truncated.edges(keys=True)) == [(u, v, k) for u, v, k in G.edges(keys=True)
+                                                        if u in G_truncated and v in G_truncated]
+    assert len(G_truncated) > len(ox.truncate_graph_bbox(G, north, south, east, west, retain_all=True))
+
+
+def test_truncate_graph_polygon():
+    import networkx as nx
+    from shapely.geometry import MultiPolygon, Point, Polygon
+
+    # points within the polygon or on its boundary are inside it, tested
+    # either all at once or in parallel chunks
+    square = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+    x, y = [0, 0.5, 1.0000001, 0.5, 1, 2], [0, 0.5, 0.5, 1, 0.3, 2]
+    assert list(ox.points_in_polygon(x, y, square)) == [True, True, False, True, True, False]
+    assert list(ox.points_in_polygon(x, y, square, chunk_size=2, max_workers=2)) == [True, True, False, True, True, False]
+
+    # the truncated graph keeps the nodes intersecting a polygon with a hole
+    # or a multipolygon, in their original order, with the edges between them
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', simplify=False, retain_all=True)
+    ring = Point(-122.300, 37.807).buffer(0.004).difference(Point(-122.301, 37.807).buffer(0.001))
+    disks = MultiPolygon([Point(-122.300, 37.807).buffer(0.001), Point(-122.296, 37.809).buffer(0.0015)])
+    for polygon in [ring, disks]:
+        inside = set(node for node, data in G.nodes(data=True) if Point(data['x'], data['y']).intersects(polygon))
+        G_truncated = ox.truncate_graph_polygon(G, polygon, retain_all=True)
+        expected_nodes = [node for node in G.nodes() if node in inside]
+        assert 0 < len(expected_nodes) < len(G)
+        assert list(G_truncated.nodes()) == expected_nodes
+        assert list(G_truncated.edges(keys=True)) == [(u, v, k) for u, v, k in G.edges(keys=True)
+                                                        if u in G_truncated and v in G_truncated]
+
+        # truncating by edge also keeps the nodes with any neighbor inside
+        G_truncated = ox.truncate_graph_polygon(G, polygon, retain_all=True, truncate_by_edge=True)
+        expected_nodes = [node for node in G.nodes() if node in inside or
+                          any(neighbor in inside for neighbor in nx.all_neighbors(G, node))]
+        assert len(expected_nodes) > len(inside)
+        assert list(G_truncated.nodes()) == expected_nodes
+
+
+def test_truncate_graph_dist():
+    import networkx as nx
+    import pytest
+
+    # the bounded search keeps exactly the nodes within max_distance of the
+    # nearest source node, in their original order
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    sources = list(G.nodes())[:3]
+    lengths = [nx.single_source_dijkstra_path_length(G, source, weight='length') for source in sources]
+    for source_node, max_distance in [(sources[0], 300), (sources, 250)]:
+        G_truncated = ox.truncate_graph_dist(G, source_node, max_distance=max_distance, retain_all=True)
+        n_sources = 1 if source_node == sources[0] else len(sources)
+        expected_nodes = [node for node in G.nodes() if any(
+            length.get(node, float('inf')) <= max_distance for length in lengths[:n_sources])]
+        assert 0 < len(expected_nodes) < len(G)
+        assert list(G_truncated.nodes()) == expected_nodes
+        assert G_truncated.number_of_edges() == G.subgraph(expected_nodes).number_of_edges()
+
+    # source nodes missing from the graph are named in the error
+    for source_node in [0, [sources[0], 0]]:
+        with pytest.raises(nx.NodeNotFound, match='source_node 0 not found'):
+            ox.truncate_graph_dist(G, source_node)
+
+
+def test_inplace_truncation_and_simplification():
+    import tracemalloc
+    from shapely.geometry import Point
+
+    def traced(function, *args, **kwargs):
+        tracemalloc.start()
+        result = function(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, peak
+
+    # working in place returns the same graph as working on a copy, as the
+    # input graph itself, and at a fraction of the peak memory
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', simplify=False, retain_all=True)
+    polygon = Point(-122.300, 37.807).buffer(0.004)
+    for function, args, kwargs in [(ox.truncate_graph_bbox, (37.8085, 37.8065, -122.2990, -122.3025), {}),
+                                   (ox.truncate_graph_polygon, (polygon,), {}),
+                                   (ox.truncate_graph_dist, (list(G.nodes())[0], 1000), {}),
+                                   (ox.get_largest_component, (), {}),
+                                   (ox.simplify_graph, (), {}),
+                                   (ox.simplify_graph, (), {'tiles': 4, 'max_workers': 2})]:
+        G_copy, G_inplace = G.copy(), G.copy()
+        G_copied, peak_copied = traced(function, G_copy, *args, **kwargs)
+        G_result, peak_inplace = traced(function, G_inplace, *args, inplace=True, **kwargs)
+        assert G_result is G_inplace
+        assert len(G_copy) == len(G)
+        assert list(G_result.nodes()) == list(G_copied.nodes())
+        assert list(G_result.edges(keys=True, data='length')) == list(G_copied.edges(keys=True, data='length'))
+        if 'tiles' not in kwargs:
+            assert peak_inplace < peak_copied / 2
+
+
+def test_spatial_index():
+    from shapely.geometry import LineString
+    from shapely.geometry import Point
+
+    # the graph's spatial index is created once and reused by every nearest
+    # node and edge search, until nodes are added or removed
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    index = ox.get_spatial_index(G)
+    assert ox.get_spatial_index(G) is index
+    X, Y = [-122.3030, -122.2980, -122.2955], [37.8050, 37.8075, 37.8100]
+    expected_nodes = [min(G.nodes(), key=lambda node: (G.nodes[node]['x'] - x) ** 2 + (G.nodes[node]['y'] - y) ** 2)
+                      for x, y in zip(X, Y)]
+    assert list(ox.get_nearest_nodes(G, X, Y, method='kdtree')) == expected_nodes
+    assert [ox.get_nearest_node(G, (y, x), method='euclidean') for x, y in zip(X, Y)] == expected_nodes
+    assert list(ox.get_nearest_nodes(G, X, Y)) == list(ox.get_nearest_nodes(G, X, Y, method='balltree'))
+    assert list(ox.get_nearest_nodes(G, X, Y, chunk_size=2)) == [ox.get_nearest_node(G, (y, x)) for x, y in zip(X, Y)]
+    ox.get_nearest_edges(G, X, Y, method='kdtree')
+    assert ox.get_spatial_index(G) is index
+    assert index.get_node_tree('kdtree') is index.get_node_tree('kdtree')
+
+    # the nearest edges are exactly as near as the closest edge geometries,
+    # and the nearest points lie on them
+    edges = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
+    ne, dist, points = ox.get_nearest_edge_points(G, X, Y)
+    for x, y, (u, v, key), distance, point in zip(X, Y, ne, dist, points):
+        distances = edges['geometry'].distance(Point(x, y))
+        assert abs(distance - distances.min()) < 1e-12
+        edge = edges[(edges['u'] == u) & (edges['v'] == v) & (edges['key'] == key)].iloc[0]
+        assert abs(edge['geometry'].distance(Point(x, y)) - distance) < 1e-12
+        assert edge['geometry'].distance(Point(point)) < 1e-12
+    assert [tuple(edge) for edge in ox.get_nearest_edges(G, X, Y)] == [(u, v) for u, v, _ in ne]
+    geometry, u, v = ox.get_nearest_edge(G, (Y[0], X[0]))
+    assert (u, v) == tuple(ne[0][:2])
+
+    G.remove_node(expected_nodes[0])
+    assert ox.get_spatial_index(G) is not index
+    assert ox.get_nearest_nodes(G, X, Y, method='kdtree')[0] != expected_nodes[0]
+    index = ox.get_spatial_index(G)
+    assert ox.get_spatial_index(G, rebuild=True) is not index
+
+    # searches answer for the graph as it is now after nodes or edges are
+    # added or removed, which a cheap check of the graph notices
+    node = expected_nodes[1]
+    assert ox.get_nearest_nodes(G, [10], [10], method='kdtree')[0] in G
+    G.remove_node(ox.get_nearest_node(G, (10, 10), method='euclidean'))
+    G.add_node(-1, x=10, y=10)
+    assert ox.get_nearest_nodes(G, [10], [10], method='kdtree')[0] == -1
+    assert ox.get_nearest_node(G, (10, 10), method='euclidean') == -1
+    G.remove_node(-1)
+    (u, v, key), = ox.get_nearest_edge_points(G, [X[2]], [Y[2]])[0]
+    G.remove_edge(u, v, key)
+    (u2, v2, key2), = ox.get_nearest_edge_points(G, [X[2]], [Y[2]])[0]
+    assert G.has_edge(u2, v2, key2) and (u2, v2, key2) != (u, v, key)
+
+    # moving nodes or changing geometries in place needs a full check or an
+    # explicit invalidation
+    index = ox.get_spatial_index(G)
+    G.nodes[node]['x'], G.nodes[node]['y'] = 20, 20
+    assert ox.get_spatial_index(G) is index
+    assert ox.get_spatial_index(G, full_check=True) is not index
+    for method in [None, 'kdtree', 'balltree']:
+        assert ox.get_nearest_nodes(G, [20], [20], method=method)[0] == node
+    G.nodes[node]['x'], G.nodes[node]['y'] = 30, 30
+    ox.invalidate_spatial_index(G)
+    assert ox.get_nearest_nodes(G, [30], [30], method='kdtree')[0] == node
+    index = ox.get_spatial_index(G, edges=True)
+    tree = index.get_node_tree('kdtree')
+    index.get_edges()
+    G.edges[u2, v2, key2]['geometry'] = LineString([(30, 30), (40, 40)])
+    assert ox.get_spatial_index(G, edges=True, full_check=True) is not index
+    assert ox.get_spatial_index(G).get_node_tree('kdtree') is tree
+    assert ox.get_nearest_edge_points(G, [40], [40])[0].tolist() == [[u2, v2, key2]]
+
+
+def test_k_nearest_and_radius_queries():
+    import numpy as np
+    from shapely.geometry import Point
+
+    # batched k nearest and radius queries agree with the distances to every
+    # node and edge, nearest first
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    X, Y = np.array([-122.3030, -122.2980, -122.2955]), np.array([37.8050, 37.8075, 37.8100])
+    nodes, edges = ox.graph_to_gdfs(G, fill_edge_geometry=True)
+    for i, (x, y) in enumerate(zip(X, Y)):
+        node_distances = np.hypot(nodes['x'] - x, nodes['y'] - y).sort_values()
+        edge_distances = edges['geometry'].distance(Point(x, y)).sort_values()
+
+        nn, dist = ox.get_k_nearest_nodes(G, X, Y, k=4)
+        assert nn.shape == dist.shape == (3, 4)
+        assert list(nn[i]) == list(node_distances.index[:4])
+        assert np.allclose(dist[i], node_distances[:4])
+        point, nn, dist = ox.get_nodes_in_radius(G, X, Y, radius=0.0008)
+        assert list(nn[point == i]) == list(node_distances.index[node_distances <= 0.0008])
+
+        ne, dist = ox.get_k_nearest_edges(G, X, Y, k=6)
+        assert ne.shape == (3, 6, 3)
+        assert np.allclose(dist[i], edge_distances[:6], rtol=0, atol=1e-12)
+        point, ne, dist = ox.get_edges_in_radius(G, X, Y, radius=0.0005)
+        assert np.allclose(dist[point == i], edge_distances[edge_distances <= 0.0005], rtol=0, atol=1e-12)
+
+    # haversine and approximate edge searches, in meters for ball trees
+    nn, dist = ox.get_k_nearest_nodes(G, X, Y, k=2, method='balltree')
+    assert list(nn[:, 0]) == list(ox.get_nearest_nodes(G, X, Y))
+    assert np.allclose(dist[:, 0], [ox.get_nearest_node(G, (y, x), return_dist=True)[1] for x, y in zip(X, Y)])
+    point, ne, dist = ox.get_edges_in_radius(G, X, Y, radius=50, method='balltree')
+    assert len(ne) > 0 and (dist <= 50).all()
+
+
+def test_project_graph():
+    import numpy as np
+    from pyproj import Transformer
+
+    # nodes and edge geometries are projected to the same utm zone, keeping the
+    # original coordinates as lon/lat, and projecting back recovers them
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    G_proj = ox.project_graph(G)
+    assert ox.is_crs_utm(G_proj.graph['crs'])
+    assert list(G_proj.edges(keys=True)) == list(G.edges(keys=True))
+    transformer = Transformer.from_crs(G.graph['crs'], G_proj.graph['crs'], always_xy=True)
+    for node, data in G_proj.nodes(data=True):
+        assert (data['lon'], data['lat']) == (G.nodes[node]['x'], G.nodes[node]['y'])
+        assert np.allclose((data['x'], data['y']), transformer.transform(data['lon'], data['lat']))
+    for u, v, key, data in G_proj.edges(keys=True, data=True):
+        if 'geometry' in data:
+            x, y = G.edges[u, v, key]['geometry'].xy
+            assert np.allclose(data['geometry'].xy, transformer.transform(x, y))
+            assert np.allclose(data['geometry'].coords[0], (G_proj.nodes[u]['x'], G_proj.nodes[u]['y']))
+
+    # already projected graphs are left as they are
+    assert ox.project_graph(G_proj).graph['crs'] == G_proj.graph['crs']
+    G_latlong = ox.project_graph(G_proj, to_crs=ox.settings.default_crs)
+    assert np.allclose([data['x'] for _, data in G_latlong.nodes(data=True)], [data['x'] for _, data in G.nodes(data=True)])
+
+    # crs and transformer objects are built once per (source, target) pair and
+    # reused by every projection function
+    ox.clear_projection_cache()
+    transformer = ox.get_transformer(ox.settings.default_crs, G_proj.graph['crs'])
+    assert ox.get_transformer(ox.settings.default_crs, G_proj.graph['crs']) is transformer
+    assert ox.get_crs({'init': 'epsg:3395'}) is ox.get_crs({'init': 'epsg:3395'})
+    polygon, crs = ox.project_geometry(ox.graph_to_gdfs(G, edges=False).unary_union.convex_hull)
+    assert crs.is_exact_same(G_proj.graph['crs'])
+    assert polygon.contains(ox.graph_to_gdfs(G_proj, edges=False).unary_union)
+    polygon_latlong, _ = ox.project_geometry(polygon, crs=crs, to_latlong=True)
+    assert polygon_latlong.buffer(1e-9).contains(ox.graph_to_gdfs(G, edges=False).unary_union)
+    assert ox.project_gdf(ox.graph_to_gdfs(G, edges=False)).crs.is_exact_same(crs)
+    assert ox.get_transformer(crs, ox.settings.default_crs) is ox.get_transformer(crs, ox.settings.default_crs)
+
+
+def test_projected_coordinates():
+    import numpy as np
+
+    # an unprojected graph's projected coordinates are computed once, on first
+    # use, and agree with a projected copy of the graph
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    G_proj = ox.project_graph(G)
+    nodes, x, y, crs = ox.get_projected_nodes(G)
+    assert crs.is_exact_same(G_proj.graph['crs']) and list(nodes) == list(G_proj.nodes())
+    assert np.allclose(x, [data['x'] for _, data in G_proj.nodes(data=True)])
+    assert np.allclose(y, [data['y'] for _, data in G_proj.nodes(data=True)])
+    assert ox.get_projected_nodes(G)[1] is x
+    edge_uv, edge_keys, geometries, _ = ox.get_projected_edges(G)
+    edges = ox.graph_to_gdfs(G_proj, nodes=False, fill_edge_geometry=True)
+    assert all(geometry.equals_exact(expected, 1e-6) for geometry, expected in zip(geometries, edges['geometry']))
+    assert 'lon' not in G.nodes[nodes[0]]
+
+    # so measurements in meters need no projected copy
+    expected = ox.basic_stats(G_proj, clean_intersects=True, circuity_dist='euclidean')
+    stats = ox.basic_stats(G, clean_intersects=True, projected=True)
+    assert stats['clean_intersection_count'] == expected['clean_intersection_count']
+    assert np.isclose(stats['circuity_avg'], expected['circuity_avg'])
+
+    # and are recomputed once the graph changes
+    G.remove_node(nodes[0])
+    assert len(ox.get_projected_nodes(G)[1]) == len(x) - 1
+    x_3395 = ox.get_projected_nodes(G, to_crs={'init': 'epsg:3395'})[1]
+    assert not np.allclose(x_3395, ox.get_projected_nodes(G)[1])
+
+    # and when nodes move or edges or their geometries change in place, once
+    # the spatial index is invalidated
+    from shapely.geometry import LineString
+    nodes, x, y, _ = ox.get_projected_nodes(G)
+    stats = ox.basic_stats(G, projected=True)
+    intersections = ox.clean_intersections(G, dead_ends=True, projected=True)
+    G.nodes[nodes[1]]['x'] += 0.001
+    ox.invalidate_spatial_index(G)
+    assert ox.get_projected_nodes(G)[1][1] > x[1] + 50 and np.array_equal(ox.get_projected_nodes(G)[1][2:], x[2:])
+    assert ox.basic_stats(G, projected=True)['circuity_avg'] != stats['circuity_avg']
+    assert not ox.clean_intersections(G, dead_ends=True, projected=True).equals(intersections)
+    edge_uv, edge_keys, geometries, _ = ox.get_projected_edges(G)
+    (u, v), key = edge_uv[0].tolist(), edge_keys[0]
+    G.edges[u, v, key]['geometry'] = LineString([(G.nodes[u]['x'], G.nodes[u]['y']), (-122.3, 37.81),
+                                                 (G.nodes[v]['x'], G.nodes[v]['y'])])
+    G.add_edge(u, v, length=1)
+    ox.invalidate_spatial_index(G)
+    edge_uv, edge_keys, projected_geometries, _ = ox.get_projected_edges(G)
+    assert len(projected_geometries[0].coords) == 3 and len(projected_geometries) == len(geometries) + 1
+    assert (u, v, key + 1) in zip(edge_uv[:, 0].tolist(), edge_uv[:, 1].tolist(), edge_keys.tolist())
+
 def test_network_saving_loading():
     # save/load graph as shapefile and graphml file
     G = ox.graph_from_place('Piedmont, California, USA')
@@ -166,6 +684,91 @@ def test_network_saving_loading():
     ne3 = ox.get_nearest_edges(G, X, Y, method='kdtree', dist=50)
 
 
+def test_graph_binary():
+    import tempfile
+    import numpy as np
+    import pytest
+
+    # graphs saved as binary arrays load back with every attribute in the type
+    # it was saved in, including lists, geometries, the crs and dict graph
+    # attributes, without parsing strings
+    G = ox.project_graph(ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True))
+    G.graph['streets_per_node'] = ox.count_streets_per_node(G)
+    nodes = list(G.nodes())
+    G.nodes[nodes[0]]['mixed'] = 1.5
+    G.nodes[nodes[1]]['mixed'] = 'a'
+    G.nodes[nodes[0]]['numpy'] = np.int64(5)
+    G.nodes[nodes[1]]['numpy'] = 'n/a'
+    G.nodes[nodes[0]]['tuple'] = (1, 'b', (2.5, None))
+    G.nodes[nodes[1]]['tuple'] = [(1, 2), {3: (4,)}]
+    G.add_edge(nodes[0], 'a node', key='a key', tags={'a': [1, 2]})
+    G.nodes['a node'].update(x=1.0, y=2.0)
+    assert any(isinstance(osmid, list) for _, _, osmid in G.edges(data='osmid'))
+
+    folder = tempfile.mkdtemp()
+    for compress in [False, True]:
+        ox.save_graph_binary(G, folder=folder, compress=compress)
+        G2 = ox.load_graph_binary(folder=folder)
+        assert list(G2.nodes(data=True)) == list(G.nodes(data=True))
+        assert list(G2.edges(keys=True)) == list(G.edges(keys=True))
+        for (_, _, data), (_, _, data2) in zip(G.edges(data=True), G2.edges(data=True)):
+            assert set(data2) == set(data)
+            for name, value in data.items():
+                if name == 'geometry':
+                    assert data2[name].wkb == value.wkb
+                else:
+                    assert data2[name] == value and type(data2[name]) == type(value)
+        assert G2.graph == G.graph
+        assert type(G2.graph['crs']) == type(G.graph['crs'])
+        assert G2.nodes[nodes[0]]['numpy'] == 5 and type(G2.nodes[nodes[0]]['numpy']) == int
+        assert type(G2.nodes[nodes[0]]['tuple'][2]) == tuple and type(G2.nodes[nodes[1]]['tuple'][1][3]) == tuple
+
+    # values json cannot represent are not silently saved as strings
+    G.nodes[nodes[0]]['numpy'] = {1, 2}
+    with pytest.raises(ValueError):
+        ox.save_graph_binary(G, folder=folder)
+    shutil.rmtree(folder)
+
+def test_graph_mapped():
+    import pickle, tempfile
+    import networkx as nx
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+
+    # a mapped graph reads its nodes, edges and attributes from read-only
+    # memory-mapped arrays, and answers like the graph it was saved from
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', retain_all=True)
+    folder = tempfile.mkdtemp()
+    ox.save_graph_mapped(G, folder=folder)
+    G_mapped = ox.load_graph_mapped(folder=folder)
+    assert isinstance(G_mapped.edge_v.base, np.memmap) and not G_mapped.edge_v.flags.writeable
+    assert len(G_mapped) == len(G) and G_mapped.number_of_edges() == G.number_of_edges()
+    assert list(G_mapped.nodes(data=True)) == list(G.nodes(data=True))
+    assert list(G_mapped.edges(keys=True, data=True)) == list(G.edges(keys=True, data=True))
+    assert G_mapped.graph == G.graph
+    for node in list(G.nodes())[:100]:
+        assert G_mapped.nodes[node] == G.nodes[node]
+        assert list(G_mapped.neighbors(node)) == list(G.neighbors(node))
+        assert G_mapped[node] == G[node]
+    assert 0 not in G_mapped and not G_mapped.has_edge(0, 1)
+
+    # so routing results, plots and nearest node searches work on it
+    nodes = list(G.nodes())
+    route = nx.shortest_path(G, nodes[0], nodes[50], weight='length')
+    lengths = ox.get_route_edge_attributes(G, route, 'length')
+    assert ox.get_route_edge_attributes(G_mapped, route, 'length') == lengths
+    X, Y = [-122.3030, -122.2980, -122.2955], [37.8050, 37.8075, 37.8100]
+    assert list(ox.get_nearest_nodes(G_mapped, X, Y)) == list(ox.get_nearest_nodes(G, X, Y))
+    assert ox.get_nearest_node(G_mapped, (Y[0], X[0])) == ox.get_nearest_node(G, (Y[0], X[0]))
+    fig, ax = ox.plot_graph(G_mapped, show=False, save=False, close=True)
+
+    # worker processes map the same files rather than receiving a copy
+    assert len(pickle.dumps(G_mapped)) < 1000
+    with ProcessPoolExecutor(1) as pool:
+        assert pool.submit(ox.get_route_edge_attributes, G_mapped, route, 'length').result() == lengths
+    del G_mapped
+    shutil.rmtree(folder)
+
 def test_get_network_methods():
     from shapely import wkt
 
@@ -455,6 +1058,78 @@ def test_ordered_nodes_from_way():
     assert ordered_nodes == [2, 3, 10, 5, 8]
 
 
+def test_create_graph_arrays():
+    import networkx as nx
+
+    # the bulk array-backed graph matches one built node by node and path by
+    # path, including reversed one-way and roundabout ways and duplicates
+    response_json = ox.overpass_json_from_file('tests/input_data/West-Oakland.osm.bz2')
+    ways = [element for element in response_json['elements'] if element['type'] == 'way']
+    ways[0]['tags']['oneway'] = '-1'
+    ways[1]['tags']['junction'] = 'roundabout'
+    ways[2]['nodes'] = ways[2]['nodes'][:1] + ways[2]['nodes']
+    response_jsons = [response_json, {'elements': response_json['elements'][:50]}]
+
+    for bidirectional in [False, True]:
+        G = ox.create_graph(response_jsons, retain_all=True, bidirectional=bidirectional)
+
+        nodes, paths = ox.parse_osm_nodes_paths(response_json)
+        G_expected = nx.MultiDiGraph(name='unnamed', crs=ox.settings.default_crs)
+        for node, data in nodes.items():
+            G_expected.add_node(node, **data)
+        G_expected = ox.add_edge_lengths(ox.add_paths(G_expected, paths, bidirectional=bidirectional))
+
+        assert list(G.nodes(data=True)) == list(G_expected.nodes(data=True))
+        assert list(G.edges(keys=True, data=True)) == list(G_expected.edges(keys=True, data=True))
+
+
+def test_simplify_long_chain():
+    import networkx as nx
+    import sys
+
+    # a two-way street with far more interstitial nodes than the recursion
+    # limit, plus a ring of interstitial nodes hanging off its end, simplifies
+    # into single edges
+    n = sys.getrecursionlimit() * 3
+    G = nx.MultiDiGraph(name='chain', crs=ox.settings.default_crs)
+    for i in range(n):
+        G.add_node(i, x=i * 0.0001, y=0, osmid=i)
+    for i in range(n - 1):
+        G.add_edge(i, i + 1, osmid=1, length=10)
+        G.add_edge(i + 1, i, osmid=1, length=10)
+    ring = list(range(n, n + 5)) + [n - 1]
+    for i, node in enumerate(ring[:-1]):
+        G.add_node(node, x=i * 0.0001, y=0.001, osmid=node)
+    for u, v in zip([n - 1] + ring[:-1], ring):
+        G.add_edge(u, v, osmid=2, length=10)
+
+    G_simple = ox.simplify_graph(G)
+    assert set(G_simple.nodes()) == {0, n - 1}
+    assert sorted(G_simple.edges()) == [(0, n - 1), (n - 1, 0), (n - 1, n - 1)]
+    assert G_simple.edges[0, n - 1, 0]['length'] == 10 * (n - 1)
+    assert len(G_simple.edges[0, n - 1, 0]['geometry'].coords) == n
+    assert len(G_simple.edges[n - 1, n - 1, 0]['geometry'].coords) == 7
+
+
+def test_simplify_graph_by_tiles():
+
+    # simplifying tile by tile in worker processes, with chains crossing tile
+    # boundaries stitched together afterwards, gives the same graph as
+    # simplifying it serially
+    G = ox.graph_from_file('tests/input_data/West-Oakland.osm.bz2', simplify=False, retain_all=True)
+    for strict in [True, False]:
+        G_serial = ox.simplify_graph(G, strict=strict)
+        for tiles in [4, 25]:
+            G_tiled = ox.simplify_graph(G, strict=strict, tiles=tiles, max_workers=2)
+            assert G_tiled.graph == G_serial.graph
+            assert list(G_tiled.nodes(data=True)) == list(G_serial.nodes(data=True))
+            assert list(G_tiled.edges(keys=True)) == list(G_serial.edges(keys=True))
+            for (_, _, data_tiled), (_, _, data_serial) in zip(G_tiled.edges(data=True), G_serial.edges(data=True)):
+                assert data_tiled == data_serial
+                if 'geometry' in data_serial:
+                    assert data_tiled['geometry'].equals_exact(data_serial['geometry'], 0)
+
+
 def test_overpass():
     import pytest
 
@@ -466,3 +1141,214 @@ def test_overpass():
         G = ox.graph_from_place('Piedmont, California, USA')
 
     ox.config(overpass_endpoint="http://overpass-api.de/api")
+
+
+def test_overpass_concurrent_requests():
+    import random
+    import time
+    from urllib.parse import parse_qs
+
+    # a local stub overpass server: reports 3 free slots and answers each query
+    # after a random delay, echoing the query back so we can check the order
+    def post(handler, data):
+        query = parse_qs(data.decode('utf-8'))['data'][0]
+        time.sleep(random.uniform(0, 0.05))
+        return 200, {'elements': [], 'query': query}
+
+    with stub_server(get=lambda handler: stub_overpass_status(3), post=post) as endpoint:
+        configure_temp(use_cache=False, overpass_endpoint=endpoint, overpass_max_workers=4)
+
+        # subdivide the bbox into many sub-queries and check that the responses
+        # come back in the same order the queries were built
+        north, south, east, west = 37.79, 37.74, -122.41, -122.46
+        responses = ox.osm_net_download(north=north, south=south, east=east, west=west,
+                                        max_query_area_size=1000*1000)
+        assert len(responses) > 4
+        datas = [{'data': response['query']} for response in responses]
+        assert [r['query'] for r in ox.overpass_requests(datas, max_workers=1)] == [d['data'] for d in datas]
+        assert [r['query'] for r in ox.overpass_requests(datas, max_workers=4)] == [d['data'] for d in datas]
+        assert ox.get_available_slots() == 3
+
+
+def test_http_session():
+    import pytest
+    import requests
+    import time
+
+    # a local stub server that keeps connections alive, records which client
+    # connection each request arrived on, and fails the first post with a 503
+    connections = []
+    posts = []
+
+    def get(handler):
+        connections.append(handler.client_address)
+        assert 'gzip' in handler.headers['Accept-Encoding']
+        return 200, [{'lat': '36.1', 'lon': '-79.3'}]
+
+    def post(handler, data):
+        connections.append(handler.client_address)
+        posts.append(handler.path)
+        if b'slow' in data:
+            # the client has given up by the time this query would finish
+            time.sleep(0.5)
+            return None
+        return 503 if len(posts) == 1 else 200, {'elements': []}
+
+    with stub_server(get=get, post=post, keep_alive=True) as endpoint:
+        configure_temp(use_cache=False, nominatim_endpoint=endpoint, overpass_endpoint=endpoint,
+                       http_backoff_factor=0)
+
+        # every request reuses the one pooled connection, and the 503 is retried
+        for query in ['Mebane, NC', 'Durham, NC', 'Raleigh, NC']:
+            assert ox.nominatim_request({'q': query, 'format': 'json'}, pause_duration=0)[0]['lat'] == '36.1'
+        assert ox.overpass_request({'data': '[out:json];node(1);out;'}, pause_duration=0) == {'elements': []}
+        assert len(posts) == 2
+        assert len(connections) == 5 and len(set(connections)) == 1
+
+        # but a query that times out reading the response is not sent again
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            ox.overpass_request({'data': 'slow'}, pause_duration=0, timeout=0.2)
+        assert len(posts) == 3
+
+        # changing the http settings replaces the session
+        session = ox.get_session()
+        assert ox.get_session() is session
+        configure_temp(use_cache=False, http_pool_size=2)
+        assert ox.get_session() is not session
+
+
+def test_overpass_streaming():
+    import tracemalloc
+
+    # a local stub overpass server that answers every query with the west
+    # oakland data, as overpass-style json
+    elements = []
+    for element in ox.overpass_json_from_file('tests/input_data/West-Oakland.osm.bz2')['elements']:
+        if element['type'] == 'node':
+            elements.append({'type': 'node', 'id': element['id'], 'lat': element['lat'],
+                             'lon': element['lon'], 'tags': element['tags']})
+        elif element['type'] == 'way':
+            elements.append({'type': 'way', 'id': element['id'], 'nodes': element['nodes'],
+                             'tags': element['tags']})
+    body = json.dumps({'version': 0.6, 'elements': elements * 20, 'remark': 'stub'}, indent=1).encode('utf-8')
+
+    def build_graph(stream):
+        tracemalloc.start()
+        response_jsons = ox.osm_net_download(north=37.81, south=37.80, east=-122.28, west=-122.29, stream=stream)
+        G = ox.create_graph(response_jsons, retain_all=True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return G, peak
+
+    with stub_server(get=lambda handler: stub_overpass_status(1), post=lambda handler, data: (200, body)) as endpoint:
+        configure_temp(use_cache=False, overpass_endpoint=endpoint)
+
+        # streaming builds the same graph without the whole response in memory
+        G, peak = build_graph(stream=False)
+        G_streamed, peak_streamed = build_graph(stream=True)
+        assert list(G_streamed.nodes(data=True)) == list(G.nodes(data=True))
+        assert list(G_streamed.edges(keys=True, data=True)) == list(G.edges(keys=True, data=True))
+        assert peak_streamed < peak
+
+        # and streams responses back out of the cache
+        configure_temp(cache_folder='.temp/cache_stream', overpass_endpoint=endpoint)
+        for _ in range(2):
+            G_streamed, _ = build_graph(stream=True)
+            assert list(G_streamed.edges(keys=True, data=True)) == list(G.edges(keys=True, data=True))
+        assert ox.cache_stats()['hits'] == 1
+
+
+def test_cache_backends():
+    import pytest
+    import sqlite3
+    import time
+
+    # save and retrieve responses through each configured cache backend
+    for backend in ['file', 'sqlite']:
+        ox.config(log_console=True, log_file=True, use_cache=True,
+                  data_folder='.temp/data', logs_folder='.temp/logs',
+                  imgs_folder='.temp/imgs', cache_folder='.temp/cache_{}'.format(backend),
+                  cache_backend=backend)
+        response_json = {'elements': [{'type': 'node', 'id': 1, 'lat': 1.5, 'lon': 2.5}]}
+        ox.save_to_cache('http://localhost/a', response_json)
+        assert ox.get_from_cache('http://localhost/a') == response_json
+        assert ox.get_from_cache('http://localhost/b') is None
+        stats = ox.cache_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+
+    # changing the cache settings closes the previous backend
+    cache = ox.get_cache()
+    configure_temp(cache_folder='.temp/cache_file', cache_backend='file')
+    assert ox.get_cache() is not cache
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache._connection.execute('SELECT 1')
+
+    # least recently used responses get evicted beyond a budget of 2.5 responses,
+    # and responses older than the ttl are misses
+    def entry_size(cache, key):
+        if isinstance(cache, ox.FileCache):
+            return os.path.getsize(cache.get_filepath(key))
+        return cache._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()[0]
+
+    for backend in [ox.FileCache, ox.SQLiteCache]:
+        cache = backend('.temp/cache_evict_{}'.format(backend.__name__))
+        cache.set('first', {'elements': [0] * 1000})
+        cache.max_bytes = int(2.5 * entry_size(cache, 'first'))
+        for key in ['a', 'b']:
+            cache.set(key, {'elements': [0] * 1000})
+            time.sleep(0.01)
+        cache.get('a')
+        time.sleep(0.01)
+        cache.set('c', {'elements': [0] * 1000})
+        assert cache.get('a') is not None and cache.get('c') is not None
+        assert cache.get('b') is None and cache.get('first') is None
+        assert cache.stats()['evictions'] == 2
+
+        cache.ttl = 0.05
+        time.sleep(0.1)
+        assert cache.get('a') is None
+        assert cache.stats()['evictions'] == 3
+
+        # the ttl counts from when a response was saved, however often it is read
+        cache.ttl = 0.3
+        cache.set('d', {'elements': [0] * 1000})
+        for _ in range(3):
+            assert cache.get('d') is not None
+            time.sleep(0.12)
+        assert cache.get('d') is None
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_cache_payloads():
+    import json
+    import zlib
+
+    # overpass responses round-trip through the columnar encoding, keeping the
+    # order of elements that can't be stored column-wise
+    response_json = {'version': 0.6, 'osm3s': {'copyright': 'OpenStreetMap'},
+                     'elements': [{'type': 'node', 'id': 1, 'lat': 35.1, 'lon': -79.2},
+                                  {'type': 'node', 'id': 2, 'lat': 35.2, 'lon': -79.3, 'tags': {'highway': 'stop'}},
+                                  {'type': 'relation', 'id': 3, 'members': []},
+                                  {'type': 'node', 'id': 4, 'lat': 35, 'lon': -79.1},
+                                  {'type': 'way', 'id': 5, 'nodes': [1, 2, 4], 'tags': {'highway': 'residential', 'name': 'Main Street'}},
+                                  {'type': 'way', 'id': 6, 'nodes': [4, 1]}]}
+    payload = ox.encode_response(response_json)
+    assert payload.startswith(ox.COLUMNAR_MAGIC)
+    assert ox.decode_response(payload) == response_json
+
+    # other responses, and legacy zlib-compressed json, are json
+    nominatim_json = [{'osm_type': 'relation', 'display_name': 'Mebane'}]
+    assert ox.decode_response(ox.encode_response(nominatim_json)) == nominatim_json
+    assert ox.decode_response(zlib.compress(json.dumps(nominatim_json).encode('utf-8'))) == nominatim_json
+
+    # the file backend still reads legacy json cache files
+    cache = ox.FileCache('.temp/cache_legacy')
+    if not os.path.exists(cache.folder):
+        os.makedirs(cache.folder)
+    with open(cache.get_filepath('legacy', 'json'), 'w') as cache_file:
+        json.dump(response_json, cache_file)
+    assert cache.get('legacy') == response_json
+